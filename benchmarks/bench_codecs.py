@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""Compares encode and decode throughput of the available sostore codecs
+
+Usage:
+    python -m benchmarks.bench_codecs [--count N]
+"""
+import argparse
+import time
+
+from sostore import available_codecs, get_codec
+
+def sample_document(n):
+    """Returns a representative, moderately repetitive dictionary"""
+    
+    return {'name': 'Person {0}'.format(n),
+            'email': 'person{0}@example.com'.format(n),
+            'age': n % 90,
+            'active': n % 2 == 0,
+            'score': n * 0.5,
+            'tags': ['customer', 'newsletter', 'region-{0}'.format(n % 12)],
+            'address': {'street': '{0} Main Street'.format(n), 'city': 'Springfield', 'postal': '{0:05d}'.format(n % 99999)}}
+
+def measure(codec, documents):
+    """Returns the encode and decode throughput, in documents per second, and the mean encoded size"""
+    
+    start = time.perf_counter()
+    encoded = [codec.encode(d) for d in documents]
+    encode_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for data in encoded:
+        codec.decode(data)
+    decode_time = time.perf_counter() - start
+    
+    size = sum(len(data) for data in encoded) / float(len(encoded))
+    return len(documents) / encode_time, len(documents) / decode_time, size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000, help='number of documents to encode and decode')
+    args = parser.parse_args()
+    
+    documents = [sample_document(n) for n in range(args.count)]
+    
+    print("{0:<10} {1:>14} {2:>14} {3:>10}".format('codec', 'encode/s', 'decode/s', 'bytes'))
+    for name in available_codecs():
+        encode_rate, decode_rate, size = measure(get_codec(name), documents)
+        print("{0:<10} {1:>14,.0f} {2:>14,.0f} {3:>10.1f}".format(name, encode_rate, decode_rate, size))
+
+if __name__ == '__main__':
+    main()
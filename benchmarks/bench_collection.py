@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""Measures the throughput and latency of Collection operations at several scales
+
+Each combination of storage and collection size is run in a fresh Python
+process, so that the reported peak memory belongs to that combination alone.
+
+Usage:
+    python -m benchmarks.bench_collection [--sizes 1000,100000,1000000]
+        [--storage memory,disk] [--operations insert,get,...]
+        [--profiles default,durable,throughput]
+        [--output results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+The process exits with status 1 if any operation is slower than the
+baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from sostore import Collection
+from benchmarks.bench_codecs import sample_document
+
+OPERATIONS = ('insert', 'insert_randomized', 'get', 'get_many', 'update', 'remove',
+              'all', 'find_field', 'random_entries')
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+DEFAULT_STORAGE = ('memory', 'disk')
+
+# "default" opens connections with SQLite's own settings
+DEFAULT_PROFILE = 'default'
+
+# Each operation is timed for at most this many calls, or this many
+# seconds, whichever comes first, and always at least once
+CALLS = 1000
+BUDGET = 2.0
+
+GET_MANY_SIZE = 100
+RANDOM_ENTRIES_SIZE = 10
+
+def peak_rss():
+    """Returns the peak resident memory of this process in kilobytes, or None if unknown"""
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # macOS reports bytes rather than kilobytes
+        peak = peak // 1024
+    return peak
+
+def percentile(ordered, fraction):
+    """Returns a percentile of a sorted list by the nearest-rank method"""
+
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def measure(call, arguments):
+    """Times call(argument) for successive arguments until CALLS or BUDGET is reached
+
+    Returns:
+        A dictionary of the calls made, operations per second, and the
+        50th and 99th percentile latencies in milliseconds
+    """
+
+    latencies = []
+    started = time.perf_counter()
+    for argument in arguments:
+        start = time.perf_counter()
+        call(argument)
+        end = time.perf_counter()
+        latencies.append(end - start)
+        if len(latencies) >= CALLS or end - started >= BUDGET:
+            break
+
+    latencies.sort()
+    return {'calls': len(latencies),
+            'ops_per_sec': len(latencies) / sum(latencies),
+            'p50_ms': percentile(latencies, 0.50) * 1000.0,
+            'p99_ms': percentile(latencies, 0.99) * 1000.0}
+
+def populate(db, size):
+    """Fills a Collection with size documents, returning their ids"""
+
+    return db.insert_many(sample_document(n) for n in range(size))
+
+def run_operation(operation, db_path, size, profile=None):
+    """Measures one operation against a freshly populated collection"""
+
+    rng = random.Random(size)
+    db = Collection("benchmark", db=db_path, randomized=(operation == 'insert_randomized'), profile=profile)
+    ids = populate(db, size)
+
+    if operation in ('insert', 'insert_randomized'):
+        result = measure(db.insert, (sample_document(size + n) for n in range(CALLS)))
+    elif operation == 'get':
+        result = measure(db.get, (rng.choice(ids) for n in range(CALLS)))
+    elif operation == 'get_many':
+        result = measure(db.get_many, ([rng.choice(ids) for i in range(GET_MANY_SIZE)] for n in range(CALLS)))
+    elif operation == 'update':
+        documents = db.get_many(rng.sample(ids, min(CALLS, size)))
+        for d in documents:
+            d['score'] = -1
+        result = measure(db.update, documents)
+    elif operation == 'remove':
+        result = measure(db.remove, rng.sample(ids, min(CALLS, size)))
+    elif operation == 'all':
+        result = measure(lambda argument: db.all(), range(CALLS))
+    elif operation == 'find_field':
+        result = measure(lambda n: db.find_field('email', 'person{0}@example.com'.format(n)),
+                         (rng.randrange(size) for n in range(CALLS)))
+    elif operation == 'random_entries':
+        result = measure(db.random_entries, (RANDOM_ENTRIES_SIZE for n in range(CALLS)))
+    else:
+        raise ValueError("Unknown operation '{0}'".format(operation))
+
+    db.done()
+    return result
+
+def run_case(storage, size, operation, profile=DEFAULT_PROFILE):
+    """Measures one operation, storage, size, and connection profile in this process"""
+
+    directory = None
+    db_path = ":memory:"
+    if storage == 'disk':
+        directory = tempfile.mkdtemp(prefix='sostore-bench-')
+        db_path = os.path.join(directory, 'benchmark.db')
+    try:
+        result = run_operation(operation, db_path, size, None if profile == DEFAULT_PROFILE else profile)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    result.update({'storage': storage, 'size': size, 'operation': operation, 'profile': profile, 'peak_rss_kb': peak_rss()})
+    return result
+
+def run_isolated(storage, size, operation, profile=DEFAULT_PROFILE):
+    """Measures one operation, storage, size, and connection profile in a new Python process"""
+
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_collection',
+                                      '--case', '{0}:{1}:{2}:{3}'.format(storage, size, operation, profile)])
+    return json.loads(output.decode('utf-8'))
+
+def compare(results, baseline, tolerance):
+    """Returns a description of each result slower than the baseline by more than tolerance"""
+
+    def key(r):
+        return (r['storage'], r['size'], r['operation'], r.get('profile', DEFAULT_PROFILE))
+
+    previous = dict((key(r), r) for r in baseline['results'])
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        ratio = result['ops_per_sec'] / old['ops_per_sec']
+        result['baseline_ratio'] = ratio
+        if ratio < 1.0 - tolerance:
+            regressions.append("{0} on {1} ({2}) at {3}: {4:,.0f} ops/s, baseline {5:,.0f} ({6:.0%})".format(
+                result['operation'], result['storage'], result['profile'], result['size'], result['ops_per_sec'], old['ops_per_sec'], ratio))
+    return regressions
+
+def environment():
+    """Describes the system the benchmarks ran on"""
+
+    return {'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='comma-separated collection sizes')
+    parser.add_argument('--storage', default=','.join(DEFAULT_STORAGE), help='comma-separated storage: memory, disk')
+    parser.add_argument('--operations', default=','.join(OPERATIONS), help='comma-separated operations to measure')
+    parser.add_argument('--profiles', default=DEFAULT_PROFILE,
+                        help='comma-separated connection profiles: default, durable, throughput')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fractional slowdown from the baseline reported as a regression')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        storage, size, operation, profile = args.case.split(':')
+        print(json.dumps(run_case(storage, int(size), operation, profile)))
+        return 0
+
+    operations = args.operations.split(',')
+    for operation in operations:
+        if operation not in OPERATIONS:
+            parser.error("unknown operation '{0}'".format(operation))
+
+    results = []
+    print("{0:<8} {1:<10} {2:>9} {3:<18} {4:>12} {5:>10} {6:>10} {7:>10}".format('storage', 'profile', 'size', 'operation',
+                                                                             'ops/s', 'p50 ms', 'p99 ms', 'peak MB'))
+    for storage in args.storage.split(','):
+        for profile in args.profiles.split(','):
+            for size in [int(size) for size in args.sizes.split(',')]:
+                for operation in operations:
+                    result = run_isolated(storage, size, operation, profile)
+                    results.append(result)
+                    rss = result['peak_rss_kb'] / 1024.0 if result['peak_rss_kb'] is not None else float('nan')
+                    print("{0:<8} {1:<10} {2:>9} {3:<18} {4:>12,.0f} {5:>10.3f} {6:>10.3f} {7:>10.1f}".format(
+                        storage, profile, size, operation, result['ops_per_sec'], result['p50_ms'], result['p99_ms'], rss))
+                    sys.stdout.flush()
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+    for regression in regressions:
+        print("REGRESSION: " + regression)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
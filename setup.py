@@ -30,6 +30,7 @@ setup(name='sostore',
       url='https://github.com/ArmstrongJ/sostore',
       packages=['sostore',],
       test_suite='tests.suite',
+      python_requires='>=3.7',
       
       license='GPL3',
       classifiers=[
@@ -38,8 +39,6 @@ setup(name='sostore',
           'Intended Audience :: Developers',
           'License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)',
           'Operating System :: OS Independent',
-          'Programming Language :: Python :: 2.6',
-          'Programming Language :: Python :: 2.7',
           'Programming Language :: Python :: 3',
       ],
       
@@ -1,3 +1,8 @@
-from sostore.collection import Collection, ID_KEY
+from sostore.collection import Collection, ID_KEY, ASCENDING, DESCENDING
+from sostore.database import Database
+from sostore.asynchronous import AsyncCollection
+from sostore.transaction import transaction
+from sostore.pool import ConnectionPool
+from sostore.codec import Codec, register_codec, get_codec, available_codecs
 
-from sostore.errors import CollectionException, RandomIdException, ConnectionException
+from sostore.errors import CollectionException, RandomIdException, ConnectionException, CodecException, ChangesTruncatedException
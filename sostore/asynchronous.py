@@ -0,0 +1,291 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from sostore.collection import Collection, FETCH_BATCH_SIZE, INSERT_BATCH_SIZE, WATCH_INTERVAL
+from sostore.database import BACKUP_PAGES
+
+# The most queued writes committed together in one transaction
+WRITE_BATCH_LIMIT = 1000
+
+class AsyncCollection():
+    """An asyncio interface to a Collection
+    
+    The Collection and its connection live on a dedicated worker thread, so
+    SQLite and decoding work never blocks the event loop.  Writes issued 
+    concurrently by several coroutines are committed together in a single
+    transaction, each within its own savepoint so that one failing write 
+    does not affect the others.
+    """
+    
+    def __init__(self, collection, *args, **kwargs):
+        """Initializes access to a collection
+        
+        Accepts the same arguments as Collection, except that an existing
+        connection cannot be specified, as it would belong to another 
+        thread.  The collection is opened on the worker thread before the
+        constructor returns.
+        """
+        
+        if kwargs.get('connection') is not None:
+            raise ValueError('An AsyncCollection must open its own connection')
+            
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._collection = self._executor.submit(Collection, collection, *args, **kwargs).result()
+        self.collection = collection
+        self._pending = []
+        self._flushing = False
+        
+    @property
+    def randomized(self):
+        return self._collection.randomized
+        
+    def _run(self, function, *args, **kwargs):
+        """Private execution of a Collection method on the worker thread"""
+        
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, lambda: function(*args, **kwargs))
+        
+    async def count(self):
+        """Returns the number of items in the collection"""
+        return await self._run(lambda: self._collection.count)
+        
+    async def done(self):
+        """Closes the connection to the collection and stops the worker thread"""
+        
+        await self._flush()
+        await self._run(self._collection.done)
+        self._executor.shutdown(wait=True)
+        
+    async def get(self, id):
+        """See Collection.get"""
+        return await self._run(self._collection.get, id)
+        
+    async def get_many(self, ids, fields=None):
+        """See Collection.get_many"""
+        return await self._run(self._collection.get_many, ids, fields)
+        
+    async def all(self, fields=None, sort=None):
+        """See Collection.all"""
+        return await self._run(self._collection.all, fields, sort)
+        
+    async def iter_all(self, fields=None, batch_size=FETCH_BATCH_SIZE, limit=None, skip=0, sort=None):
+        """Asynchronously iterates over the dictionaries in the collection
+        
+        See Collection.iter_all.  Each batch of dictionaries is read and 
+        decoded on the worker thread.
+        
+        Usage:
+            async for d in collection.iter_all():
+                ...
+        """
+        
+        # Statements are prepared on the worker thread, which owns the connection
+        rows = await self._run(self._collection.iter_all, fields, batch_size, limit, skip, sort)
+        try:
+            while True:
+                batch = await self._run(lambda: list(itertools.islice(rows, batch_size)))
+                if len(batch) == 0:
+                    break
+                for d in batch:
+                    yield d
+        finally:
+            await self._run(rows.close)
+        
+    async def find_one(self, field, value):
+        """See Collection.find_one"""
+        return await self._run(self._collection.find_one, field, value)
+        
+    async def find(self, filter=None, projection=None, sort=None, skip=0, limit=None):
+        """See Collection.find"""
+        return await self._run(self._collection.find, filter, projection, sort, skip, limit)
+        
+    async def find_page(self, filter=None, projection=None, sort=None, limit=100, after=None):
+        """See Collection.find_page"""
+        return await self._run(self._collection.find_page, filter, projection, sort, limit, after)
+        
+    async def count_documents(self, filter=None):
+        """See Collection.count_documents"""
+        return await self._run(self._collection.count_documents, filter)
+        
+    async def distinct(self, field, filter=None):
+        """See Collection.distinct"""
+        return await self._run(self._collection.distinct, field, filter)
+        
+    async def aggregate(self, match=None, group_by=None, metrics=None):
+        """See Collection.aggregate"""
+        return await self._run(self._collection.aggregate, match, group_by, metrics)
+        
+    async def text_search(self, query, limit=None, fields=None, projection=None):
+        """See Collection.text_search"""
+        return await self._run(self._collection.text_search, query, limit, fields, projection)
+        
+    async def find_field(self, field, value, compare_function=None):
+        """See Collection.find_field"""
+        return await self._run(self._collection.find_field, field, value, compare_function)
+        
+    async def random_entries(self, count=1):
+        """See Collection.random_entries"""
+        return await self._run(self._collection.random_entries, count)
+        
+    async def random_entry(self):
+        """See Collection.random_entry"""
+        return await self._run(self._collection.random_entry)
+
+    async def last_change(self):
+        """See Collection.last_change"""
+        return await self._run(self._collection.last_change)
+        
+    async def changes_since(self, seq=0, limit=None):
+        """See Collection.changes_since"""
+        return await self._run(self._collection.changes_since, seq, limit)
+        
+    async def truncate_changes(self, seq):
+        """See Collection.truncate_changes"""
+        return await self._write(self._collection.truncate_changes, seq)
+        
+    async def watch(self, seq=None, interval=WATCH_INTERVAL):
+        """Asynchronously iterates over changes to the collection as they are made
+        
+        See Collection.watch, except that with seq None, only changes made
+        after iteration begins are returned.  The event loop is free to 
+        run other coroutines while no changes are found.
+        
+        Usage:
+            async for change in collection.watch():
+                ...
+        """
+        
+        if seq is None:
+            seq = await self.last_change()
+        while True:
+            changes = await self._run(self._collection.changes_since, seq, FETCH_BATCH_SIZE)
+            if len(changes) == 0:
+                await asyncio.sleep(interval)
+                continue
+            for change in changes:
+                yield change
+            seq = changes[-1]['seq']
+            
+    async def instrumentation(self):
+        """See Collection.instrumentation"""
+        return await self._run(self._collection.instrumentation)
+
+    async def stats(self):
+        """See Collection.stats"""
+        return await self._run(self._collection.stats)
+
+    async def insert(self, object):
+        """See Collection.insert"""
+        return await self._write(self._collection.insert, object)
+        
+    async def insert_many(self, objects, batch_size=None):
+        """See Collection.insert_many.  The objects are read on the worker thread."""
+        
+        if batch_size is None:
+            return await self._run(self._collection.insert_many, objects)
+        return await self._run(self._collection.insert_many, objects, batch_size)
+        
+    async def export_jsonl(self, path_or_file, batch_size=FETCH_BATCH_SIZE, progress=None):
+        """See Collection.export_jsonl.  The file is written, and progress called, on the worker thread."""
+        return await self._run(self._collection.export_jsonl, path_or_file, batch_size, progress)
+        
+    async def import_jsonl(self, path_or_file, batch_size=INSERT_BATCH_SIZE, preserve_ids=False, progress=None):
+        """See Collection.import_jsonl.  The file is read, and progress called, on the worker thread."""
+        return await self._run(self._collection.import_jsonl, path_or_file, batch_size, preserve_ids, progress)
+        
+    async def backup(self, dest, pages=BACKUP_PAGES, progress=None):
+        """See Collection.backup"""
+        return await self._run(self._collection.backup, dest, pages, progress)
+        
+    async def update(self, object):
+        """See Collection.update"""
+        return await self._write(self._collection.update, object)
+        
+    async def update_fields(self, id, update):
+        """See Collection.update_fields"""
+        return await self._write(self._collection.update_fields, id, update)
+        
+    async def update_many(self, filter, update):
+        """See Collection.update_many"""
+        return await self._write(self._collection.update_many, filter, update)
+        
+    async def remove(self, object_or_id):
+        """See Collection.remove"""
+        return await self._write(self._collection.remove, object_or_id)
+        
+    async def remove_many(self, ids_or_filter):
+        """See Collection.remove_many.  The ids are read on the worker thread."""
+        return await self._write(self._collection.remove_many, ids_or_filter)
+        
+    async def upsert(self, object, key_field=None):
+        """See Collection.upsert"""
+        return await self._write(self._collection.upsert, object, key_field)
+        
+    async def bulk_write(self, operations):
+        """See Collection.bulk_write"""
+        return await self._write(self._collection.bulk_write, operations)
+        
+    async def _write(self, function, *args):
+        """Private queueing of a write to be committed with any others issued concurrently"""
+        
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((function, args, future))
+        if not self._flushing:
+            self._flushing = True
+            asyncio.ensure_future(self._flush())
+        return await future
+        
+    async def _flush(self):
+        """Private commit of all queued writes, in batches"""
+        
+        # Allows every coroutine ready to run to queue its write first
+        await asyncio.sleep(0)
+        try:
+            while len(self._pending) > 0:
+                batch = self._pending[:WRITE_BATCH_LIMIT]
+                self._pending = self._pending[WRITE_BATCH_LIMIT:]
+                try:
+                    results = await self._run(self._write_batch, [(function, args) for function, args, future in batch])
+                except Exception as e:
+                    results = [(False, e)] * len(batch)
+                    
+                for (function, args, future), (succeeded, result) in zip(batch, results):
+                    if future.cancelled():
+                        continue
+                    if succeeded:
+                        future.set_result(result)
+                    else:
+                        future.set_exception(result)
+        finally:
+            self._flushing = False
+            
+    def _write_batch(self, batch):
+        """Private execution of queued writes in one transaction on the worker thread"""
+        
+        results = []
+        with self._collection.transaction():
+            for function, args in batch:
+                try:
+                    with self._collection.transaction():
+                        results.append((True, function(*args)))
+                except Exception as e:
+                    results.append((False, e))
+        return results
@@ -0,0 +1,142 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import collections
+import copy
+import threading
+
+_IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+class DocumentCache():
+    """A least-recently-used cache of decoded dictionaries keyed by id
+    
+    The cache is bounded by a number of entries, a number of bytes, or 
+    both.  The size of an entry is taken to be the size of its stored,
+    serialized form.  Dictionaries are copied both into and out of the 
+    cache so that callers cannot modify cached entries.
+    
+    The cache may be shared between threads.  Its generation increases 
+    whenever entries are invalidated, allowing a thread to avoid caching a
+    dictionary that was changed while it was being read.
+    """
+    
+    def __init__(self, max_entries=None, max_bytes=None):
+        """Initializes an empty cache
+        
+        Args:
+            max_entries The maximum number of dictionaries held, defaults
+                        to None (unbounded)
+                        
+            max_bytes   The maximum total size of the dictionaries held,
+                        defaults to None (unbounded)
+        """
+        
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self.generation = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+        
+    def __len__(self):
+        return len(self._entries)
+        
+    def get(self, id):
+        """Returns a copy of the cached dictionary for an id, or None"""
+        
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(id)
+            self.hits += 1
+        return copy_document(entry[0])
+        
+    def put(self, id, document, size, generation=None):
+        """Caches a copy of a dictionary, evicting the least recently used entries as needed
+        
+        Args:
+            id          The dictionary's id
+            
+            document    The dictionary to cache
+            
+            size        The size of the dictionary in bytes
+            
+            generation  The cache's generation before the dictionary was
+                        read.  If given and entries have since been 
+                        invalidated, the dictionary is not cached.
+        """
+        
+        document = copy_document(document)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._remove(id)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[id] = (document, size)
+            self.bytes += size
+            
+            while (self.max_entries is not None and len(self._entries) > self.max_entries) or \
+                  (self.max_bytes is not None and self.bytes > self.max_bytes):
+                evicted, (document, size) = self._entries.popitem(last=False)
+                self.bytes -= size
+        
+    def invalidate(self, id):
+        """Removes an id from the cache, if present"""
+        
+        with self._lock:
+            self.generation += 1
+            self._remove(id)
+            
+    def _remove(self, id):
+        entry = self._entries.pop(id, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+            
+    def clear(self):
+        """Removes every entry from the cache"""
+        
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.bytes = 0
+        
+    def info(self):
+        """Returns a dictionary of the cache's hits, misses, entries, and bytes"""
+        
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self.bytes}
+        
+def copy_document(value):
+    """Returns a deep copy of a decoded dictionary
+    
+    Much faster than copy.deepcopy for the dictionaries, lists and scalars
+    produced by JSON decoding, falling back to copy.deepcopy for anything 
+    else.
+    """
+    
+    if isinstance(value, dict):
+        return dict((key, copy_document(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [copy_document(item) for item in value]
+    if isinstance(value, _IMMUTABLE):
+        return value
+    return copy.deepcopy(value)
@@ -0,0 +1,144 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import pickle
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class Codec():
+    """Serializes dictionaries for storage in a Collection's data column
+    
+    Subclasses provide a unique name along with encode and decode methods.
+    Codecs with binary set to True produce bytes that are stored as BLOBs, 
+    while others produce strings.  Codecs with json_text set to True store
+    JSON text that SQLite's JSON functions can read, allowing searches to
+    be performed within SQLite.
+    """
+    
+    name = None
+    binary = False
+    json_text = False
+    
+    def encode(self, object):
+        """Returns the stored representation of a dictionary"""
+        raise NotImplementedError()
+        
+    def decode(self, data):
+        """Returns the dictionary held in a stored representation"""
+        raise NotImplementedError()
+        
+class JSONCodec(Codec):
+    """The default codec, using the standard library's json module"""
+    
+    name = 'json'
+    json_text = True
+    
+    def encode(self, object):
+        return json.dumps(object)
+        
+    def decode(self, data):
+        return json.loads(data)
+        
+class OrjsonCodec(Codec):
+    """A faster JSON codec using the optional orjson package
+    
+    The stored text is interchangeable with JSONCodec's.
+    """
+    
+    name = 'orjson'
+    json_text = True
+    
+    def encode(self, object):
+        return orjson.dumps(object).decode('utf-8')
+        
+    def decode(self, data):
+        return orjson.loads(data)
+        
+class MsgpackCodec(Codec):
+    """A binary codec using the optional msgpack package
+    
+    Unlike JSON, bytes values are preserved.
+    """
+    
+    name = 'msgpack'
+    binary = True
+    
+    def encode(self, object):
+        return msgpack.packb(object, use_bin_type=True)
+        
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+        
+class PickleCodec(Codec):
+    """A binary codec using the pickle module
+    
+    Any picklable value, including bytes, tuples and datetimes, is 
+    preserved.  Only use this codec with trusted databases, as unpickling
+    can execute arbitrary code.
+    """
+    
+    name = 'pickle'
+    binary = True
+    
+    def encode(self, object):
+        return pickle.dumps(object, protocol=min(5, pickle.HIGHEST_PROTOCOL))
+        
+    def decode(self, data):
+        return pickle.loads(data)
+        
+_codecs = {}
+
+def register_codec(codec):
+    """Makes a Codec instance available to Collections by its name"""
+    
+    if not codec.name:
+        raise ValueError("A codec must have a name")
+    _codecs[codec.name] = codec
+    
+def get_codec(name):
+    """Returns the registered Codec with the given name
+    
+    Raises:
+        ValueError  This method will throw a ValueError if no codec
+                    with the name is registered
+    """
+    
+    try:
+        return _codecs[name]
+    except KeyError:
+        raise ValueError("The codec '{0}' is not available".format(name))
+        
+def available_codecs():
+    """Returns the names of all registered codecs"""
+    
+    return sorted(_codecs.keys())
+
+register_codec(JSONCodec())
+register_codec(PickleCodec())
+if orjson is not None:
+    register_codec(OrjsonCodec())
+if msgpack is not None:
+    register_codec(MsgpackCodec())
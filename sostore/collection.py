@@ -15,13 +15,32 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import os
 import sqlite3
-import warnings
 import json
-import collections
+import base64
+import warnings
 import random
+import itertools
+import contextlib
+import functools
+import re
+import time
 
-from sostore.errors import RandomIdException, ConnectionException
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+
+from sostore.errors import RandomIdException, ConnectionException, CodecException, ChangesTruncatedException
+from sostore.codec import get_codec
+from sostore.compression import Compressor, ZstdCompressor, MAGIC, get_compressor, get_compressor_by_tag, train_zstd_dictionary, zstandard
+from sostore.transaction import transaction, in_transaction
+from sostore.cache import DocumentCache
+from sostore.database import Database, RESERVED_PREFIXES, BACKUP_PAGES
+from sostore.query import compile_filter, matches, project, resolve, sort_value, sql_value, json_path, field_expressions, Unsupported, _bracket, _sql_operand, _SQL_TYPES
+from sostore.update import check_update, apply_update, compile_update, SQL_FAILURE_MESSAGE
+from sostore.instrument import Instrumentation, instrumented
 
 _ID_COLUMN = '_id'
 _DATA_COLUMN = '_data'
@@ -33,12 +52,94 @@ DESCENDING = 'DESC'
 
 RANDOM_ATTEMPT_LIMIT = 1000
 
+# Collection.sample reads the Collection's ids instead once drawing ids from
+# the range in use needs more than this many draws per dictionary sampled
+SAMPLE_PROBE_FACTOR = 10
+
+# Without a sample index, Collection.sample finds up to this many ids by
+# their position individually rather than reading every id
+SAMPLE_OFFSET_LIMIT = 8
+
+# The range of ids assigned in randomized collections
+RANDOM_ID_MIN = 1000000
+RANDOM_ID_MAX = 2**63 - 1
+
+DEFAULT_CODEC = 'json'
+
+# Settings, such as the codec, that must persist with the database are
+# recorded in METADATA_TABLE
+_CODEC_KEY = 'codec'
+_COMPRESSED_KEY = 'compressed'
+_ZSTD_DICTIONARY_KEY = 'zstd_dictionary'
+
+COMPRESSION_THRESHOLD = 256
+
+ZSTD_DICTIONARY_SIZE = 16384
+ZSTD_SAMPLE_COUNT = 1000
+
+INSERT_BATCH_SIZE = 1000
+FETCH_BATCH_SIZE = 1000
+
+# The smallest SQLITE_MAX_VARIABLE_NUMBER a SQLite build may have been
+# compiled with, used to size "IN (...)" lists
+SQLITE_MAX_VARIABLES = 999
+
+# The Collection methods available to bulk_write
+_BULK_OPERATIONS = ('insert', 'update', 'update_fields', 'update_many', 'upsert', 'remove', 'remove_many')
+
+# The functions available to Collection.aggregate
+_AGGREGATE_FUNCTIONS = ('count', 'sum', 'avg', 'min', 'max')
+
+# UPDATE ... RETURNING requires SQLite 3.35
+_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+_FIELD_INDEX = 'idx'
+_CONTAINER_INDEX = 'cdx'
+# Field indexes are named with this reserved prefix, the kind of index, 
+# and the length of the Collection name, so that no two Collections' 
+# index names can be the same
+_INDEX_PREFIX = 'sostore_'
+
+# The full-text index of a Collection is an FTS5 table named with this
+# prefix, which Collection names may not use
+_TEXT_INDEX_PREFIX = 'sostore_fts_'
+# Column names FTS5 reserves for itself
+_TEXT_RESERVED = ('rank', 'rowid')
+
+# The change log of a Collection is a table named with this prefix
+_CHANGE_LOG_PREFIX = 'sostore_changes_'
+# The write recorded by each trigger feeding the change log
+_CHANGE_TRIGGERS = (('insert', 'INSERT', 'new'), ('update', 'UPDATE', 'new'), ('remove', 'DELETE', 'old'))
+
+# The seconds Collection.watch waits before checking again for changes
+WATCH_INTERVAL = 0.25
+
+_SQL_SCALARS = (str, int, float, bool, type(None))
+_SQL_INT_MIN = -2**63
+_SQL_INT_MAX = 2**63 - 1
+
+# Phases are charged only while a Collection is instrumented
+_NO_PHASE = contextlib.nullcontext()
+
+# Names the index searched by a step of EXPLAIN QUERY PLAN
+_INDEX_PLAN = re.compile(r"USING (?:COVERING )?INDEX (\S+)")
+
+# Read in place of a Collection's table until its first write creates it
+_EMPTY_TABLE = "(SELECT NULL AS {0}, NULL AS {1} LIMIT 0)".format(_ID_COLUMN, _DATA_COLUMN)
+
+# The number of Collection names whose SQL statements are kept
+STATEMENT_CACHE_SIZE = 4096
+
 class Collection():
-    def __init__(self, collection, connection=None, db=":memory:", randomized=False):
+    def __init__(self, collection, connection=None, db=":memory:", randomized=False, codec=None,
+                 compression=None, compression_threshold=COMPRESSION_THRESHOLD,
+                 cache_size=None, cache_bytes=None, pool=None, threaded=False, instrumented=False,
+                 profile=None, pragmas=None, database=None):
         """Initializes access to a collection
         
         Args:
-            collection  The collection within the database to use
+            collection  The collection within the database to use.  Names
+                        beginning with "sqlite_" or "sostore_" are reserved.
             
             connection  A valid sqlite3.Connection object, can be None
                         if db is specified
@@ -49,43 +150,279 @@ class Collection():
             randomized  If True, all ids in the collection will be randomly
                         generated.  If False, the ids are generated by SQLite
                         using its usual consecutive generation routine.
+                        
+            codec       The name of the registered codec used to store 
+                        dictionaries, defaults to None to use the codec the
+                        collection was created with or DEFAULT_CODEC for new
+                        collections
+                        
+            compression The name of a registered compressor, or a 
+                        sostore.compression.Compressor instance, used to
+                        compress stored dictionaries, defaults to None (no
+                        compression)
+                        
+            compression_threshold
+                        Serialized dictionaries smaller than this many bytes
+                        are stored uncompressed, defaults to 
+                        COMPRESSION_THRESHOLD
+                        
+            cache_size  The number of decoded dictionaries Collection.get 
+                        keeps in memory, defaults to None (no cache unless
+                        cache_bytes is specified)
+                        
+            cache_bytes The total stored size of the dictionaries 
+                        Collection.get keeps in memory, defaults to None
+                        (no cache unless cache_size is specified)
+                        
+            pool        A sostore.ConnectionPool providing each thread with
+                        its own connection, allowing the Collection to be
+                        shared between threads.  Overrides connection and
+                        db if specified.
+                        
+            threaded    If True and no pool is specified, a new 
+                        ConnectionPool is created for db, defaults to False
+                        
+            instrumented
+                        If True, the time spent in each method is recorded,
+                        see Collection.instrumentation, defaults to False
+                        
+            profile     The name of a connection profile, "durable",
+                        "throughput", or "readonly", applied to the 
+                        connection, defaults to None (SQLite's defaults).
+                        See sostore.tuning.PROFILES.
+                        
+            pragmas     A dictionary of connection settings overriding the
+                        profile's, keyed by journal_mode, synchronous, 
+                        busy_timeout, cache_size, mmap_size, temp_store, or
+                        query_only, defaults to None.  Ignored if pool is 
+                        specified, as the pool applies its own settings.
+                        
+            database    A sostore.Database whose connection is shared, 
+                        overriding connection, db, pool, threaded, profile,
+                        and pragmas.  Database.collection is equivalent.
+                        
+        Raises:
+            sostore.CodecException
+                        This method will throw a CodecException if codec 
+                        differs from the codec the collection was created with
+                        
+            ValueError  This method will throw a ValueError if the name is
+                        reserved, if the codec or compressor is not 
+                        available, if compression is requested for a 
+                        collection with indexed fields, or if the profile or
+                        a connection setting is unknown
+                        
+        Notes:
+            The Collection's table is created by its first write, until
+            which the Collection reads as empty.
         """
         
         if collection is None:
             raise ValueError('A Collection name must be specified')
+        if not isinstance(collection, str) or len(collection) == 0 or '\0' in collection or collection.lower().startswith(RESERVED_PREFIXES):
+            raise ValueError("Invalid Collection name {0!r}".format(collection))
     
-        if connection is not None:
-            self._connection = connection
-        else:
-            self._connection = sqlite3.connect(db, isolation_level=None)
+        self._instrument = Instrumentation() if instrumented else None
+    
+        # A Database opened here belongs to this Collection alone
+        self._owns_database = database is None
+        if database is None:
+            database = Database(db, connection=connection, pool=pool, threaded=threaded, profile=profile, pragmas=pragmas,
+                                preload=False)
+        self._database = database
+        self._pool = database.pool
+        self._closed = False
             
         self.collection = collection
+        self._statements = _statements(_quote_identifier(collection))
         
-        self.connection.execute("CREATE TABLE IF NOT EXISTS {0}({1} INTEGER PRIMARY KEY AUTOINCREMENT, {2} TEXT)".format(self.collection, _ID_COLUMN, _DATA_COLUMN))
-        self.connection.commit()
+        # A table missing when last looked up may since have been created
+        # through another connection
+        exists = self._database.has_table(collection, self.connection, cached=False)
+        recorded = self._get_metadata(_CODEC_KEY)
+        if recorded is None and exists:
+            recorded = self._database.metadata(collection, self.connection, refresh=True).get(_CODEC_KEY)
+            # Collections created before codecs were recorded hold JSON
+            recorded = recorded or DEFAULT_CODEC
+        if codec is None:
+            codec = recorded or DEFAULT_CODEC
+        self.codec = get_codec(codec)
+        if recorded is not None:
+            self._check_codec(recorded)
+        # Until the table is seen, another Collection may create it with 
+        # another codec, so the codec is checked again by the first write
+        self._checked = exists
+            
+        if compression is not None and not isinstance(compression, Compressor):
+            compression = get_compressor(compression)
+        self._compressor = compression
+        self._decompressors = {}
+        self.compression_threshold = compression_threshold
+        if self._compressor is not None:
+            if exists:
+                self._check_compression()
+            if self._compressor.name == ZstdCompressor.name:
+                self._load_zstd_dictionaries(self._compressor)
+        # Compressed rows may remain from an earlier Collection even if
+        # this one does not compress
+        self._compressed = self._compressor is not None or self._get_metadata(_COMPRESSED_KEY) == '1'
         
         self.randomized = randomized
         
+        self._cache = None
+        if cache_size is not None or cache_bytes is not None:
+            self._cache = DocumentCache(cache_size, cache_bytes)
+            # The data_version and total_changes last seen by the cache,
+            # keyed by id() of the connection, of which a pool has several
+            self._cache_versions = {}
+        
     @property
     def connection(self):
-        if self._connection is None:
+        if self._closed or self._database.closed:
             raise ConnectionException(self.collection)
-        else:
-            return self._connection
+        connection = self._database.connection
+        if self._instrument is not None:
+            self._instrument.watch(connection)
+        return connection
+        
+    @property
+    def database(self):
+        """The sostore.Database holding the Collection"""
+        
+        return self._database
+        
+    def _table_exists(self):
+        """Private check for the Collection's table in the database"""
+        
+        return self._database.has_table(self.collection, self.connection)
+        
+    @property
+    def _table(self):
+        """Private SQL naming the Collection's table, or an empty table until the table is created"""
+        
+        return self._sql['table']
+        
+    @property
+    def _sql(self):
+        """Private dictionary of the Collection's fixed SQL statements"""
+        
+        if self._table_exists():
+            return self._statements
+        return _EMPTY_STATEMENTS
+        
+    def _create_table(self):
+        """Private creation of the Collection's table, if necessary, before a write
+        
+        Raises:
+            sostore.CodecException
+                        This method will throw a CodecException if another
+                        Collection created the table with another codec
+        """
+        
+        if self._checked and self._table_exists():
+            return
+        with self.transaction(immediate=True):
+            connection = self.connection
+            # Read again under the write lock, as the table may have been
+            # created since this Collection was opened
+            recorded = self._database.metadata(self.collection, connection, refresh=True).get(_CODEC_KEY)
+            if self._database.has_table(self.collection, connection):
+                self._check_codec(recorded or DEFAULT_CODEC)
+                if self._compressor is not None:
+                    self._check_compression()
+            else:
+                if recorded is not None:
+                    self._check_codec(recorded)
+                connection.execute("CREATE TABLE IF NOT EXISTS {0}({1} INTEGER PRIMARY KEY AUTOINCREMENT, {2} {3})".format(self._statements['table'], _ID_COLUMN, _DATA_COLUMN,
+                                                                                                                      "BLOB" if self.codec.binary else "TEXT"))
+                if self._compressor is not None:
+                    self._set_metadata(_COMPRESSED_KEY, '1')
+            if recorded is None:
+                self._set_metadata(_CODEC_KEY, self.codec.name)
+        self._database.add_table(self.collection, self.connection)
+        self._checked = True
+        
+    def _check_codec(self, recorded):
+        """Private check that the Collection's codec reads dictionaries stored with the recorded codec"""
+        
+        # JSON codecs store interchangeable text
+        if self.codec.name != recorded and not (self.codec.json_text and get_codec(recorded).json_text):
+            raise CodecException(self.collection, recorded, self.codec.name)
+            
+    def _check_compression(self):
+        """Private check that the Collection's existing table may be compressed, recording that it is"""
+        
+        if len(self.list_indexes()) > 0 or self._text_fields() is not None:
+            raise ValueError("Collections with indexed fields cannot be compressed")
+        if self._get_metadata(_COMPRESSED_KEY) != '1':
+            self._set_metadata(_COMPRESSED_KEY, '1')
+        
+    def _get_metadata(self, key):
+        """Private lookup of a value recorded for the Collection, or None"""
+        
+        return self._database.metadata(self.collection, self.connection).get(key)
+        
+    def _set_metadata(self, key, value):
+        """Private record of a value for the Collection"""
+        
+        self._database.set_metadata(self.collection, key, value, self.connection)
+        self._commit()
+        
+    def transaction(self, immediate=False):
+        """Groups work on the Collection into a single transaction
+        
+        Args:
+            immediate   If True, the database write lock is acquired when
+                        the transaction begins, defaults to False
+                        
+        Usage:
+            with collection.transaction(immediate=True):
+                d = collection.get(1)
+                d['visits'] += 1
+                collection.update(d)
+                
+        Notes:
+            The transaction covers the Collection's connection, so other
+            Collections sharing the connection are included as well.  See
+            sostore.transaction for details.
+            
+            A transaction that reads before it writes should pass
+            immediate=True whenever another connection may write to the
+            database, as with threaded=True, a ConnectionPool, or another
+            process.  Otherwise the transaction's read lock cannot become
+            a write lock once another connection has written, and the 
+            write fails with "database is locked".
+        """
+        
+        return transaction(self.connection, immediate)
+        
+    def _commit(self):
+        """Private commit, deferred while a transaction block is active"""
+        
+        if not in_transaction(self.connection):
+            self.connection.commit()
         
     @property
     def count(self):
         """Returns the number of items in the collection"""
         cursor = self.connection.cursor()
-        cursor.execute("SELECT COUNT({0}) FROM {1}".format(_ID_COLUMN, self.collection))
+        cursor.execute(self._sql['count'])
         return cursor.fetchone()[0]
         
     def done(self):
-        """Closes the connection to the Collection"""
-        if self._connection is not None:
-            self.connection.close()
-        self._connection = None
+        """Closes the connection to the Collection
+        
+        Notes:
+            The connection of a Collection opened through a sostore.Database
+            is left open for the Database's other Collections.
+        """
+        if self._owns_database:
+            self._database.done()
+        self._closed = True
+        if self._cache is not None:
+            self._cache.clear()
         
+    @instrumented
     def get(self, id):
         """Retrieves a dictionary from the Collection
         
@@ -93,15 +430,240 @@ class Collection():
             id  the id of the dictionary to retrieve
         """
         
-        str = self.connection.execute("SELECT {0},{1} FROM {2} WHERE {0}=?".format(_ID_COLUMN, _DATA_COLUMN, self.collection), (id,)).fetchone()
+        cache = self._checked_cache()
+        # Writes invalidate the stored integer ids, which other ids, such
+        # as strings SQLite converts, would not match
+        if not isinstance(id, int):
+            cache = None
+        if cache is not None:
+            d = cache.get(id)
+            if d is not None:
+                return d
+            generation = cache.generation
+        
+        str = self.connection.execute(self._sql['get'], (id,)).fetchone()
         if str is None or len(str) != 2:
             return None
 
-        d = json.loads(str[1])
-        d[_ID_COLUMN] = id
-        
+        d = self._decode(id, str[1])
+        # Dictionaries read within a transaction may yet be rolled back
+        if cache is not None and not self.connection.in_transaction:
+            cache.put(id, d, len(str[1]), generation)
         return d
         
+    def cache_info(self):
+        """Returns the cache's hits, misses, entries, and bytes as a dictionary, or None without a cache"""
+        
+        if self._cache is None:
+            return None
+        return self._cache.info()
+        
+    def clear_cache(self):
+        """Empties the cache of decoded dictionaries, if any"""
+        
+        if self._cache is not None:
+            self._cache.clear()
+        
+    def instrumentation(self):
+        """Returns the recorded timings of the Collection's methods
+        
+        Returns:
+            A dictionary keyed by method name, or None if the Collection is
+            not instrumented.  Each value is a dictionary of:
+            
+            calls       The number of calls
+            total       The total seconds spent in the method
+            max         The longest call in seconds
+            sql         Seconds spent outside decode and filter, which is
+                        mostly time spent within SQLite
+            decode      Seconds spent decompressing and decoding
+            filter      Seconds spent matching dictionaries in Python
+            scanned     The number of dictionaries read and decoded
+            returned    The number of dictionaries or ids returned
+            statements  The number of SQL statements executed
+            histogram   A list of (upper bound in seconds, calls) pairs
+            
+        Notes:
+            Calls made by another instrumented method, such as
+            Collection.iter_all within Collection.all, are counted as part
+            of the outer call.  Iterators returned by methods such as
+            Collection.iter_find are timed only while retrieving entries, and
+            recorded once exhausted or closed.
+        """
+        
+        if self._instrument is None:
+            return None
+        return self._instrument.report()
+        
+    def reset_instrumentation(self):
+        """Discards the timings and SQL statements recorded so far"""
+        
+        if self._instrument is not None:
+            self._instrument.reset()
+        
+    def set_trace(self, callback, slow=0.0):
+        """Calls a function after each slow call to a Collection method
+        
+        Args:
+            callback    A function called as callback(method, seconds,
+                        statements), where statements lists the SQL
+                        executed by the call, or None to stop tracing
+                        
+            slow        The shortest call, in seconds, passed to callback,
+                        defaults to 0.0 (every call)
+                        
+        Notes:
+            Tracing instruments the Collection if it is not already.  SQL
+            statements are captured with sqlite3.Connection.set_trace_callback,
+            replacing any other trace callback on the Collection's 
+            connections, and include their parameters as literals.  At most
+            sostore.instrument.STATEMENT_LIMIT statements are listed per call.
+        """
+        
+        if self._instrument is None:
+            self._instrument = Instrumentation()
+        self._instrument.trace = callback
+        self._instrument.slow = slow
+        
+    def stats(self):
+        """Reports the size of the Collection and the use of its indexes
+        
+        Returns:
+            A dictionary of:
+            
+            count           The number of dictionaries
+            data_bytes      The total stored size of the dictionaries
+            average_bytes   The average stored size of a dictionary
+            page_size       The database page size in bytes
+            database_pages  The number of pages in the whole database
+            table_pages     The number of pages holding the Collection's
+                            table, or None if SQLite lacks the dbstat table
+            indexes         A list of dictionaries, one per indexed field,
+                            of the "field", whether the index is "unique",
+                            its "pages" (None without dbstat), and "uses",
+                            the number of SQL statements executed that 
+                            searched it, or None if not instrumented
+        """
+        
+        cursor = self.connection.cursor()
+        count, data_bytes = cursor.execute(self._sql['size']).fetchone()
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        database_pages = cursor.execute("PRAGMA page_count").fetchone()[0]
+        
+        indexes = self.list_indexes()
+        names = {}
+        for field, kind, name, unique in self._index_names():
+            names[field] = names.get(field, ()) + (name,)
+        
+        pages = None
+        try:
+            tables = [self.collection] + [name for pair in names.values() for name in pair]
+            pages = dict(cursor.execute("SELECT name, COUNT(*) FROM dbstat WHERE name IN ({0}) GROUP BY name".format(",".join("?" * len(tables))),
+                                        tables))
+        except sqlite3.OperationalError:
+            # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+            pass
+        
+        uses = None
+        if self._instrument is not None:
+            uses = self._index_uses(cursor, names)
+        
+        for index in indexes:
+            index['pages'] = None
+            if pages is not None:
+                index['pages'] = sum(pages.get(name, 0) for name in names[index['field']])
+            index['uses'] = None
+            if uses is not None:
+                index['uses'] = uses.get(index['field'], 0)
+        
+        return {'count': count,
+                'data_bytes': int(data_bytes),
+                'average_bytes': data_bytes / count if count > 0 else 0.0,
+                'page_size': page_size,
+                'database_pages': database_pages,
+                'table_pages': pages.get(self.collection, 0) if pages is not None else None,
+                'indexes': indexes}
+        
+    def _index_uses(self, cursor, names):
+        """Private count of recorded SQL statements searching the indexes of each field
+        
+        Args:
+            cursor  The cursor used to explain each statement's query plan
+            
+            names   The names of the SQLite indexes, keyed by field
+        """
+        
+        uses = {}
+        for (sql, parameters), count in self._instrument.statements().items():
+            try:
+                plan = cursor.execute("EXPLAIN QUERY PLAN " + sql, [None] * parameters).fetchall()
+            except sqlite3.Error:
+                # Statements may refer to tables or indexes since dropped
+                continue
+            searched = set(match.group(1) for match in (_INDEX_PLAN.search(row[-1]) for row in plan) if match is not None)
+            for field, pair in names.items():
+                if searched.intersection(pair):
+                    uses[field] = uses.get(field, 0) + count
+        return uses
+        
+    def _phase(self, name):
+        """Private context charging time to a phase of the current instrumented call"""
+        
+        if self._instrument is None:
+            return _NO_PHASE
+        return self._instrument.phase(name)
+        
+    def _matches(self, d, filter):
+        """Private sostore.query.matches, timed as filtering"""
+        
+        if self._instrument is None:
+            return matches(d, filter)
+        with self._instrument.phase('filter'):
+            return matches(d, filter)
+        
+    def _checked_cache(self):
+        """Private access to the cache, emptied first if the database was changed elsewhere
+        
+        Changes committed through other connections are detected through 
+        SQLite's data_version, while changes made through other Collections
+        sharing this connection are detected through its total_changes.
+        """
+        
+        if self._cache is None:
+            return None
+            
+        connection = self.connection
+        versions = (connection.execute("PRAGMA data_version").fetchone()[0], connection.total_changes)
+        if self._cache_versions.get(id(connection)) != versions:
+            self._cache.clear()
+            self._cache_versions[id(connection)] = versions
+        return self._cache
+        
+    def _invalidate(self, ids, changes):
+        """Private removal of written ids from the cache
+        
+        Args:
+            ids     The ids inserted, updated, or removed, or None if 
+                    they are unknown
+            
+            changes The connection's total_changes before the write
+        """
+        
+        if self._cache is None:
+            return
+        if ids is None:
+            self._cache.clear()
+            ids = ()
+        for changed in ids:
+            self._cache.invalidate(changed)
+        # This Collection's own writes need not empty the cache, unless it
+        # had already missed changes made elsewhere
+        connection = self.connection
+        versions = self._cache_versions.get(id(connection))
+        if versions is not None and versions[1] == changes:
+            self._cache_versions[id(connection)] = (versions[0], connection.total_changes)
+        
+    @instrumented
     def get_many(self, ids, fields=None):
         """Retrieves multiple dictionaries as a list, possibly with only a subset of dictionary keys
         
@@ -110,62 +672,164 @@ class Collection():
             
             fields  The keys from each dictionary to retrieve, 
                     defaults to None (all keys)
+                    
+        Notes:
+            The returned list matches the order of ids, including any 
+            duplicates.  Ids not present in the Collection are returned
+            as None.
         """
         
+        ids = list(ids)
+        found = {}
+        
+        cursor = self.connection.cursor()
+        sql = self._sql
+        wanted = set(ids)
+        # Rows are matched back by the integer ids SQLite returns, so any
+        # other ids, which SQLite may convert, are retrieved one at a time
+        for id in [id for id in wanted if not isinstance(id, int)]:
+            wanted.discard(id)
+            row = cursor.execute(sql['get'], (id,)).fetchone()
+            if row is not None:
+                found[id] = row[1]
+        wanted = list(wanted)
+        for i in range(0, len(wanted), SQLITE_MAX_VARIABLES):
+            chunk = wanted[i:i + SQLITE_MAX_VARIABLES]
+            for row in cursor.execute(sql['get_in'].format(",".join("?" * len(chunk))), chunk):
+                found[row[0]] = row[1]
+        
         entries = []
         for id in ids:
-            d = self.get(id)
-            if fields is not None:
-                removed_keys = [key for key in d.keys() if not key in fields]
-                for k in removed_keys:
-                    del d[k]
-            entries.append(d)
+            if id in found:
+                entries.append(self._decode(id, found[id], fields))
+            else:
+                entries.append(None)
             
         return entries
         
-    def all(self, fields=None):
+    @instrumented
+    def all(self, fields=None, sort=None):
         """Retrieves all the dictionaries from the Collection
         
         Args:
             fields  The subset of keys to retrieve for each dictionary, 
                     defaults to None (all keys)
+                    
+            sort    A list of (key, direction) pairs, where direction is
+                    ASCENDING or DESCENDING, defaults to None (id order)
             
+        Notes:
+            See Collection.iter_all to avoid holding every dictionary in 
+            memory at once
         """
         
-        entries = []
+        return list(self.iter_all(fields, sort=sort))
+
+    @instrumented
+    def iter_all(self, fields=None, batch_size=FETCH_BATCH_SIZE, limit=None, skip=0, sort=None):
+        """Iterates over the dictionaries in the Collection in id order
+        
+        Args:
+            fields      The subset of keys to retrieve for each dictionary, 
+                        defaults to None (all keys)
+                        
+            batch_size  The number of rows read from SQLite at a time, 
+                        defaults to FETCH_BATCH_SIZE
+                        
+            limit       The maximum number of dictionaries to return, 
+                        defaults to None (no limit)
+                        
+            skip        The number of dictionaries to skip before returning
+                        any, defaults to 0
+                        
+            sort        A list of (key, direction) pairs, where direction is
+                        ASCENDING or DESCENDING, defaults to None (id order)
+                        
+        Notes:
+            Dictionaries are decoded only as they are iterated over, so 
+            only about batch_size rows are held in memory at any time.
+            Sorting is performed by SQLite unless the Collection cannot be
+            searched there, as with binary codecs or compression.  Large
+            skips still read every skipped row; see Collection.find_page.
+        """
+        
+        if sort is not None:
+            return self.iter_find(None, fields, sort, skip, limit, batch_size)
+            
+        sql = self._sql['all']
+        params = []
+        if limit is not None or skip:
+            sql = sql + " LIMIT ? OFFSET ?"
+            params = [-1 if limit is None else limit, skip]
+            
+        return self._iter_rows(sql, params, fields, batch_size)
+        
+    def _iter_rows(self, sql, params=(), fields=None, batch_size=FETCH_BATCH_SIZE):
+        """Private generator decoding the (id, data) rows of a query in batches"""
         
         cursor = self.connection.cursor()
-        for row in cursor.execute("SELECT {0},{1} FROM {2}".format(_ID_COLUMN, _DATA_COLUMN, self.collection)):
-            toret = json.loads(row[1])
-            toret[_ID_COLUMN] = row[0]
-            if fields is not None:
-                removed_keys = [key for key in toret.keys() if not key in fields]
-                for k in removed_keys:
-                    del toret[k]
-            entries.append(toret)
-
-        return entries    
-
-    def _random_id(self):
-        """Private random database id generator"""
-        
-        # The following causes our randomization to expand if
-        # we're dealing with an extremely large number of 
-        # entries (probably a bad idea for this db).
-        topmost = max(1E+9, 10*self.count)
-        
-        # At this point, our random range should be at _least_ 10 times
-        # larger than our current row count.  On average only one in 10
-        # id's should be a duplicate, but we need to check
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield self._decode(row[0], row[1], fields)
+        cursor.close()
+
+    def _decode(self, id, data, fields=None):
+        """Private deserializer for a stored row
+        
+        Args:
+            id      The row's id, added back to the dictionary
+            
+            data    The serialized dictionary from the data column
+            
+            fields  The subset of keys to keep, defaults to None (all keys)
+        """
+        
+        if self._instrument is not None:
+            self._instrument.scanned()
+        with self._phase('decode'):
+            d = self.codec.decode(self._decompress(data))
+        d[_ID_COLUMN] = id
+        if fields is not None:
+            d = dict((key, value) for key, value in d.items() if key in fields)
+        return d
+        
+    def _random_ids(self, count, cursor):
+        """Private allocation of unused random ids for a batch insert
+        
+        Candidate ids are checked against the Collection with a few IN 
+        queries and any already in use are redrawn.  The caller must hold
+        the write lock until the ids are inserted.
+        """
+        
+        ids = []
+        allocated = set()
         attempts = 0
-        while attempts < RANDOM_ATTEMPT_LIMIT:
-            id = random.randint(1E+6, topmost)
-            if self.get(id) is None:
-                return id
+        select = self._sql['ids_in']
+        while len(ids) < count:
+            if attempts >= RANDOM_ATTEMPT_LIMIT:
+                raise RandomIdException(self.collection)
             attempts += 1
             
-        raise RandomIdException(self.collection)
+            candidates = []
+            while len(candidates) < count - len(ids):
+                id = random.randint(RANDOM_ID_MIN, RANDOM_ID_MAX)
+                if id not in allocated:
+                    allocated.add(id)
+                    candidates.append(id)
+                    
+            used = set()
+            for i in range(0, len(candidates), SQLITE_MAX_VARIABLES):
+                chunk = candidates[i:i + SQLITE_MAX_VARIABLES]
+                used.update(row[0] for row in cursor.execute(select.format(",".join("?" * len(chunk))), chunk))
+            ids.extend(id for id in candidates if id not in used)
+            
+        return ids
 
+    @instrumented
     def insert(self, object):
         """Inserts a new dictionary into the Collection
         
@@ -182,114 +846,1432 @@ class Collection():
                         with an already-existant id
                         
         """
+        
+        self._create_table()
             
-        if _ID_COLUMN in object:
-            if object[_ID_COLUMN] is None:
-                del object[_ID_COLUMN]
-            else:
-                raise ValueError("An object insert was attempted with a non-None id")
-                
-        str = json.dumps(object)
+        str = self._encode_new(object)
+        changes = self.connection.total_changes
         cursor = self.connection.cursor()
         if not self.randomized:
-            cursor.execute("INSERT INTO {0}({1}) VALUES(?)".format(self.collection, _DATA_COLUMN), (str,))
+            cursor.execute(self._sql['insert'], (str,))
         else:
-            id = self._random_id()
-            cursor.execute("INSERT INTO {0}({1}, {2}) VALUES(?, ?)".format(self.collection, _ID_COLUMN, _DATA_COLUMN), (id, str,))
-        self.connection.commit()
+            # Collisions are so unlikely in the 63 bit id space that the
+            # insert is simply attempted, and retried with a new id if the
+            # id turns out to be in use
+            attempts = 0
+            while True:
+                id = random.randint(RANDOM_ID_MIN, RANDOM_ID_MAX)
+                cursor.execute(self._sql['insert_new_id'], (id, str,))
+                if cursor.rowcount == 1:
+                    break
+                attempts += 1
+                if attempts >= RANDOM_ATTEMPT_LIMIT:
+                    raise RandomIdException(self.collection)
+        self._commit()
+        self._invalidate((), changes)
         
         object[_ID_COLUMN] = cursor.lastrowid
         return object
         
-    def update(self, object):
-        """Updates an existing dictionary in the Collection
+    @instrumented
+    def insert_many(self, objects, batch_size=INSERT_BATCH_SIZE):
+        """Inserts multiple new dictionaries into the Collection
         
         Args:
-            object  A dictionary with a valid "_id" key, which will entirely
-                    replace the existing dictionary associated with the id
-                    
-        Raises:
-            ValueError  This method will throw a ValueError if an update is 
-                        attempted and the dictionary does not include an 
-                        already-existant id
+            objects     An iterable of dictionaries to insert, which may be
+                        a generator
+                        
+            batch_size  The number of dictionaries written per transaction,
+                        defaults to INSERT_BATCH_SIZE
+                        
+        Returns:
+            A list of the ids assigned to the dictionaries, in the order
+            they were provided.  Each dictionary also receives its "_id" key
+            as with Collection.insert.
+            
+        Throws:
+            ValueError  This method will throw a ValueError if any dictionary
+                        already has an id or batch_size is not positive.  Only
+                        the batch containing the offending dictionary is 
+                        rolled back.
         """
         
-        if not _ID_COLUMN in object.keys():
-            raise ValueError('Update called on a nonexistant db record')
-
-        id = object[_ID_COLUMN]
-        del object[_ID_COLUMN]
+        self._create_table()
         
-        str = json.dumps(object)
+        if batch_size < 1:
+            raise ValueError("The batch size must be a positive integer")
         
-        self.connection.execute("UPDATE {0} SET {1}=? WHERE {2}=?".format(self.collection, _DATA_COLUMN, _ID_COLUMN), (str, id))
-        self.connection.commit()
+        ids = []
+        objects = iter(objects)
+        while True:
+            batch = list(itertools.islice(objects, batch_size))
+            if len(batch) == 0:
+                break
+            ids.extend(self._insert_batch(batch))
+            
+        return ids
         
-        object[_ID_COLUMN] = id
+    def _insert_batch(self, batch):
+        """Private writer for a single batch of Collection.insert_many"""
         
-        return object
+        rows = [self._encode_new(object) for object in batch]
         
-    def remove(self, object_or_id):
-        """Removes a dictionary from the Collection
+        changes = self.connection.total_changes
+        # IMMEDIATE takes the write lock now so that the ids computed
+        # below cannot be claimed by another connection
+        with self.transaction(immediate=True):
+            cursor = self.connection.cursor()
+            if not self.randomized:
+                start = self._next_sequential_id(cursor)
+                ids = list(range(start, start + len(rows)))
+            else:
+                ids = self._random_ids(len(rows), cursor)
+            cursor.executemany(self._sql['insert_id'], zip(ids, rows))
+        self._invalidate((), changes)
         
-        Args:
-            object_or_id    Either an object with a valid "_id" key 
-                            or the object's id itself
-        """
+        for id, object in zip(ids, batch):
+            object[_ID_COLUMN] = id
+        return ids
         
-        deletion = object_or_id
-        if isinstance(deletion, dict):
-            deletion = object_or_id[_ID_COLUMN]
-
-        self.connection.execute("DELETE FROM {0} WHERE {1}=?".format(self.collection, _ID_COLUMN), (deletion,))
-        self.connection.commit()
+    def _next_sequential_id(self, cursor):
+        """Private computation of the next id SQLite's AUTOINCREMENT would assign"""
         
-    def find_one(self, field, value):
-        """Finds a single dictionary in the Collection that has a matching value for a specified key (field).
+        row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (self.collection,)).fetchone()
+        seq = row[0] if row is not None else 0
+        top = cursor.execute(self._sql['max_id']).fetchone()[0]
+        return max(seq, top or 0) + 1
         
-        Args:
-            field   The dictionary key being specified in the value
-                    argument
-                    
-            value   The value to search for in the specified dictionary 
-                    key
-                    
-        Notes:
-            See Collection.find_field for more information on behavior
-        """
+    def _encode_new(self, object):
+        """Private serializer for dictionaries that have not been stored yet"""
         
-        id = self.find_field(field, value)
+        if _ID_COLUMN in object:
+            if object[_ID_COLUMN] is None:
+                del object[_ID_COLUMN]
+            else:
+                raise ValueError("An object insert was attempted with a non-None id")
+                
+        return self._encode(object)
         
-        if len(id) == 0:
-            return None
-        else:
-            return self.get(id[0])
-    
-    def random_entries(self, count=1):
-        """Retrieve random dictionaries from the Collection
+    def _encode_stored(self, object):
+        """Private serializer for dictionaries with an id, which is not itself stored"""
         
-        Args:
-            count   The number of random dictionaries to retrieve, defaults to 1
-        """
+        return self._encode(dict((key, value) for key, value in object.items() if key != _ID_COLUMN))
         
-        entries = []
-        cursor = self.connection.cursor()
-        for row in cursor.execute("SELECT * FROM {0} ORDER BY RANDOM() LIMIT {1};".format(self.collection, count)):
-            toret = json.loads(row[1])
-            toret[_ID_COLUMN] = row[0]
-            entries.append(toret)
-
-        return entries    
-    
-    def random_entry(self):
-        """Retrieve a single random dictionary from the Collection"""
+    def _encode(self, object):
+        """Private serializer and compressor of a dictionary"""
         
-        entries = self.random_entries(1)
-        if len(entries) == 1:
-            return entries[0]
+        return self._compress(self.codec.encode(object))
         
-        return None
+    def _compress(self, data):
+        """Private compression of serialized data meeting the compression threshold"""
+        
+        if self._compressor is None:
+            return data
+        raw = data
+        if not isinstance(raw, bytes):
+            raw = raw.encode('utf-8')
+        if len(raw) < self.compression_threshold:
+            return data
+        return MAGIC + self._compressor.tag + self._compressor.compress(raw)
+        
+    def _decompress(self, data):
+        """Private decompression of stored data, returning uncompressed data unchanged"""
+        
+        if not isinstance(data, bytes) or data[:len(MAGIC)] != MAGIC:
+            return data
+        
+        decompressor = self._decompressor(data[len(MAGIC):len(MAGIC) + 1])
+        try:
+            raw = decompressor.decompress(data[len(MAGIC) + 1:])
+        except KeyError:
+            # A zstd dictionary trained through another connection
+            self._load_zstd_dictionaries(decompressor)
+            raw = decompressor.decompress(data[len(MAGIC) + 1:])
+            
+        if self.codec.binary:
+            return raw
+        return raw.decode('utf-8')
+        
+    def _decompressor(self, tag):
+        """Private lookup of the Compressor for a compressed value's tag"""
+        
+        if tag not in self._decompressors:
+            if self._compressor is not None and self._compressor.tag == tag:
+                self._decompressors[tag] = self._compressor
+            else:
+                decompressor = get_compressor_by_tag(tag)
+                if decompressor.name == ZstdCompressor.name:
+                    self._load_zstd_dictionaries(decompressor)
+                self._decompressors[tag] = decompressor
+        return self._decompressors[tag]
+        
+    def _load_zstd_dictionaries(self, compressor):
+        """Private loading of the Collection's trained zstd dictionaries into a ZstdCompressor"""
+        
+        metadata = self._database.metadata(self.collection, self.connection)
+        current = metadata.get(_ZSTD_DICTIONARY_KEY)
+        for key, value in metadata.items():
+            if not key.startswith(_ZSTD_DICTIONARY_KEY + '_'):
+                continue
+            dictionary = zstandard.ZstdCompressionDict(value)
+            compressor.dictionaries[dictionary.dict_id()] = dictionary
+            if key == "{0}_{1}".format(_ZSTD_DICTIONARY_KEY, current):
+                compressor.set_dictionary(dictionary)
+        
+    @instrumented
+    def recompress(self, batch_size=INSERT_BATCH_SIZE, train_dictionary=False, dictionary_size=ZSTD_DICTIONARY_SIZE):
+        """Rewrites every stored dictionary using the Collection's current compression
+        
+        Args:
+            batch_size      The number of dictionaries rewritten per 
+                            transaction, defaults to INSERT_BATCH_SIZE
+                            
+            train_dictionary
+                            If True, a new zstd dictionary is first trained 
+                            on a sample of the stored dictionaries and used 
+                            for all further compression.  Requires the
+                            'zstd' compressor, defaults to False
+                            
+            dictionary_size The size in bytes of a trained dictionary, 
+                            defaults to ZSTD_DICTIONARY_SIZE
+                            
+        Returns:
+            The number of stored dictionaries that were rewritten
+            
+        Notes:
+            This is used to compress a collection's existing dictionaries after
+            enabling compression, to change compressors, or, if the Collection
+            has no compression, to decompress every dictionary so that 
+            searches may again be performed within SQLite.
+        """
+        
+        self._create_table()
+        
+        if train_dictionary:
+            if self._compressor is None or self._compressor.name != ZstdCompressor.name:
+                raise ValueError("Training a dictionary requires the 'zstd' compressor")
+            self._train_zstd_dictionary(dictionary_size)
+        
+        rewritten = 0
+        last = None
+        while True:
+            with self.transaction():
+                cursor = self.connection.cursor()
+                if last is None:
+                    rows = cursor.execute(self._sql['first_batch'], (batch_size,)).fetchall()
+                else:
+                    rows = cursor.execute(self._sql['next_batch'], (last, batch_size)).fetchall()
+                    
+                updates = []
+                for id, data in rows:
+                    stored = self._compress(self._decompress(data))
+                    if stored != data:
+                        updates.append((stored, id))
+                cursor.executemany(self._sql['update'], updates)
+                rewritten += len(updates)
+                
+                if len(rows) < batch_size:
+                    if self._compressor is None:
+                        self._set_metadata(_COMPRESSED_KEY, '0')
+                        self._compressed = False
+                    break
+                last = rows[-1][0]
+                
+        return rewritten
+        
+    def _train_zstd_dictionary(self, size):
+        """Private training and recording of a new zstd dictionary from stored dictionaries"""
+        
+        samples = []
+        for row in self.connection.execute(self._sql['random_data'],
+                                           (ZSTD_SAMPLE_COUNT,)):
+            raw = self._decompress(row[0])
+            if not isinstance(raw, bytes):
+                raw = raw.encode('utf-8')
+            samples.append(raw)
+            
+        dictionary = train_zstd_dictionary(samples, size)
+        with self.transaction():
+            self._set_metadata("{0}_{1}".format(_ZSTD_DICTIONARY_KEY, dictionary.dict_id()), dictionary.as_bytes())
+            self._set_metadata(_ZSTD_DICTIONARY_KEY, str(dictionary.dict_id()))
+        self._compressor.set_dictionary(dictionary)
+        
+    @instrumented
+    def export_jsonl(self, path_or_file, batch_size=FETCH_BATCH_SIZE, progress=None):
+        """Writes every dictionary in the Collection, with its id, as one line of JSON
+        
+        Args:
+            path_or_file    A filename, or a file object open for writing 
+                            text
+                            
+            batch_size      The number of rows read from SQLite at a time,
+                            defaults to FETCH_BATCH_SIZE
+                            
+            progress        A function called with the number of 
+                            dictionaries written so far after each batch,
+                            defaults to None
+                            
+        Returns:
+            The number of dictionaries written
+            
+        Raises:
+            TypeError   This method will throw a TypeError if a dictionary
+                        stored with a binary codec holds a value that 
+                        cannot be written as JSON
+                        
+        Notes:
+            Only about batch_size rows are held in memory at any time.  The
+            dictionaries are read in id order within a single read 
+            transaction, so the export is a consistent snapshot.  Rows
+            stored as uncompressed JSON text are written without being 
+            decoded.
+        """
+        
+        count = 0
+        with _text_file(path_or_file, 'w') as file:
+            cursor = self.connection.cursor()
+            cursor.execute(self._sql['all'])
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if len(rows) == 0:
+                    break
+                file.writelines(self._export_line(id, data) for id, data in rows)
+                count += len(rows)
+                if progress is not None:
+                    progress(count)
+            cursor.close()
+        return count
+        
+    def _export_line(self, id, data):
+        """Private conversion of a stored row to a line of JSON"""
+        
+        if self.codec.json_text and not self._compressed:
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            # The stored text lacks only the id
+            if data.startswith('{') and '\n' not in data:
+                if data[1:].lstrip().startswith('}'):
+                    return '{{"{0}": {1}}}\n'.format(_ID_COLUMN, id)
+                return '{{"{0}": {1}, {2}\n'.format(_ID_COLUMN, id, data[1:])
+        d = self._decode(id, data)
+        return json.dumps(dict([(_ID_COLUMN, id)] + [(key, value) for key, value in d.items() if key != _ID_COLUMN])) + '\n'
+        
+    @instrumented
+    def import_jsonl(self, path_or_file, batch_size=INSERT_BATCH_SIZE, preserve_ids=False, progress=None):
+        """Inserts dictionaries read as lines of JSON, such as those written by Collection.export_jsonl
+        
+        Args:
+            path_or_file    A filename, or a file object open for reading
+                            text
+                            
+            batch_size      The number of dictionaries written per 
+                            transaction, defaults to INSERT_BATCH_SIZE
+                            
+            preserve_ids    If True, dictionaries keep the ids they were 
+                            read with, and only those without one are 
+                            assigned a new id, defaults to False
+                            
+            progress        A function called with the number of 
+                            dictionaries inserted so far after each batch,
+                            defaults to None
+                            
+        Returns:
+            The number of dictionaries inserted
+            
+        Raises:
+            ValueError  This method will throw a ValueError if a line is not
+                        a JSON object or batch_size is not positive
+                        
+            sqlite3.IntegrityError
+                        A preserved id must not already be in use.  Only 
+                        the batch containing the offending dictionary is 
+                        rolled back.
+                        
+        Notes:
+            Lines are read as they are inserted, so only about batch_size
+            dictionaries are held in memory at any time.  Blank lines are
+            skipped.  Called within Collection.transaction, the import is
+            committed or rolled back as a whole.
+        """
+        
+        self._create_table()
+        
+        if batch_size < 1:
+            raise ValueError("The batch size must be a positive integer")
+        # JSON codecs may parse faster than the json module
+        parse = self.codec.decode if self.codec.json_text else json.loads
+        
+        count = 0
+        with _text_file(path_or_file, 'r') as file:
+            lines = (line for line in file if not line.isspace())
+            while True:
+                batch = []
+                for line in itertools.islice(lines, batch_size):
+                    object = parse(line)
+                    if not isinstance(object, dict):
+                        raise ValueError("Each line must hold a JSON object")
+                    if not preserve_ids:
+                        object.pop(_ID_COLUMN, None)
+                    batch.append(object)
+                if len(batch) == 0:
+                    break
+                self._import_batch(batch)
+                count += len(batch)
+                if progress is not None:
+                    progress(count)
+        return count
+        
+    def _import_batch(self, batch):
+        """Private writer for a single batch of Collection.import_jsonl"""
+        
+        kept = [object for object in batch if object.get(_ID_COLUMN) is not None]
+        new = [object for object in batch if object.get(_ID_COLUMN) is None]
+        
+        changes = self.connection.total_changes
+        with self.transaction(immediate=True):
+            if len(kept) > 0:
+                self.connection.executemany(self._sql['insert_id'], ((object[_ID_COLUMN], self._encode_stored(object)) for object in kept))
+            if len(new) > 0:
+                self._insert_batch(new)
+        self._invalidate((), changes)
+        
+    def backup(self, dest, pages=BACKUP_PAGES, progress=None):
+        """Copies the entire database holding the Collection
+        
+        See Database.backup.  Every other Collection in the database is
+        copied as well.
+        """
+        
+        return self._database.backup(dest, pages, progress)
+        
+    @instrumented
+    def update(self, object):
+        """Updates an existing dictionary in the Collection
+        
+        Args:
+            object  A dictionary with a valid "_id" key, which will entirely
+                    replace the existing dictionary associated with the id
+                    
+        Raises:
+            ValueError  This method will throw a ValueError if an update is 
+                        attempted and the dictionary does not include an 
+                        already-existant id
+        """
+        
+        self._create_table()
+        
+        if not _ID_COLUMN in object.keys():
+            raise ValueError('Update called on a nonexistant db record')
+
+        id = object[_ID_COLUMN]
+        del object[_ID_COLUMN]
+        
+        str = self._encode(object)
+        
+        changes = self.connection.total_changes
+        self.connection.execute(self._sql['update'], (str, id))
+        self._commit()
+        self._invalidate((id,), changes)
+        
+        object[_ID_COLUMN] = id
+        
+        return object
+        
+    @instrumented
+    def update_fields(self, id, update):
+        """Changes keys of an existing dictionary in place with MongoDB-style update operators
+        
+        Args:
+            id      The id of the dictionary to update
+            
+            update  A dictionary mapping the operators $set, $unset, $inc, 
+                    $push, and $pull to dictionaries of keys, or dotted
+                    paths, and their operands
+                    
+        Returns:
+            1 if the dictionary was updated, or 0 if it doesn't exist
+            
+        Raises:
+            ValueError  This method will throw a ValueError if the update is
+                        malformed or an operator is applied to a value of 
+                        the wrong type
+                        
+        Notes:
+            See Collection.update_many.
+        """
+        
+        self._create_table()
+        
+        check_update(update)
+        return self._update("{0}=?".format(_ID_COLUMN), [id], None, update)
+        
+    @instrumented
+    def update_many(self, filter, update):
+        """Changes keys of every dictionary matching a filter with MongoDB-style update operators
+        
+        Args:
+            filter  A MongoDB-style filter dictionary, as in Collection.find
+            
+            update  A dictionary mapping operators to dictionaries of keys, 
+                    or dotted paths, and their operands.  See the notes.
+                    
+        Returns:
+            The number of dictionaries updated
+            
+        Raises:
+            ValueError  This method will throw a ValueError if the update is
+                        malformed or an operator is applied to a value of 
+                        the wrong type, in which case nothing is updated
+                        
+        Notes:
+            The operators are $set, which sets a value, $unset, which removes
+            a key, $inc, which adds to a number or sets a missing one, $push,
+            which appends a value, or each of {'$each': [...]}, to a list, 
+            and $pull, which removes the elements of a list equal to a value
+            or matching a condition.  Missing nested dictionaries are created
+            as in MongoDB, and a key may only be the subject of one operator.
+            
+            Where the filter and update can be evaluated by SQLite, the 
+            update is performed by a single UPDATE statement using its JSON
+            functions, without reading the dictionaries into Python.
+            Otherwise each matching dictionary is read, updated, and written
+            back within one transaction.
+        """
+        
+        self._create_table()
+        
+        check_update(update)
+        where, params, remaining = self._compile_filter(filter)
+        return self._update(where, params, remaining, update)
+        
+    def _update(self, where, params, remaining, update):
+        """Private update of the rows matching a compiled filter, returning the number updated"""
+        
+        expression = None
+        if remaining is None and self._sql_json:
+            try:
+                expression, update_params = compile_update(update, self.codec.encode)
+            except Unsupported:
+                pass
+                
+        changes = self.connection.total_changes
+        if expression is None:
+            ids = self._update_documents(where, params, remaining, update)
+            self._invalidate(ids, changes)
+            return len(ids)
+            
+        ids = None
+        cursor = self.connection.cursor()
+        try:
+            if self._cache is not None and _RETURNING:
+                cursor.execute(self._sql['update_where_returning'].format(expression, where), update_params + params)
+                ids = [row[0] for row in cursor.fetchall()]
+                updated = len(ids)
+            else:
+                cursor.execute(self._sql['update_where'].format(expression, where), update_params + params)
+                updated = cursor.rowcount
+        except sqlite3.OperationalError as e:
+            if str(e) != SQL_FAILURE_MESSAGE:
+                raise
+            raise ValueError("An update operator was applied to a value of the wrong type")
+        finally:
+            cursor.close()
+        self._commit()
+        self._invalidate(ids, changes)
+        
+        return updated
+        
+    def _update_documents(self, where, params, remaining, update):
+        """Private application of an update in Python, returning the ids updated"""
+        
+        sql = self._sql['select_where'].format(where)
+        with self.transaction(immediate=True):
+            rows = []
+            for d in self._iter_rows(sql, params):
+                if remaining is not None and not self._matches(d, remaining):
+                    continue
+                id = d.pop(_ID_COLUMN)
+                rows.append((self._encode(apply_update(d, update)), id))
+            self.connection.executemany(self._sql['update'], rows)
+        return [id for data, id in rows]
+        
+    @instrumented
+    def remove(self, object_or_id):
+        """Removes a dictionary from the Collection
+        
+        Args:
+            object_or_id    Either an object with a valid "_id" key 
+                            or the object's id itself
+        """
+        
+        self._create_table()
+        
+        deletion = _object_id(object_or_id)
+
+        changes = self.connection.total_changes
+        self.connection.execute(self._sql['remove'], (deletion,))
+        self._commit()
+        self._invalidate((deletion,), changes)
+        
+    @instrumented
+    def remove_many(self, ids_or_filter):
+        """Removes multiple dictionaries from the Collection in one transaction
+        
+        Args:
+            ids_or_filter   Either an iterable of ids, or of dictionaries with
+                            valid "_id" keys, or a MongoDB-style filter 
+                            dictionary as in Collection.find
+                            
+        Returns:
+            The number of dictionaries removed
+        """
+        
+        self._create_table()
+        
+        changes = self.connection.total_changes
+        with self.transaction(immediate=True):
+            if isinstance(ids_or_filter, dict):
+                removed = self._remove_matching(ids_or_filter)
+            else:
+                removed = self._remove_ids([_object_id(object_or_id) for object_or_id in ids_or_filter])
+        self._invalidate(removed, changes)
+        return len(removed)
+        
+    def _remove_ids(self, ids):
+        """Private deletion of ids in as few statements as possible, returning those that existed"""
+        
+        removed = []
+        ids = list(dict.fromkeys(ids))
+        sql = self._sql
+        cursor = self.connection.cursor()
+        for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            chunk = ids[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            if _RETURNING:
+                cursor.execute(sql['remove_in_returning'].format(placeholders), chunk)
+                removed.extend(row[0] for row in cursor.fetchall())
+            else:
+                removed.extend(row[0] for row in cursor.execute(sql['ids_in'].format(placeholders), chunk).fetchall())
+                cursor.execute(sql['remove_in'].format(placeholders), chunk)
+        cursor.close()
+        return removed
+        
+    def _remove_matching(self, filter):
+        """Private deletion of the dictionaries matching a filter, returning their ids"""
+        
+        where, params, remaining = self._compile_filter(filter)
+        if remaining is None and _RETURNING:
+            cursor = self.connection.execute(self._sql['remove_where_returning'].format(where), params)
+            return [row[0] for row in cursor.fetchall()]
+            
+        if remaining is None:
+            ids = [row[0] for row in self.connection.execute(self._sql['ids_where'].format(where), params)]
+        else:
+            sql = self._sql['select_where'].format(where)
+            ids = [d[_ID_COLUMN] for d in self._iter_rows(sql, params) if self._matches(d, remaining)]
+        return self._remove_ids(ids)
+        
+    @instrumented
+    def upsert(self, object, key_field=None):
+        """Inserts a dictionary, or replaces the stored dictionary it matches
+        
+        Args:
+            object      The dictionary to store
+            
+            key_field   The key identifying the stored dictionary to 
+                        replace, defaults to None ("_id")
+                        
+        Returns:
+            The dictionary, with its "_id" key set as with Collection.insert
+            
+        Raises:
+            ValueError  This method will throw a ValueError if key_field is
+                        given and the dictionary has an id or lacks a 
+                        number, string, or boolean value for the key
+                        
+        Notes:
+            Without key_field, a dictionary with an id replaces the stored
+            dictionary with that id, or is inserted with that id, while one
+            without an id is inserted.  With key_field, the dictionary 
+            replaces the first stored dictionary, by id, having an equal 
+            value for the key, which may be a dotted path.  If the key has 
+            a unique index, the dictionary is written with a single
+            "INSERT ... ON CONFLICT DO UPDATE" statement.
+        """
+        
+        self._create_table()
+        
+        changes = self.connection.total_changes
+        with self.transaction(immediate=True):
+            ids = self._upsert_batch([object], key_field)
+        self._invalidate(ids, changes)
+        return object
+        
+    def _upsert_batch(self, objects, key_field):
+        """Private upsert of dictionaries within a transaction, returning their ids"""
+        
+        cursor = self.connection.cursor()
+        if key_field is None or key_field == _ID_COLUMN:
+            rows = [(object[_ID_COLUMN], self._encode_stored(object)) for object in objects if object.get(_ID_COLUMN) is not None]
+            cursor.executemany(self._sql['upsert_id'], rows)
+            new = [object for object in objects if object.get(_ID_COLUMN) is None]
+            if len(new) > 0:
+                self._insert_batch(new)
+            return [object[_ID_COLUMN] for object in objects]
+            
+        path = json_path(key_field)
+        for object in objects:
+            if object.get(_ID_COLUMN) is not None:
+                raise ValueError("An upsert by '{0}' was attempted with a non-None id".format(key_field))
+            if _key_value(object, key_field) is None:
+                raise ValueError("An upsert requires a number, string, or boolean '{0}'".format(key_field))
+        rows = [self._encode_new(object) for object in objects]
+        
+        # New ids for randomized Collections are drawn up front, while the
+        # write lock is held
+        new_ids = [None] * len(objects)
+        if self.randomized:
+            new_ids = self._random_ids(len(objects), cursor)
+        insert = self._sql['insert_id']
+        
+        found = None
+        if self._sql_json and path is not None:
+            unique = [index['field'] for index in self.list_indexes() if index['unique']]
+            if key_field in unique and '.' not in key_field and _RETURNING:
+                sql = "{0} ON CONFLICT(json_extract({1}, {2})) DO UPDATE SET {1}=excluded.{1} RETURNING {3}".format(insert, _DATA_COLUMN, _sql_string(path), _ID_COLUMN)
+                for object, id, data in zip(objects, new_ids, rows):
+                    object[_ID_COLUMN] = cursor.execute(sql, (id, data)).fetchone()[0]
+                return [object[_ID_COLUMN] for object in objects]
+                
+            value, value_type, path = field_expressions(key_field)
+            if len(objects) == 1 or (key_field in self._indexed_fields() and '.' not in key_field):
+                lookup = "SELECT {0} FROM {1} WHERE {2} = ? AND {3} IN {{0}} ORDER BY {0} LIMIT 1".format(_ID_COLUMN, self._table, value, value_type)
+            else:
+                # Without an index, each lookup of a batch would read every
+                # row, so the keys in use are all read at once without decoding
+                found = {}
+                sql = "SELECT {0},{1},{2} FROM {3} WHERE {1} IN ('integer', 'real', 'text', 'true', 'false') ORDER BY {0} DESC".format(_ID_COLUMN, value_type, value, self._table)
+                for id, stored_type, stored in cursor.execute(sql).fetchall():
+                    if stored_type in ('true', 'false'):
+                        stored = bool(stored)
+                    found[(_bracket(stored), stored)] = id
+        else:
+            # Every stored dictionary is read once to find the keys in use
+            found = {}
+            for d in self._iter_rows(self._sql['all']):
+                key = _key_value(d, key_field)
+                if key is not None and key not in found:
+                    found[key] = d[_ID_COLUMN]
+            
+        for object, id, data in zip(objects, new_ids, rows):
+            key = _key_value(object, key_field)
+            if found is None:
+                row = cursor.execute(lookup.format(_SQL_TYPES[key[0]]), (_sql_operand(key[1]),)).fetchone()
+                existing = None if row is None else row[0]
+            else:
+                existing = found.get(key)
+                
+            if existing is not None:
+                cursor.execute(self._sql['update'], (data, existing))
+                object[_ID_COLUMN] = existing
+            else:
+                cursor.execute(insert, (id, data))
+                object[_ID_COLUMN] = cursor.lastrowid
+                if found is not None:
+                    found[key] = cursor.lastrowid
+        return [object[_ID_COLUMN] for object in objects]
+        
+    @instrumented
+    def bulk_write(self, operations):
+        """Performs a sequence of writes in a single transaction
+        
+        Args:
+            operations  A list of tuples, each naming a Collection method
+                        followed by its arguments: ('insert', object), 
+                        ('update', object), ('update_fields', id, update),
+                        ('update_many', filter, update), ('upsert', object),
+                        ('upsert', object, key_field), ('remove', 
+                        object_or_id), or ('remove_many', ids_or_filter)
+                        
+        Returns:
+            A list with the result of each operation as returned by the 
+            method, except that removals return the number removed
+            
+        Raises:
+            ValueError  This method will throw a ValueError if an operation
+                        is unknown, along with any exception raised by an
+                        operation, in which case no operation is performed
+                        
+        Notes:
+            Consecutive inserts, removals, and upserts with the same 
+            key_field are each performed together with as few statements
+            as possible.
+        """
+        
+        self._create_table()
+        
+        operations = list(operations)
+        for operation in operations:
+            if operation[0] not in _BULK_OPERATIONS:
+                raise ValueError("Unknown bulk operation '{0}'".format(operation[0]))
+                
+        results = []
+        changes = self.connection.total_changes
+        written = []
+        with self.transaction(immediate=True):
+            for kind, group in itertools.groupby(operations, key=_bulk_group):
+                group = list(group)
+                if kind[0] == 'insert':
+                    objects = [operation[1] for operation in group]
+                    for i in range(0, len(objects), INSERT_BATCH_SIZE):
+                        self._insert_batch(objects[i:i + INSERT_BATCH_SIZE])
+                    results.extend(objects)
+                elif kind[0] == 'remove':
+                    ids = [_object_id(operation[1]) for operation in group]
+                    removed = set(self._remove_ids(ids))
+                    written.extend(removed)
+                    for id in ids:
+                        results.append(1 if id in removed else 0)
+                        removed.discard(id)
+                elif kind[0] == 'upsert':
+                    objects = [operation[1] for operation in group]
+                    written.extend(self._upsert_batch(objects, kind[1]))
+                    results.extend(objects)
+                else:
+                    for operation in group:
+                        results.append(getattr(self, operation[0])(*operation[1:]))
+        self._invalidate(written, changes)
+        
+        return results
+        
+    @instrumented
+    def find_one(self, field, value):
+        """Finds a single dictionary in the Collection that has a matching value for a specified key (field).
+        
+        Args:
+            field   The dictionary key being specified in the value
+                    argument
+                    
+            value   The value to search for in the specified dictionary 
+                    key
+                    
+        Notes:
+            See Collection.find_field for more information on behavior
+        """
+        
+        id = self._find_ids(field, value, limit=1)
+        
+        if len(id) == 0:
+            return None
+        else:
+            return self.get(id[0])
+    
+    @instrumented
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=None):
+        """Finds the dictionaries in the Collection matching a MongoDB-style filter
+        
+        Args:
+            filter      A dictionary of conditions, defaults to None (all
+                        dictionaries match).  See the notes below.
+                        
+            projection  Either a sequence of keys to retrieve, as with 
+                        fields elsewhere, or a MongoDB-style dictionary of
+                        keys mapped to 1 to include or 0 to exclude, 
+                        defaults to None (all keys)
+                        
+            sort        A list of (key, direction) pairs, where direction is
+                        ASCENDING or DESCENDING, defaults to None (id order)
+                        
+            skip        The number of matching dictionaries to skip, 
+                        defaults to 0
+                        
+            limit       The maximum number of dictionaries to return,
+                        defaults to None (no limit)
+                        
+        Returns:
+            A list of matching dictionaries
+            
+        Raises:
+            ValueError  This method will throw a ValueError if the filter
+                        uses an unknown operator
+                        
+        Notes:
+            Filters map keys, or dotted paths into nested dictionaries, to a
+            value or a dictionary of operators, as in MongoDB.  The operators 
+            $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $and and $or
+            are evaluated within SQLite where possible.  The operators $not,
+            $nor, $size, $all and $regex, and conditions on lists or 
+            dictionaries, are evaluated in Python.  Values are only equal to,
+            or ordered with, values of the same type, and a list matches if 
+            any of its elements matches.
+        """
+        
+        return list(self.iter_find(filter, projection, sort, skip, limit))
+        
+    @instrumented
+    def iter_find(self, filter=None, projection=None, sort=None, skip=0, limit=None, batch_size=FETCH_BATCH_SIZE):
+        """Iterates over the dictionaries in the Collection matching a filter
+        
+        Accepts the same arguments as Collection.find, plus batch_size, the
+        number of rows read from SQLite at a time.  If any of the filter or 
+        sort must be evaluated in Python, dictionaries are decoded before 
+        being filtered, and sorting holds every matching dictionary.
+        """
+        
+        where, params, remaining = self._compile_filter(filter)
+        
+        sort = _sort_terms(sort)
+        order = self._order_by(sort)
+        sql = self._sql['select_where'].format(where)
+        if order is not None:
+            sql = sql + " ORDER BY " + order
+            
+        if remaining is None and order is not None:
+            if limit is not None or skip:
+                sql = sql + " LIMIT ? OFFSET ?"
+                params = params + [-1 if limit is None else limit, skip]
+            for d in self._iter_rows(sql, params, batch_size=batch_size):
+                yield project(d, projection)
+            return
+            
+        entries = self._iter_rows(sql, params, batch_size=batch_size)
+        if remaining is not None:
+            entries = (d for d in entries if self._matches(d, remaining))
+        if order is None:
+            entries = iter(_sort_documents(list(entries), sort))
+        
+        stop = None
+        if limit is not None:
+            stop = skip + limit
+        for d in itertools.islice(entries, skip, stop):
+            yield project(d, projection)
+            
+    @instrumented
+    def find_page(self, filter=None, projection=None, sort=None, limit=100, after=None):
+        """Retrieves one page of the dictionaries matching a filter
+        
+        Args:
+            filter      A MongoDB-style filter dictionary, defaults to None
+                        (all dictionaries match).  See Collection.find.
+                        
+            projection  The keys to retrieve, as with Collection.find,
+                        defaults to None (all keys)
+                        
+            sort        A list of (key, direction) pairs, where direction is
+                        ASCENDING or DESCENDING, defaults to None (id order)
+                        
+            limit       The maximum number of dictionaries on the page, 
+                        defaults to 100
+                        
+            after       The token returned with the previous page, defaults
+                        to None (the first page)
+                        
+        Returns:
+            A tuple of the list of dictionaries on the page and a token for
+            the next page, or None if this is the last page
+            
+        Raises:
+            ValueError  This method will throw a ValueError if the token 
+                        is invalid or was returned by a different sort, or
+                        if the sort cannot be performed by SQLite
+                        
+        Notes:
+            Rather than skipping the preceding rows, each page continues 
+            from the sort values of the last dictionary on the previous 
+            page, so every page costs about the same to retrieve.  An index
+            on the first sort key avoids sorting the matching rows.
+            Dictionaries inserted or changed between requests may be 
+            included or missed, as with any cursor.
+        """
+        
+        if limit < 1:
+            raise ValueError("The page limit must be at least 1")
+        where, params, remaining = self._compile_filter(filter)
+        
+        sort = _sort_terms(sort)
+        keys = self._sort_keys(sort)
+        if keys is None:
+            raise ValueError("Collection {0} can only be paged by {1}".format(self.collection, _ID_COLUMN))
+        if after is None:
+            segments = [("1", [], keys)]
+        else:
+            segments = _seek_segments(keys, _page_values(after, sort, len(keys)))
+            
+        entries = []
+        last = None
+        more = False
+        cursor = self.connection.cursor()
+        for seek, seek_params, order in segments:
+            sql = "SELECT {0},{1},{2} FROM {3} WHERE ({4}) AND ({5}) ORDER BY {6}".format(_ID_COLUMN, _DATA_COLUMN,
+                    ",".join(expression for expression, direction in keys), self._table, where, seek,
+                    ", ".join("{0} {1}".format(expression, direction) for expression, direction in order))
+            segment_params = params + seek_params
+            if remaining is None:
+                sql = sql + " LIMIT ?"
+                segment_params = segment_params + [limit + 1 - len(entries)]
+            
+            cursor.execute(sql, segment_params)
+            while not more:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    d = self._decode(row[0], row[1])
+                    if remaining is not None and not self._matches(d, remaining):
+                        continue
+                    if len(entries) == limit:
+                        more = True
+                        break
+                    entries.append(project(d, projection))
+                    last = row[2:]
+            if more:
+                break
+        cursor.close()
+        
+        token = None
+        if more:
+            token = _page_token(sort, last)
+        return (entries, token)
+        
+    def _compile_filter(self, filter):
+        """Private translation of a filter into SQL, see sostore.query.compile_filter"""
+        
+        if filter is None:
+            filter = {}
+        indexed = ()
+        if self._sql_json:
+            # A dotted key in a filter is a path into nested dictionaries,
+            # which an index on a key containing a dot, made by an earlier
+            # version, cannot serve
+            indexed = set(field for field in self._indexed_fields() if '.' not in field)
+        return compile_filter(filter, self._table, indexed, self._sql_json)
+        
+    def _order_by(self, sort):
+        """Private SQL ORDER BY terms for a normalized sort, or None if it can only be performed in Python"""
+        
+        keys = self._sort_keys(sort)
+        if keys is None:
+            return None
+        return ", ".join("{0} {1}".format(expression, direction) for expression, direction in keys)
+        
+    def _sort_keys(self, sort):
+        """Private list of (SQL expression, direction) for a normalized sort ending with the id, or None"""
+        
+        keys = []
+        for field, direction in sort:
+            if field == _ID_COLUMN:
+                # Ids are unique, so any later keys are irrelevant
+                keys.append((_ID_COLUMN, direction))
+                return keys
+            if not self._sql_json:
+                return None
+            try:
+                value, type, path = field_expressions(field)
+            except Unsupported:
+                return None
+            keys.append((value, direction))
+        # Ties are broken in the direction of the last key, so that a sort 
+        # on one indexed key can read the index in either direction
+        if len(keys) > 0:
+            keys.append((_ID_COLUMN, keys[-1][1]))
+        else:
+            keys.append((_ID_COLUMN, ASCENDING))
+        return keys
+    
+    @instrumented
+    def count_documents(self, filter=None):
+        """Counts the dictionaries in the Collection matching a filter
+        
+        Args:
+            filter  A MongoDB-style filter dictionary, as in Collection.find,
+                    defaults to None (all dictionaries)
+                    
+        Notes:
+            Where the filter can be evaluated by SQLite, no dictionaries are
+            read into Python.  Collection.count remains the fastest way to 
+            count every dictionary.
+        """
+        
+        where, params, remaining = self._compile_filter(filter)
+        if remaining is not None:
+            sql = self._sql['select_where'].format(where)
+            return sum(1 for d in self._iter_rows(sql, params) if self._matches(d, remaining))
+        return self.connection.execute(self._sql['count_where'].format(where), params).fetchone()[0]
+        
+    @instrumented
+    def distinct(self, field, filter=None):
+        """Lists the distinct values of a key in the Collection
+        
+        Args:
+            field   The key, or a dotted path into nested dictionaries
+            
+            filter  A MongoDB-style filter dictionary restricting the 
+                    dictionaries considered, defaults to None (all)
+                    
+        Returns:
+            A list of values in SQLite's sort order
+            
+        Notes:
+            Values are compared as SQLite extracts them from JSON, so true
+            and false are returned as 1 and 0, and lists and dictionaries as
+            JSON text.  Missing and null values are left out.  An index on
+            the key lets SQLite read the values from the index alone.
+        """
+        
+        results = self.aggregate(filter, [field], {})
+        return [result[field] for result in results if result[field] is not None]
+        
+    @instrumented
+    def aggregate(self, match=None, group_by=None, metrics=None):
+        """Summarizes groups of dictionaries in the Collection
+        
+        Args:
+            match       A MongoDB-style filter dictionary restricting the 
+                        dictionaries summarized, defaults to None (all)
+                        
+            group_by    A key, or list of keys or dotted paths, whose 
+                        values form the groups, defaults to None (a single
+                        group of every matching dictionary)
+                        
+            metrics     A dictionary mapping result names to a tuple of a
+                        function, one of "count", "sum", "avg", "min", or 
+                        "max", and the key it summarizes.  "count" may be 
+                        given alone to count dictionaries, or with a key to
+                        count those with a non-null value.  Defaults to 
+                        {"count": "count"}.
+                        
+        Returns:
+            A list of dictionaries, one per group in SQLite's sort order 
+            of the group_by keys, holding each group_by key's value and 
+            each metric
+            
+        Raises:
+            ValueError  This method will throw a ValueError if a metric is
+                        malformed
+                        
+        Notes:
+            Where possible, the aggregation is performed by a single SQL 
+            query grouping on json_extract(), so only the results are read
+            into Python.  Group values are those SQLite extracts, as with
+            Collection.distinct.  Sums and averages include only numbers,
+            and a sum of no numbers is 0.  Minimums and maximums follow 
+            SQLite's ordering of values.
+        """
+        
+        if group_by is None:
+            group_by = []
+        elif isinstance(group_by, str):
+            group_by = [group_by]
+        metrics = _metric_specifications(metrics)
+        
+        where, params, remaining = self._compile_filter(match)
+        if remaining is None and self._sql_json:
+            try:
+                return self._aggregate_sql(where, params, group_by, metrics)
+            except Unsupported:
+                pass
+        
+        sql = self._sql['select_where'].format(where)
+        entries = self._iter_rows(sql, params)
+        if remaining is not None:
+            entries = (d for d in entries if self._matches(d, remaining))
+        return _aggregate_documents(entries, group_by, metrics)
+        
+    def _aggregate_sql(self, where, params, group_by, metrics):
+        """Private aggregation by a single GROUP BY query, raising Unsupported if a key cannot be expressed"""
+        
+        columns = [_field_sql(field)[0] for field in group_by]
+        for name, function, field in metrics:
+            if field is None:
+                columns.append("COUNT(*)")
+                continue
+            value, number = _field_sql(field)
+            if function == 'count':
+                columns.append("COUNT({0})".format(value))
+            elif function in ('sum', 'avg'):
+                numbers = "CASE WHEN {0} THEN {1} END".format(number, value)
+                if function == 'sum':
+                    columns.append("COALESCE(SUM({0}), 0)".format(numbers))
+                else:
+                    columns.append("AVG({0})".format(numbers))
+            else:
+                columns.append("{0}({1})".format(function.upper(), value))
+                
+        sql = "SELECT {0} FROM {1} WHERE {2}".format(",".join(columns), self._table, where)
+        if len(group_by) > 0:
+            positions = ",".join(str(i + 1) for i in range(len(group_by)))
+            sql = sql + " GROUP BY {0} ORDER BY {0}".format(positions)
+            
+        names = list(group_by) + [name for name, function, field in metrics]
+        return [dict(zip(names, row)) for row in self.connection.execute(sql, params)]
+        
+    @instrumented
+    def random_entries(self, count=1):
+        """Retrieve random dictionaries from the Collection
+        
+        Args:
+            count   The number of random dictionaries to retrieve, defaults to 1
+            
+        Notes:
+            See Collection.sample for more information on behavior
+        """
+        
+        return self.sample(count)
+        
+    @instrumented
+    def sample(self, count, fields=None, filter=None):
+        """Retrieves distinct dictionaries chosen uniformly at random from the Collection
+        
+        Args:
+            count   The number of dictionaries to retrieve.  Fewer are 
+                    returned if the Collection doesn't hold enough.
+                    
+            fields  The subset of keys to retrieve for each dictionary, 
+                    defaults to None (all keys)
+                    
+            filter  A function that accepts a dictionary and returns True
+                    if it may be sampled, defaults to None (all 
+                    dictionaries may be sampled)
+                    
+        Notes:
+            Dictionaries are chosen by id, so only about count rows are read
+            rather than the entire Collection.  Ids are drawn from the range
+            of ids in use when they are mostly contiguous.  Otherwise, as in
+            randomized collections, ids are found by their position in id
+            order, which reads the Collection's ids but not its 
+            dictionaries, unless Collection.create_sample_index has been
+            called.
+            
+            With a filter, dictionaries are read until enough have matched,
+            so a filter matching few dictionaries may read most of the 
+            Collection.
+        """
+        
+        if count <= 0 or not self._table_exists():
+            return []
+            
+        if self._has_positions():
+            return self._sample_positions(count, fields, filter)
+        if filter is None and not self.randomized:
+            entries = self._sample_range(count, fields)
+            if entries is not None:
+                return entries
+        return self._sample_ids(count, fields, filter)
+        
+    def _sample_range(self, count, fields):
+        """Private sampling by drawing ids from the range in use, or None if too few ids exist in the range"""
+        
+        cursor = self.connection.cursor()
+        lowest, highest = cursor.execute(self._sql['id_range']).fetchone()
+        if lowest is None:
+            return []
+        span = highest - lowest + 1
+        if span < count:
+            return None
+            
+        found = []
+        tried = set()
+        while len(found) < count:
+            if len(tried) >= SAMPLE_PROBE_FACTOR * count or len(tried) == span:
+                return None
+                
+            # Extra ids are drawn to allow for gaps, and the surplus found is
+            # discarded in the order drawn so that the choice stays uniform
+            drawn = []
+            while len(drawn) < 2 * (count - len(found)) and len(tried) < span:
+                id = random.randint(lowest, highest)
+                if id not in tried:
+                    tried.add(id)
+                    drawn.append(id)
+            
+            rows = self._select_ids(cursor, drawn)
+            found.extend((id, rows[id]) for id in drawn if id in rows)
+            
+        return [self._decode(id, data, fields) for id, data in found[:count]]
+        
+    def _sample_ids(self, count, fields, filter):
+        """Private sampling by drawing positions in id order, for Collections without a sample index"""
+        
+        cursor = self.connection.cursor()
+        if filter is None:
+            total = cursor.execute(self._sql['count']).fetchone()[0]
+            drawn = random.sample(range(total), min(count, total))
+            if len(drawn) <= SAMPLE_OFFSET_LIMIT:
+                # Another connection may have removed dictionaries since
+                found = (cursor.execute(self._sql['id_at'], (offset,)).fetchone() for offset in drawn)
+                ids = [row[0] for row in found if row is not None]
+            else:
+                ids = self._ids_at(cursor, drawn)
+            rows = self._select_ids(cursor, ids)
+            return [self._decode(id, rows[id], fields) for id in ids if id in rows]
+            
+        ids = [row[0] for row in cursor.execute(self._sql['ids'])]
+        order = (ids[i] for i in _shuffled_range(0, len(ids)))
+        return self._sample_filtered(cursor, order, lambda drawn: drawn, count, fields, filter)
+        
+    def _ids_at(self, cursor, offsets):
+        """Private lookup of the ids at offsets in id order, in the order given, reading the ids once"""
+        
+        wanted = set(offsets)
+        last = max(offsets)
+        found = {}
+        for offset, row in enumerate(cursor.execute(self._sql['ids'])):
+            if offset in wanted:
+                found[offset] = row[0]
+            if offset == last:
+                break
+        return [found[offset] for offset in offsets if offset in found]
+        
+    def _sample_positions(self, count, fields, filter):
+        """Private sampling by drawing positions from the Collection's table of ids by position"""
+        
+        positions = _quote_identifier(self._positions_table())
+        
+        cursor = self.connection.cursor()
+        total = cursor.execute("SELECT MAX(pos) FROM {0}".format(positions)).fetchone()[0] or 0
+        
+        if filter is None:
+            drawn = random.sample(range(1, total + 1), min(count, total))
+            ids = self._positions_to_ids(cursor, drawn)
+            rows = self._select_ids(cursor, ids)
+            return [self._decode(id, rows[id], fields) for id in ids if id in rows]
+        
+        return self._sample_filtered(cursor, _shuffled_range(1, total + 1), lambda drawn: self._positions_to_ids(cursor, drawn),
+                                     count, fields, filter)
+        
+    def _sample_filtered(self, cursor, order, to_ids, count, fields, filter):
+        """Private sampling of dictionaries passing a filter
+        
+        Args:
+            cursor  The cursor reading the dictionaries
+            
+            order   An iterator over the candidates in random order
+            
+            to_ids  A function returning the ids of a list of candidates
+            
+            count, fields, and filter are those of Collection.sample
+        """
+        
+        # Candidates are drawn in batches until enough dictionaries pass
+        # the filter
+        entries = []
+        while len(entries) < count:
+            drawn = list(itertools.islice(order, 2 * (count - len(entries))))
+            if len(drawn) == 0:
+                break
+            ids = to_ids(drawn)
+            rows = self._select_ids(cursor, ids)
+            for id in ids:
+                if id in rows:
+                    d = self._decode(id, rows[id])
+                    with self._phase('filter'):
+                        kept = filter(d)
+                    if kept:
+                        if fields is not None:
+                            d = dict((key, value) for key, value in d.items() if key in fields)
+                        entries.append(d)
+                        if len(entries) == count:
+                            break
+        return entries
+        
+    def _select_ids(self, cursor, ids):
+        """Private lookup of stored data for ids, returned as a dictionary keyed by id"""
+        
+        rows = {}
+        select = self._sql['get_in']
+        for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            chunk = ids[i:i + SQLITE_MAX_VARIABLES]
+            for row in cursor.execute(select.format(",".join("?" * len(chunk))), chunk):
+                rows[row[0]] = row[1]
+        return rows
+        
+    def _positions_to_ids(self, cursor, drawn):
+        """Private lookup of the ids at positions, in the order drawn"""
+        
+        ids = {}
+        positions = _quote_identifier(self._positions_table())
+        for i in range(0, len(drawn), SQLITE_MAX_VARIABLES):
+            chunk = drawn[i:i + SQLITE_MAX_VARIABLES]
+            for row in cursor.execute("SELECT pos, id FROM {0} WHERE pos IN ({1})".format(positions, ",".join("?" * len(chunk))), chunk):
+                ids[row[0]] = row[1]
+        return [ids[pos] for pos in drawn if pos in ids]
+        
+    def _positions_table(self):
+        """Private name of the table of the Collection's ids by position"""
+        
+        return "sostore_positions_{0}".format(self.collection)
+        
+    def _has_positions(self):
+        """Private check for the table of the Collection's ids by position"""
+        
+        return self._database.has_table(self._positions_table(), self.connection)
+        
+    @instrumented
+    def create_sample_index(self):
+        """Maintains a table of the Collection's ids by position, so that sampling reads only the dictionaries chosen
+        
+        Notes:
+            Without the index, sampling a randomized Collection, or one 
+            with many dictionaries removed, reads every id in the 
+            Collection.  The index is kept up to date by SQLite triggers,
+            which add a little work to every insert and removal.  Creating
+            an index that already exists has no effect.
+        """
+        
+        self._create_table()
+        self._create_positions()
+        
+    @instrumented
+    def drop_sample_index(self):
+        """Removes the table of the Collection's ids by position, if one exists"""
+        
+        with self.transaction():
+            cursor = self.connection.cursor()
+            for action in ('insert', 'delete'):
+                cursor.execute("DROP TRIGGER IF EXISTS {0}".format(_quote_identifier(self._positions_table() + "_" + action)))
+            cursor.execute("DROP TABLE IF EXISTS {0}".format(_quote_identifier(self._positions_table())))
+        self._database.discard_table(self._positions_table())
+        
+    def _create_positions(self):
+        """Private creation of the table of ids by position, maintained by triggers
+        
+        Positions run contiguously from 1 to the number of dictionaries.  
+        When a dictionary is removed, the dictionary in the last position 
+        is moved into its place.
+        """
+        
+        if self._has_positions():
+            return
+            
+        table = self._table
+        positions = _quote_identifier(self._positions_table())
+        with self.transaction(immediate=True):
+            cursor = self.connection.cursor()
+            cursor.execute("CREATE TABLE IF NOT EXISTS {0}(pos INTEGER PRIMARY KEY, id INTEGER NOT NULL UNIQUE)".format(positions))
+            cursor.execute("DELETE FROM {0}".format(positions))
+            cursor.execute("INSERT INTO {0}(id) SELECT {1} FROM {2} ORDER BY {1}".format(positions, _ID_COLUMN, table))
+            cursor.execute("CREATE TRIGGER IF NOT EXISTS {0} AFTER INSERT ON {1} BEGIN "
+                           "INSERT INTO {2}(id) VALUES(NEW.{3}); "
+                           "END".format(_quote_identifier(self._positions_table() + "_insert"), table, positions, _ID_COLUMN))
+            cursor.execute("CREATE TRIGGER IF NOT EXISTS {0} AFTER DELETE ON {1} BEGIN "
+                           "UPDATE {2} SET pos = -pos WHERE id = OLD.{3}; "
+                           "UPDATE {2} SET pos = (SELECT -pos FROM {2} WHERE id = OLD.{3}) "
+                           "WHERE pos = (SELECT MAX(pos) FROM {2}) AND pos > (SELECT -pos FROM {2} WHERE id = OLD.{3}); "
+                           "DELETE FROM {2} WHERE id = OLD.{3}; "
+                           "END".format(_quote_identifier(self._positions_table() + "_delete"), table, positions, _ID_COLUMN))
+        self._database.add_table(self._positions_table(), self.connection)
+    
+    @instrumented
+    def random_entry(self):
+        """Retrieve a single random dictionary from the Collection"""
+        
+        entries = self.random_entries(1)
+        if len(entries) == 1:
+            return entries[0]
+        
+        return None
     
+    @instrumented
     def find_field(self, field, value, compare_function=None):
         """Finds id's of dictionaries in the Collection that have a matching value for a specified key (field).
         
@@ -311,28 +2293,850 @@ class Collection():
             an integer, a conversion will be attempted during matching.
         """
         
-        fieldsearch = self.all(fields=(_ID_COLUMN, field))
+        return self._find_ids(field, value, compare_function)
+        
+    def _find_ids(self, field, value, compare_function=None, limit=None):
+        """Private implementation of Collection.find_field, stopping after limit matches"""
+        
+        if compare_function is None:
+            query = self._match_clause(field, value)
+            if query is not None:
+                sql, params = query
+                if limit is not None:
+                    sql = sql + " LIMIT {0:d}".format(limit)
+                cursor = self.connection.cursor()
+                return [row[0] for row in cursor.execute(sql, params)]
+        
+        candidates = _match_candidates(value)
         matching = []
-        for d in fieldsearch:
-            
-            if not field in d.keys():
-                continue
+        for d in self.iter_all(fields=(_ID_COLUMN, field)):
+            with self._phase('filter'):
+                if not field in d.keys():
+                    continue
                 
-            matched = False
-            if isinstance(d[field], collections.Iterable) and not isinstance(d[field], str):
-                if compare_function is not None:
-                    for stored_value in d[field]:                    
-                        matched = matched or compare_function(value, stored_value)
-                else:
-                    matched = value in d[field]
+                matched = False
+                if isinstance(d[field], Iterable) and not isinstance(d[field], str):
+                    if compare_function is not None:
+                        for stored_value in d[field]:                    
+                            matched = matched or compare_function(value, stored_value)
+                    else:
+                        # Dictionaries are matched on their keys, listed so
+                        # that unhashable candidates can be compared
+                        stored = d[field]
+                        if isinstance(stored, dict):
+                            stored = list(stored)
+                        matched = any(candidate in stored for candidate in candidates)
                                         
-            elif compare_function is not None:
-                matched = compare_function(value, d[field])
+                elif compare_function is not None:
+                    matched = compare_function(value, d[field])
             
-            else:
-                matched = (value == d[field])
+                else:
+                    matched = d[field] in candidates
                 
             if matched:
                 matching.append(d[ID_KEY])
+                if limit is not None and len(matching) >= limit:
+                    break
                 
         return matching
+        
+    @property
+    def _sql_json(self):
+        """True if stored dictionaries can be read by SQLite's JSON functions"""
+        
+        return self.codec.json_text and not self._compressed and self._json_supported
+        
+    @property
+    def _json_supported(self):
+        """True if the connection's SQLite library provides the JSON1 functions"""
+        
+        if not hasattr(self, '_json1'):
+            try:
+                self.connection.execute("SELECT json_extract('{}', '$.a')")
+                self._json1 = True
+            except sqlite3.OperationalError:
+                self._json1 = False
+        return self._json1
+        
+    def _match_clause(self, field, value):
+        """Private compiler of a find_field match into SQL
+        
+        Returns:
+            A tuple of an SQL SELECT statement returning matching ids and 
+            its parameters, or None if the match can only be performed in 
+            Python
+        """
+        
+        if not isinstance(value, _SQL_SCALARS):
+            return None
+        if isinstance(value, int) and not _SQL_INT_MIN <= value <= _SQL_INT_MAX:
+            return None
+            
+        candidates = _match_candidates(value)
+        placeholders = ",".join("?" * len(candidates))
+        select = "SELECT {0} FROM {1} WHERE ".format(_ID_COLUMN, self._table)
+        
+        if field == _ID_COLUMN:
+            return (select + "{0} IN ({1})".format(_ID_COLUMN, placeholders), candidates)
+            
+        if not self._sql_json:
+            return None
+        path = _json_path(field)
+        if path is None:
+            return None
+        
+        # The path is written as a literal rather than a parameter so that
+        # SQLite can match these expressions against the field's indexes
+        path = _sql_string(path)
+        if value is None:
+            scalar = "json_extract({0}, {1}) IS NULL AND json_type({0}, {1}) = 'null'".format(_DATA_COLUMN, path)
+            element = "type = 'null'"
+        else:
+            scalar = "json_extract({0}, {1}) IN ({2}) AND json_type({0}, {1}) NOT IN ('array', 'object')".format(_DATA_COLUMN, path, placeholders)
+            element = "value IN ({0}) AND type NOT IN ('array', 'object')".format(placeholders)
+        container = "json_type({0}, {1}) IN ('array', 'object') AND EXISTS (SELECT 1 FROM json_each({0}, {1})" \
+                    " WHERE (json_type({0}, {1}) = 'array' AND {2}) OR (json_type({0}, {1}) = 'object' AND key IN ({3})))".format(_DATA_COLUMN, path, element, placeholders)
+        if value is None:
+            params = candidates * 1
+        else:
+            params = candidates * 3
+        
+        if field in self._indexed_fields():
+            # Each half of the match can then use one of the field's indexes
+            return (select + scalar + " UNION ALL " + select + container, params)
+        return (select + "(" + scalar + ") OR (" + container + ")", params)
+        
+    @instrumented
+    def create_index(self, field, unique=False):
+        """Creates an index on a dictionary key (field) in the Collection
+        
+        Args:
+            field   The top-level dictionary key to index, which may not
+                    contain a dot
+            
+            unique  If True, no two dictionaries in the Collection may
+                    store the same value for the field, defaults to False
+                    
+        Raises:
+            ValueError  This method will throw a ValueError if the field
+                        cannot be indexed
+                        
+            sqlite3.IntegrityError
+                        A unique index cannot be created if the Collection
+                        already contains duplicate values, and subsequent
+                        inserts or updates of duplicate values will fail
+                        
+        Notes:
+            Collection.find_field and Collection.find_one use the index
+            automatically.  Creating an index that already exists has no
+            effect, even if unique differs.
+        """
+        
+        self._create_table()
+        
+        if not self.codec.json_text:
+            raise ValueError("Collections using the '{0}' codec cannot index fields".format(self.codec.name))
+        if self._compressed:
+            raise ValueError("Compressed collections cannot index fields")
+        path = _json_path(field)
+        # Filters treat a dotted key as a path into nested dictionaries
+        if path is None or field == _ID_COLUMN or '.' in field:
+            raise ValueError("The field '{0}' cannot be indexed".format(field))
+        path = _sql_string(path)
+        if field in self._indexed_fields():
+            return
+        
+        cursor = self.connection.cursor()
+        cursor.execute("CREATE {0}INDEX IF NOT EXISTS {1} ON {2}(json_extract({3}, {4}))".format("UNIQUE " if unique else "",
+                                                                                               _quote_identifier(self._index_name(field)),
+                                                                                               self._table, _DATA_COLUMN, path))
+        cursor.execute("CREATE INDEX IF NOT EXISTS {0} ON {1}({2}) WHERE json_type({3}, {4}) IN ('array', 'object')".format(_quote_identifier(self._index_name(field, _CONTAINER_INDEX)),
+                                                                                                                           self._table, _ID_COLUMN, _DATA_COLUMN, path))
+        self._commit()
+        self._indexes = None
+        
+    @instrumented
+    def drop_index(self, field):
+        """Removes the index on a dictionary key (field), if one exists
+        
+        Args:
+            field   The indexed dictionary key
+        """
+        
+        cursor = self.connection.cursor()
+        for indexed, kind, name, unique in self._index_names():
+            if indexed == field:
+                cursor.execute("DROP INDEX IF EXISTS {0}".format(_quote_identifier(name)))
+        self._commit()
+        self._indexes = None
+        
+    def list_indexes(self):
+        """Lists the indexed dictionary keys in the Collection
+        
+        Returns:
+            A list of dictionaries, each with the "field" indexed and 
+            whether the index is "unique"
+        """
+        
+        indexes = [{'field': field, 'unique': unique} for field, kind, name, unique in self._index_names() if kind == _FIELD_INDEX]
+        indexes.sort(key=lambda index: index['field'])
+        return indexes
+        
+    def _index_name(self, field, kind=_FIELD_INDEX):
+        """Private name of the SQLite index on a field"""
+        
+        return "{0}{1}_{2}_{3}_{4}".format(_INDEX_PREFIX, kind, len(self.collection), self.collection, field)
+        
+    def _index_names(self):
+        """Private list of the (field, kind, name, unique) of each SQLite index on the Collection's fields"""
+        
+        if not self._table_exists():
+            return []
+        # Earlier versions named indexes "<collection>_<kind>_<field>", 
+        # which are only recognized on the Collection's own table
+        prefixes = [(self._index_name('', kind), kind) for kind in (_FIELD_INDEX, _CONTAINER_INDEX)]
+        prefixes.extend(("{0}_{1}_".format(self.collection, kind), kind) for kind in (_FIELD_INDEX, _CONTAINER_INDEX))
+        
+        names = []
+        for row in self.connection.execute("PRAGMA index_list({0})".format(self._statements['table'])):
+            for prefix, kind in prefixes:
+                if row[1].startswith(prefix):
+                    names.append((row[1][len(prefix):], kind, row[1], bool(row[2])))
+                    break
+        return names
+        
+    def _indexed_fields(self):
+        """Private set of indexed fields, cached until indexes are changed through this Collection"""
+        
+        if getattr(self, '_indexes', None) is None:
+            self._indexes = set(index['field'] for index in self.list_indexes())
+        return self._indexes
+        
+    @instrumented
+    def create_text_index(self, fields):
+        """Creates a full-text index on one or more dictionary keys (fields)
+        
+        Args:
+            fields  The dictionary key, or a list of keys, whose text is
+                    searched by Collection.text_search
+                    
+        Raises:
+            ValueError  This method will throw a ValueError if a field
+                        cannot be indexed
+                        
+            sqlite3.OperationalError
+                        SQLite must include the FTS5 extension
+                        
+        Notes:
+            The index is an FTS5 table kept up to date by SQLite triggers,
+            so every write, through any connection, updates it.  A 
+            Collection has at most one text index; creating one with
+            different fields replaces it.  Lists and dictionaries stored
+            under a field are indexed as their JSON text.
+        """
+        
+        if isinstance(fields, str):
+            fields = [fields]
+        fields = list(fields)
+        
+        self._create_table()
+        
+        if not self.codec.json_text:
+            raise ValueError("Collections using the '{0}' codec cannot index fields".format(self.codec.name))
+        if self._compressed:
+            raise ValueError("Compressed collections cannot index fields")
+        if len(fields) == 0:
+            raise ValueError("A text index requires at least one field")
+        names = set()
+        for field in fields:
+            if _json_path(field) is None or field == _ID_COLUMN or field.lower() in _TEXT_RESERVED or field.lower() in names:
+                raise ValueError("The field '{0}' cannot be text indexed".format(field))
+            names.add(field.lower())
+        if self._text_fields() == fields:
+            return
+            
+        table = self._table
+        index = _quote_identifier(self._text_index_name())
+        columns = ", ".join(_quote_identifier(field) for field in fields)
+        
+        def values(row):
+            return ", ".join("json_extract({0}.{1}, {2})".format(row, _DATA_COLUMN, _sql_string(_json_path(field))) for field in fields)
+            
+        insert = "INSERT INTO {0}(rowid, {1}) VALUES(new.{2}, {3});".format(index, columns, _ID_COLUMN, values('new'))
+        remove = "INSERT INTO {0}({0}, rowid, {1}) VALUES('delete', old.{2}, {3});".format(index, columns, _ID_COLUMN, values('old'))
+        
+        with self.transaction(immediate=True):
+            cursor = self.connection.cursor()
+            self._drop_text_index(cursor)
+            # Contentless, as the text remains in the Collection's table
+            cursor.execute("CREATE VIRTUAL TABLE {0} USING fts5({1}, content='')".format(index, columns))
+            cursor.execute("CREATE TRIGGER {0} AFTER INSERT ON {1} BEGIN {2} END".format(self._text_trigger_name('insert'), table, insert))
+            cursor.execute("CREATE TRIGGER {0} AFTER DELETE ON {1} BEGIN {2} END".format(self._text_trigger_name('remove'), table, remove))
+            cursor.execute("CREATE TRIGGER {0} AFTER UPDATE ON {1} BEGIN {2} {3} END".format(self._text_trigger_name('update'), table, remove, insert))
+            cursor.execute("INSERT INTO {0}(rowid, {1}) SELECT {2}, {3} FROM {4}".format(index, columns, _ID_COLUMN, values(table), table))
+        self._database.add_table(self._text_index_name(), self.connection)
+            
+    @instrumented
+    def drop_text_index(self):
+        """Removes the Collection's full-text index, if one exists"""
+        
+        with self.transaction():
+            self._drop_text_index(self.connection.cursor())
+            
+    def _drop_text_index(self, cursor):
+        """Private removal of the full-text index and its triggers"""
+        
+        for action in ('insert', 'remove', 'update'):
+            cursor.execute("DROP TRIGGER IF EXISTS {0}".format(self._text_trigger_name(action)))
+        cursor.execute("DROP TABLE IF EXISTS {0}".format(_quote_identifier(self._text_index_name())))
+        self._database.discard_table(self._text_index_name())
+        
+    def text_index(self):
+        """Lists the dictionary keys in the Collection's full-text index, or returns None if it has none"""
+        
+        return self._text_fields()
+        
+    @instrumented
+    def text_search(self, query, limit=None, fields=None, projection=None):
+        """Finds the dictionaries whose indexed text matches a query, best matches first
+        
+        Args:
+            query       An SQLite FTS5 query, such as 'quick brown', which
+                        matches text containing both words, 'quick OR 
+                        brown', '"quick brown"' for the phrase, or 'qu*'
+                        for a prefix
+                        
+            limit       The maximum number of dictionaries to return,
+                        defaults to None (no limit)
+                        
+            fields      The indexed keys to search, defaults to None (all
+                        of the index's keys)
+                        
+            projection  The keys to retrieve, as with Collection.find, 
+                        defaults to None (all keys)
+                        
+        Returns:
+            A list of matching dictionaries, ordered by relevance
+            
+        Raises:
+            ValueError  This method will throw a ValueError if the
+                        Collection has no text index, or a field is not in
+                        the index
+                        
+            sqlite3.OperationalError
+                        The query is not valid FTS5 syntax
+        """
+        
+        indexed = self._text_fields()
+        if indexed is None:
+            raise ValueError("The Collection '{0}' has no text index".format(self.collection))
+            
+        if fields is not None:
+            if isinstance(fields, str):
+                fields = [fields]
+            for field in fields:
+                if field not in indexed:
+                    raise ValueError("The field '{0}' is not in the text index".format(field))
+            query = "{{{0}}} : ({1})".format(" ".join(_quote_identifier(field) for field in fields), query)
+            
+        index = _quote_identifier(self._text_index_name())
+        sql = "SELECT {0},{1} FROM {2} JOIN (SELECT rowid, rank FROM {3} WHERE {3} MATCH ? ORDER BY rank LIMIT ?) AS matched ON {0}=matched.rowid ORDER BY matched.rank, {0}".format(_ID_COLUMN, _DATA_COLUMN, self._table, index)
+        return [project(d, projection) for d in self._iter_rows(sql, (query, -1 if limit is None else limit))]
+        
+    def _text_index_name(self):
+        """Private name of the Collection's FTS5 table"""
+        
+        return _TEXT_INDEX_PREFIX + self.collection
+        
+    def _text_trigger_name(self, action):
+        """Private SQL naming the trigger updating the full-text index after an action"""
+        
+        return _quote_identifier("{0}_{1}".format(self._text_index_name(), action))
+        
+    def _text_fields(self):
+        """Private list of the fields in the full-text index, or None if the Collection has none"""
+        
+        name = self._text_index_name()
+        if not self._database.has_table(name, self.connection):
+            return None
+        return [row[1] for row in self.connection.execute("PRAGMA table_info({0})".format(_quote_identifier(name)))]
+        
+    @instrumented
+    def create_change_log(self, retention=None):
+        """Starts recording every insert, update, and removal in the Collection
+        
+        Args:
+            retention   The number of most recent changes kept, defaults 
+                        to None (changes are kept until truncated)
+                        
+        Raises:
+            ValueError  This method will throw a ValueError if retention is
+                        not a positive integer
+                        
+        Notes:
+            Changes are recorded by SQLite triggers within the transaction
+            making them, so changes made through any connection are 
+            recorded, and a rolled back change never is.  Each change is
+            numbered by a sequence that only increases.  Calling this 
+            method again only changes the retention.  Rewriting the 
+            Collection with Collection.recompress records every dictionary
+            as updated.
+        """
+        
+        if retention is not None and (not isinstance(retention, int) or retention < 1):
+            raise ValueError("The retention must be a positive integer")
+            
+        self._create_table()
+        
+        log = _quote_identifier(self._change_log_name())
+        with self.transaction(immediate=True):
+            cursor = self.connection.cursor()
+            cursor.execute("CREATE TABLE IF NOT EXISTS {0}(seq INTEGER PRIMARY KEY AUTOINCREMENT, {1} INTEGER, operation TEXT)".format(log, _ID_COLUMN))
+            for operation, event, row in _CHANGE_TRIGGERS:
+                cursor.execute("CREATE TRIGGER IF NOT EXISTS {0} AFTER {1} ON {2} BEGIN INSERT INTO {3}({4}, operation) VALUES({5}.{4}, '{6}'); END".format(self._change_trigger_name(operation), event, self._table,
+                                                                                                                                                           log, _ID_COLUMN, row, operation))
+            cursor.execute("DROP TRIGGER IF EXISTS {0}".format(self._change_trigger_name('retention')))
+            if retention is not None:
+                cursor.execute("CREATE TRIGGER {0} AFTER INSERT ON {1} BEGIN DELETE FROM {1} WHERE seq <= new.seq - {2}; END".format(self._change_trigger_name('retention'), log, retention))
+                cursor.execute("DELETE FROM {0} WHERE seq <= (SELECT MAX(seq) FROM {0}) - {1}".format(log, retention))
+        self._database.add_table(self._change_log_name(), self.connection)
+                
+    @instrumented
+    def drop_change_log(self):
+        """Stops recording changes to the Collection and removes the change log, if one exists"""
+        
+        with self.transaction():
+            cursor = self.connection.cursor()
+            for operation in [trigger[0] for trigger in _CHANGE_TRIGGERS] + ['retention']:
+                cursor.execute("DROP TRIGGER IF EXISTS {0}".format(self._change_trigger_name(operation)))
+            cursor.execute("DROP TABLE IF EXISTS {0}".format(_quote_identifier(self._change_log_name())))
+        self._database.discard_table(self._change_log_name())
+        
+    def last_change(self):
+        """Returns the sequence number of the most recent change, or 0 if none have been recorded
+        
+        Notes:
+            A consumer copying the entire Collection should read this number
+            and the dictionaries within one Collection.transaction, and
+            then pass it to Collection.changes_since.
+        """
+        
+        self._change_log()
+        row = self.connection.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (self._change_log_name(),)).fetchone()
+        return row[0] if row is not None else 0
+        
+    @instrumented
+    def changes_since(self, seq=0, limit=None):
+        """Lists the changes made to the Collection after a sequence number
+        
+        Args:
+            seq     The sequence number of the last change already seen,
+                    defaults to 0 (every recorded change)
+                    
+            limit   The maximum number of changes to return, defaults to
+                    None (no limit)
+                    
+        Returns:
+            A list of dictionaries in sequence order, each of the change's
+            "seq", the "_id" of the dictionary changed, and the "operation",
+            one of "insert", "update", or "remove"
+            
+        Raises:
+            ValueError  This method will throw a ValueError if the 
+                        Collection has no change log
+                        
+            sostore.ChangesTruncatedException
+                        Changes after seq have been removed by the retention
+                        or Collection.truncate_changes, or seq is later than
+                        any change recorded, as when the change log has been
+                        dropped and created again.  The consumer must copy 
+                        the entire Collection again.
+        """
+        
+        log = self._change_log()
+        cursor = self.connection.cursor()
+        rows = cursor.execute("SELECT seq, {0}, operation FROM {1} WHERE seq > ? ORDER BY seq LIMIT ?".format(_ID_COLUMN, log),
+                              (seq, -1 if limit is None else limit)).fetchall()
+        # Sequence numbers are consecutive, as a rolled back change also
+        # rolls back its number
+        if len(rows) == 0 or rows[0][0] != seq + 1:
+            if seq < self._truncated_through(cursor) or seq > self.last_change():
+                raise ChangesTruncatedException(self.collection, seq)
+        return [{'seq': row[0], _ID_COLUMN: row[1], 'operation': row[2]} for row in rows]
+        
+    def truncate_changes(self, seq):
+        """Removes the changes up to and including a sequence number from the change log
+        
+        Args:
+            seq     The sequence number of the last change every consumer 
+                    has seen
+                    
+        Returns:
+            The number of changes removed
+        """
+        
+        cursor = self.connection.cursor()
+        cursor.execute("DELETE FROM {0} WHERE seq <= ?".format(self._change_log()), (seq,))
+        self._commit()
+        return cursor.rowcount
+        
+    def watch(self, seq=None, interval=WATCH_INTERVAL):
+        """Iterates over changes to the Collection as they are made
+        
+        Args:
+            seq         The sequence number of the last change already 
+                        seen, defaults to None (only changes made from now
+                        on)
+                        
+            interval    The seconds to wait before checking again when no 
+                        changes are found, defaults to WATCH_INTERVAL
+                        
+        Notes:
+            Yields the dictionaries of Collection.changes_since, and never 
+            stops on its own.  Changes made through other connections are
+            seen once committed.
+        """
+        
+        # Read now rather than when iteration begins, so that no change 
+        # made in between is missed
+        if seq is None:
+            seq = self.last_change()
+        else:
+            self._change_log()
+        return self._watch(seq, interval)
+        
+    def _watch(self, seq, interval):
+        """Private generator of Collection.watch"""
+        
+        while True:
+            changes = self.changes_since(seq, FETCH_BATCH_SIZE)
+            if len(changes) == 0:
+                time.sleep(interval)
+                continue
+            for change in changes:
+                yield change
+            seq = changes[-1]['seq']
+            
+    def _change_log(self):
+        """Private SQL naming the change log, raising a ValueError if the Collection has none"""
+        
+        name = self._change_log_name()
+        if not self._database.has_table(name, self.connection):
+            raise ValueError("The Collection '{0}' has no change log".format(self.collection))
+        return _quote_identifier(name)
+        
+    def _change_log_name(self):
+        """Private name of the Collection's change log table"""
+        
+        return _CHANGE_LOG_PREFIX + self.collection
+        
+    def _change_trigger_name(self, operation):
+        """Private SQL naming the trigger maintaining the change log"""
+        
+        return _quote_identifier("{0}_{1}".format(self._change_log_name(), operation))
+        
+    def _truncated_through(self, cursor):
+        """Private sequence number of the last change removed from the change log"""
+        
+        first = cursor.execute("SELECT MIN(seq) FROM {0}".format(self._change_log())).fetchone()[0]
+        if first is None:
+            return self.last_change()
+        return first - 1
+        
+@contextlib.contextmanager
+def _text_file(path_or_file, mode):
+    """Yields a file object, opening and later closing it if given a filename"""
+    
+    if not isinstance(path_or_file, (str, os.PathLike)):
+        yield path_or_file
+        return
+    with open(path_or_file, mode, encoding='utf-8', newline='\n' if mode == 'w' else None) as file:
+        yield file
+        
+def _json_path(field):
+    """Returns the SQLite JSON path of a top-level dictionary key, or None if the key cannot be expressed"""
+    
+    if not isinstance(field, str) or '"' in field:
+        return None
+    return '$."{0}"'.format(field)
+    
+def _sql_string(value):
+    """Returns value as a quoted SQL string literal"""
+    
+    return "'{0}'".format(value.replace("'", "''"))
+    
+def _quote_identifier(name):
+    """Returns name as a quoted SQL identifier"""
+    
+    return '"{0}"'.format(name.replace('"', '""'))
+    
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _statements(table):
+    """Returns the fixed SQL statements of a Collection, given the SQL naming its table
+    
+    Statements with a variable list of ids or a compiled filter are kept as
+    templates for str.format, so braces in the table's name are escaped.
+    """
+    
+    template = table.replace("{", "{{").replace("}", "}}")
+    return {'table':         table,
+            'count':         "SELECT COUNT({0}) FROM {1}".format(_ID_COLUMN, table),
+            'size':          "SELECT COUNT(*), TOTAL(LENGTH({0})) FROM {1}".format(_DATA_COLUMN, table),
+            'get':           "SELECT {0},{1} FROM {2} WHERE {0}=?".format(_ID_COLUMN, _DATA_COLUMN, table),
+            'all':           "SELECT {0},{1} FROM {2} ORDER BY {0}".format(_ID_COLUMN, _DATA_COLUMN, table),
+            'first_batch':   "SELECT {0},{1} FROM {2} ORDER BY {0} LIMIT ?".format(_ID_COLUMN, _DATA_COLUMN, table),
+            'next_batch':    "SELECT {0},{1} FROM {2} WHERE {0} > ? ORDER BY {0} LIMIT ?".format(_ID_COLUMN, _DATA_COLUMN, table),
+            'random_data':   "SELECT {1} FROM {2} WHERE {0} IN (SELECT {0} FROM {2} ORDER BY RANDOM() LIMIT ?)".format(_ID_COLUMN, _DATA_COLUMN, table),
+            'max_id':        "SELECT MAX({0}) FROM {1}".format(_ID_COLUMN, table),
+            'id_range':      "SELECT MIN({0}), MAX({0}) FROM {1}".format(_ID_COLUMN, table),
+            'ids':           "SELECT {0} FROM {1} ORDER BY {0}".format(_ID_COLUMN, table),
+            'id_at':         "SELECT {0} FROM {1} ORDER BY {0} LIMIT 1 OFFSET ?".format(_ID_COLUMN, table),
+            'insert':        "INSERT INTO {0}({1}) VALUES(?)".format(table, _DATA_COLUMN),
+            'insert_id':     "INSERT INTO {0}({1}, {2}) VALUES(?, ?)".format(table, _ID_COLUMN, _DATA_COLUMN),
+            'insert_new_id': "INSERT INTO {0}({1}, {2}) VALUES(?, ?) ON CONFLICT({1}) DO NOTHING".format(table, _ID_COLUMN, _DATA_COLUMN),
+            'upsert_id':     "INSERT INTO {0}({1}, {2}) VALUES(?, ?) ON CONFLICT({1}) DO UPDATE SET {2}=excluded.{2}".format(table, _ID_COLUMN, _DATA_COLUMN),
+            'update':        "UPDATE {0} SET {1}=? WHERE {2}=?".format(table, _DATA_COLUMN, _ID_COLUMN),
+            'remove':        "DELETE FROM {0} WHERE {1}=?".format(table, _ID_COLUMN),
+            'get_in':        "SELECT {0},{1} FROM {2} WHERE {0} IN ({{0}})".format(_ID_COLUMN, _DATA_COLUMN, template),
+            'ids_in':        "SELECT {0} FROM {1} WHERE {0} IN ({{0}})".format(_ID_COLUMN, template),
+            'remove_in':     "DELETE FROM {0} WHERE {1} IN ({{0}})".format(template, _ID_COLUMN),
+            'remove_in_returning':
+                             "DELETE FROM {0} WHERE {1} IN ({{0}}) RETURNING {1}".format(template, _ID_COLUMN),
+            'select_where':  "SELECT {0},{1} FROM {2} WHERE {{0}}".format(_ID_COLUMN, _DATA_COLUMN, template),
+            'ids_where':     "SELECT {0} FROM {1} WHERE {{0}}".format(_ID_COLUMN, template),
+            'count_where':   "SELECT COUNT(*) FROM {0} WHERE {{0}}".format(template),
+            'remove_where_returning':
+                             "DELETE FROM {0} WHERE {{0}} RETURNING {1}".format(template, _ID_COLUMN),
+            'update_where':  "UPDATE {0} SET {1}={{0}} WHERE {{1}}".format(template, _DATA_COLUMN),
+            'update_where_returning':
+                             "UPDATE {0} SET {1}={{0}} WHERE {{1}} RETURNING {2}".format(template, _DATA_COLUMN, _ID_COLUMN)}
+    
+_EMPTY_STATEMENTS = _statements(_EMPTY_TABLE)
+    
+def _sort_terms(sort):
+    """Normalizes a sort specification into a list of (key, ASCENDING or DESCENDING) pairs
+    
+    Accepts None, a single key, or a sequence of keys or (key, direction)
+    pairs, where direction may also be 1 or -1 as in MongoDB.
+    """
+    
+    if sort is None:
+        return []
+    if isinstance(sort, str):
+        sort = [sort]
+        
+    terms = []
+    for term in sort:
+        if isinstance(term, str):
+            field, direction = term, ASCENDING
+        else:
+            field, direction = term
+        if direction in (1, ASCENDING):
+            direction = ASCENDING
+        elif direction in (-1, DESCENDING):
+            direction = DESCENDING
+        else:
+            raise ValueError("Unknown sort direction '{0}'".format(direction))
+        terms.append((field, direction))
+    return terms
+    
+def _sort_documents(documents, sort):
+    """Sorts decoded dictionaries in Python as Collection._sort_keys would in SQLite"""
+    
+    documents.sort(key=lambda d: d[_ID_COLUMN], reverse=(len(sort) > 0 and sort[-1][1] == DESCENDING))
+    for field, direction in reversed(sort):
+        documents.sort(key=lambda d: sort_value(resolve(d, field)), reverse=(direction == DESCENDING))
+    return documents
+    
+def _seek_clause(keys, values):
+    """Returns the SQL and parameters selecting rows sorted after the given sort values
+    
+    Rows sort after the values if they are equal on some leading keys and
+    after the value of the next key.  SQLite sorts NULL before all other 
+    values, which the comparisons account for.
+    """
+    
+    clauses = []
+    params = []
+    for i, (expression, direction) in enumerate(keys):
+        terms = []
+        for previous, value in zip(keys[:i], values[:i]):
+            terms.append("{0} IS ?".format(previous[0]))
+            params.append(value)
+            
+        value = values[i]
+        if direction == ASCENDING and value is None:
+            terms.append("{0} IS NOT NULL".format(expression))
+        elif direction == ASCENDING:
+            terms.append("{0} > ?".format(expression))
+            params.append(value)
+        elif value is None:
+            terms.append("0")
+        else:
+            terms.append("({0} < ? OR {0} IS NULL)".format(expression))
+            params.append(value)
+        clauses.append("(" + " AND ".join(terms) + ")")
+    return (" OR ".join(clauses), params)
+    
+def _seek_segments(keys, values):
+    """Returns the (SQL, parameters, sort keys) of the queries that together continue a sort
+    
+    The clause from _seek_clause alone keeps SQLite from searching an 
+    index for the first key, so it is paired with a range on that key.  In 
+    descending order the rows after a value are those below it followed by
+    those missing the key, which are read by a second query unless the key
+    is the id, which is never missing.
+    """
+    
+    seek, params = _seek_clause(keys, values)
+    expression, direction = keys[0]
+    value = values[0]
+    if direction == ASCENDING and value is None:
+        return [(seek, params, keys)]
+    if direction == ASCENDING or expression == _ID_COLUMN:
+        operator = ">=" if direction == ASCENDING else "<="
+        return [("{0} {1} ? AND ({2})".format(expression, operator, seek), [value] + params, keys)]
+    if value is None:
+        return [("{0} IS NULL AND ({1})".format(expression, seek), params, keys[1:])]
+    return [("{0} <= ? AND ({1})".format(expression, seek), [value] + params, keys),
+            ("{0} IS NULL".format(expression), [], keys[1:])]
+    
+def _page_token(sort, values):
+    """Encodes the sort and the sort values of the last dictionary on a page"""
+    
+    data = json.dumps([[list(term) for term in sort], list(values)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+    
+def _page_values(token, sort, count):
+    """Decodes the sort values in a page token, checking it was made with the same sort"""
+    
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        token_sort, values = data
+    except (ValueError, TypeError, AttributeError, UnicodeError):
+        raise ValueError("Invalid page token")
+    if token_sort != [list(term) for term in sort] or not isinstance(values, list) or len(values) != count:
+        raise ValueError("The page token was returned by a different sort")
+    return values
+    
+def _object_id(object_or_id):
+    """Returns the id of a stored dictionary, or the argument itself if it is an id"""
+    
+    if isinstance(object_or_id, dict):
+        return object_or_id[_ID_COLUMN]
+    return object_or_id
+    
+def _key_value(object, key_field):
+    """Returns a hashable (type, value) for the key identifying a dictionary in an upsert, or None"""
+    
+    value = resolve(object, key_field)
+    bracket = _bracket(value)
+    if bracket not in ('number', 'string', 'bool'):
+        return None
+    return (bracket, value)
+    
+def _bulk_group(operation):
+    """Groups the consecutive operations of Collection.bulk_write that can be performed together"""
+    
+    if operation[0] in ('insert', 'remove'):
+        return (operation[0], None)
+    if operation[0] == 'upsert':
+        return (operation[0], operation[2] if len(operation) > 2 else None)
+    return (operation[0], id(operation))
+    
+def _metric_specifications(metrics):
+    """Normalizes the metrics of Collection.aggregate into a list of (name, function, key or None)"""
+    
+    if metrics is None:
+        metrics = {'count': 'count'}
+    specifications = []
+    for name, metric in metrics.items():
+        if isinstance(metric, str):
+            metric = (metric,)
+        function = metric[0]
+        field = metric[1] if len(metric) > 1 else None
+        if function not in _AGGREGATE_FUNCTIONS or len(metric) > 2 or (field is None and function != 'count'):
+            raise ValueError("The metric '{0}' must be a function and a key, or 'count'".format(name))
+        specifications.append((name, function, field))
+    return specifications
+    
+def _field_sql(field):
+    """Returns the SQL value of a key and a condition that it is a number, as used by aggregates"""
+    
+    if field == _ID_COLUMN:
+        return (_ID_COLUMN, "1")
+    value, type, path = field_expressions(field)
+    return (value, "{0} IN ('integer', 'real')".format(type))
+    
+def _aggregate_documents(documents, group_by, metrics):
+    """Aggregates decoded dictionaries in Python as Collection._aggregate_sql would in SQLite"""
+    
+    groups = {}
+    for d in documents:
+        values = [sql_value(resolve(d, field)) for field in group_by]
+        key = tuple(sort_value(value) for value in values)
+        if key not in groups:
+            groups[key] = (values, [])
+        groups[key][1].append(d)
+    if len(group_by) == 0 and len(groups) == 0:
+        groups[()] = ([], [])
+        
+    results = []
+    for key in sorted(groups):
+        values, members = groups[key]
+        result = dict(zip(group_by, values))
+        for name, function, field in metrics:
+            if field is None:
+                result[name] = len(members)
+                continue
+            found = [resolve(d, field) for d in members]
+            numbers = [value for value in found if _bracket(value) == 'number']
+            found = [sql_value(value) for value in found if sql_value(value) is not None]
+            if function == 'count':
+                result[name] = len(found)
+            elif function == 'sum':
+                result[name] = sum(numbers)
+            elif function == 'avg':
+                result[name] = float(sum(numbers)) / len(numbers) if len(numbers) > 0 else None
+            elif len(found) == 0:
+                result[name] = None
+            elif function == 'min':
+                result[name] = min(found, key=sort_value)
+            else:
+                result[name] = max(found, key=sort_value)
+        results.append(result)
+    return results
+    
+def _shuffled_range(start, stop):
+    """Yields the integers from start to stop, exclusive, in random order
+    
+    Values are drawn by rejection until half of the range has been used,
+    after which the remainder is shuffled, so that drawing only a few 
+    values from a large range is inexpensive.
+    """
+    
+    size = stop - start
+    used = set()
+    while len(used) < size // 2:
+        value = random.randrange(start, stop)
+        if value not in used:
+            used.add(value)
+            yield value
+    remaining = [value for value in range(start, stop) if value not in used]
+    random.shuffle(remaining)
+    for value in remaining:
+        yield value
+        
+def _match_candidates(value):
+    """Returns the stored values that find_field considers equal to value
+    
+    A string holding an integer also matches the integer itself.
+    """
+    
+    candidates = [value]
+    if isinstance(value, str):
+        try:
+            candidates.append(int(value))
+        except ValueError:
+            pass
+    return candidates
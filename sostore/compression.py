@@ -0,0 +1,171 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Prefixes every compressed value, followed by the compressor's one byte
+# tag, so that compressed and uncompressed rows can share a collection
+MAGIC = b'\x00SZ'
+
+class Compressor():
+    """Compresses serialized dictionaries before they are stored
+    
+    Subclasses provide a unique name, a unique one byte tag recorded with
+    each compressed value, and compress and decompress methods operating 
+    on bytes.
+    """
+    
+    name = None
+    tag = None
+    
+    def compress(self, data):
+        """Returns the compressed form of data"""
+        raise NotImplementedError()
+        
+    def decompress(self, data):
+        """Returns the original form of compressed data"""
+        raise NotImplementedError()
+        
+class ZlibCompressor(Compressor):
+    """Compression using the standard library's zlib module"""
+    
+    name = 'zlib'
+    tag = b'z'
+    
+    def __init__(self, level=6):
+        self.level = level
+        
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+        
+    def decompress(self, data):
+        return zlib.decompress(data)
+        
+class LZMACompressor(Compressor):
+    """Compression using the standard library's lzma module
+    
+    Slower than zlib, but usually smaller.
+    """
+    
+    name = 'lzma'
+    tag = b'x'
+    
+    def __init__(self, preset=6):
+        self.preset = preset
+        
+    def compress(self, data):
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=self._filters())
+        
+    def decompress(self, data):
+        return lzma.decompress(data, format=lzma.FORMAT_RAW, filters=self._filters())
+        
+    def _filters(self):
+        # The raw format omits the container headers that would otherwise
+        # dominate small documents
+        return [{'id': lzma.FILTER_LZMA2, 'preset': self.preset}]
+        
+class ZstdCompressor(Compressor):
+    """Compression using the optional zstandard package
+    
+    Small, repetitive documents compress far better with a dictionary 
+    trained on samples of the collection.  Any number of dictionaries may
+    be known for decompression, keyed by their zstd dictionary id, while
+    only the current dictionary is used for compression.
+    """
+    
+    name = 'zstd'
+    tag = b'd'
+    
+    def __init__(self, level=3, dictionary=None, dictionaries=None):
+        self.level = level
+        self.dictionaries = dict(dictionaries or {})
+        self.set_dictionary(dictionary)
+        
+    def set_dictionary(self, dictionary):
+        """Uses a zstandard.ZstdCompressionDict, or None, for compression"""
+        
+        self.dictionary = dictionary
+        if dictionary is not None:
+            self.dictionaries[dictionary.dict_id()] = dictionary
+        self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        
+    def compress(self, data):
+        return self._compressor.compress(data)
+        
+    def decompress(self, data):
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        dictionary = None
+        if dict_id:
+            dictionary = self.dictionaries[dict_id]
+        return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+        
+def train_zstd_dictionary(samples, size):
+    """Returns a zstandard.ZstdCompressionDict trained on a list of bytes samples"""
+    
+    return zstandard.train_dictionary(size, samples)
+        
+_compressors = {}
+
+def register_compressor(compressor_class):
+    """Makes a Compressor subclass available to Collections by its name and tag"""
+    
+    if not compressor_class.name or compressor_class.tag is None or len(compressor_class.tag) != 1:
+        raise ValueError("A compressor must have a name and a one byte tag")
+    _compressors[compressor_class.name] = compressor_class
+    
+def get_compressor(name, **options):
+    """Returns a new instance of the registered Compressor with the given name
+    
+    Raises:
+        ValueError  This method will throw a ValueError if no compressor
+                    with the name is registered
+    """
+    
+    try:
+        compressor_class = _compressors[name]
+    except KeyError:
+        raise ValueError("The compressor '{0}' is not available".format(name))
+    return compressor_class(**options)
+    
+def get_compressor_by_tag(tag, **options):
+    """Returns a new instance of the registered Compressor with the given tag"""
+    
+    for compressor_class in _compressors.values():
+        if compressor_class.tag == tag:
+            return compressor_class(**options)
+    raise ValueError("No compressor is available for the tag {0!r}".format(tag))
+    
+def available_compressors():
+    """Returns the names of all registered compressors"""
+    
+    return sorted(_compressors.keys())
+
+register_compressor(ZlibCompressor)
+if lzma is not None:
+    register_compressor(LZMACompressor)
+if zstandard is not None:
+    register_compressor(ZstdCompressor)
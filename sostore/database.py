@@ -0,0 +1,311 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import sqlite3
+
+from sostore.pool import ConnectionPool
+from sostore.transaction import transaction
+from sostore.tuning import get_pragmas, apply_pragmas, connect, CACHED_STATEMENTS
+
+# The table recording each collection's codec and other settings
+METADATA_TABLE = 'sostore_metadata'
+
+# Tables whose names begin with these prefixes are never collections
+RESERVED_PREFIXES = ('sqlite_', 'sostore_')
+
+# The number of pages copied by each step of a backup, between which other
+# connections may write
+BACKUP_PAGES = 1024
+
+class Database():
+    """A database of Collections sharing one connection, or one ConnectionPool
+
+    The names of the database's tables and the settings recorded for each
+    Collection are read once when the Database is opened, so opening a
+    Collection through the Database executes no SQL.  A Collection's table
+    is created by its first write, and its statements are prepared once per
+    Collection name.
+    """
+
+    def __init__(self, db=":memory:", connection=None, pool=None, threaded=False,
+                 profile=None, pragmas=None, cached_statements=CACHED_STATEMENTS, preload=True):
+        """Opens a database
+
+        Args:
+            db          Database filename, unused if connection or pool is
+                        specified
+
+            connection  A valid sqlite3.Connection object, defaults to None
+
+            pool        A sostore.ConnectionPool providing each thread with
+                        its own connection, defaults to None
+
+            threaded    If True and no pool is specified, a new
+                        ConnectionPool is created for db, defaults to False
+
+            profile     The name of a connection profile in
+                        sostore.tuning.PROFILES, defaults to None
+
+            pragmas     A dictionary of connection settings overriding the
+                        profile's, defaults to None
+
+            cached_statements
+                        The number of compiled SQL statements each
+                        connection opened by the Database keeps, defaults
+                        to CACHED_STATEMENTS
+
+            preload     If True, the names of all tables and the settings
+                        of all Collections are read when the Database is
+                        opened, otherwise those of each Collection are read
+                        when it is first opened, defaults to True
+
+        Raises:
+            ValueError  This method will throw a ValueError if the profile
+                        or a connection setting is unknown
+        """
+
+        settings = get_pragmas(profile, pragmas)
+        if pool is None and threaded:
+            pool = ConnectionPool(db, pragmas=settings, cached_statements=cached_statements)
+        self.pool = pool
+
+        if pool is not None:
+            self._connection = None
+        elif connection is not None:
+            apply_pragmas(connection, settings)
+            self._connection = connection
+        else:
+            self._connection = connect(db, settings, cached_statements=cached_statements)
+        self.closed = False
+
+        self._tables = set()
+        # Tables looked up and found missing since the tables were preloaded
+        self._missing = set()
+        self._metadata = {}
+        # Collections whose settings were changed within a transaction that
+        # may yet be rolled back, and so must be read again
+        self._stale = set()
+        self._preloaded = False
+        if preload:
+            self.refresh()
+
+    @property
+    def connection(self):
+        """The database connection of the calling thread"""
+
+        if self.closed:
+            raise sqlite3.ProgrammingError("The database has been closed")
+        if self.pool is not None:
+            return self.pool.connection()
+        return self._connection
+
+    def refresh(self):
+        """Rereads the names of the database's tables and the settings of its Collections
+
+        Notes:
+            Only necessary if Collections are removed, or their settings
+            changed, through another connection, or if a Collection created
+            through another connection was looked up before it was created.
+        """
+
+        connection = self.connection
+        self._tables = set(row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+        self._missing = set()
+        self._metadata = {}
+        self._stale = set()
+        if METADATA_TABLE in self._tables:
+            for collection, key, value in connection.execute("SELECT collection, key, value FROM {0}".format(METADATA_TABLE)):
+                self._metadata.setdefault(collection, {})[key] = value
+        self._preloaded = True
+
+    def collection(self, name, **options):
+        """Opens a Collection in the database
+
+        Args:
+            name        The name of the Collection
+
+            options     Further arguments to sostore.Collection, such as
+                        codec, compression, or cache_size
+
+        Raises:
+            ValueError  This method will throw a ValueError if the name is
+                        not a valid Collection name
+        """
+
+        # Imported here, as sostore.collection depends on this module
+        from sostore.collection import Collection
+        return Collection(name, database=self, **options)
+
+    def __getitem__(self, name):
+        return self.collection(name)
+
+    def __contains__(self, name):
+        return self.has_table(name)
+
+    def collections(self):
+        """Lists the names of the Collections created in the database"""
+
+        connection = self.connection
+        names = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        if not connection.in_transaction:
+            self._tables.update(names)
+            self._missing.difference_update(names)
+        return sorted(name for name in names if not name.startswith(RESERVED_PREFIXES))
+
+    def transaction(self, immediate=False):
+        """Groups work on every Collection of the database into a single transaction
+
+        See sostore.transaction for details.
+        """
+
+        return transaction(self.connection, immediate)
+
+    def has_table(self, name, connection=None, cached=True):
+        """Returns True if the database contains a table
+
+        Args:
+            name        The name of the table
+
+            connection  The connection to check, defaults to None for the
+                        calling thread's connection
+
+            cached      If False, a table found missing before is looked up
+                        again, defaults to True
+
+        Notes:
+            Once the tables have been preloaded, a missing table is looked
+            up once, and then again only within a transaction, when opened
+            by a Collection, or after a table is created through the
+            Database.
+        """
+
+        if name in self._tables:
+            return True
+        if connection is None:
+            connection = self.connection
+        in_transaction = connection.in_transaction
+        if cached and not in_transaction and name in self._missing:
+            return False
+        found = connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+        # A table created within a transaction disappears if it is rolled back
+        if not in_transaction:
+            if found:
+                self._tables.add(name)
+                self._missing.discard(name)
+            elif self._preloaded:
+                self._missing.add(name)
+        return found
+
+    def add_table(self, name, connection=None):
+        """Records a table created through a connection, unless within a transaction that may yet be rolled back"""
+
+        if connection is None:
+            connection = self.connection
+        self._missing.discard(name)
+        if not connection.in_transaction:
+            self._tables.add(name)
+
+    def discard_table(self, name):
+        """Forgets a table that may have been dropped, so that it is looked up again when next needed"""
+
+        self._tables.discard(name)
+        self._missing.discard(name)
+
+    def metadata(self, collection, connection=None, refresh=False):
+        """Returns a dictionary of the settings recorded for a Collection
+
+        Args:
+            collection  The name of the Collection
+
+            connection  The connection to read through, defaults to None
+                        for the calling thread's connection
+
+            refresh     If True, the settings are read from the database
+                        again, defaults to False
+        """
+
+        if refresh or collection in self._stale or (not self._preloaded and collection not in self._metadata):
+            if connection is None:
+                connection = self.connection
+            settings = {}
+            if self.has_table(METADATA_TABLE, connection, cached=not refresh):
+                settings = dict(connection.execute("SELECT key, value FROM {0} WHERE collection=?".format(METADATA_TABLE), (collection,)))
+            if connection.in_transaction:
+                return settings
+            self._stale.discard(collection)
+            self._metadata[collection] = settings
+        return self._metadata.get(collection, {})
+
+    def set_metadata(self, collection, key, value, connection=None):
+        """Records a setting for a Collection
+
+        Notes:
+            Within a transaction, the setting is not committed until the
+            transaction is.
+        """
+
+        if connection is None:
+            connection = self.connection
+        connection.execute("CREATE TABLE IF NOT EXISTS {0}(collection TEXT, key TEXT, value TEXT, PRIMARY KEY (collection, key))".format(METADATA_TABLE))
+        connection.execute("INSERT OR REPLACE INTO {0}(collection, key, value) VALUES(?, ?, ?)".format(METADATA_TABLE), (collection, key, value))
+        self.add_table(METADATA_TABLE, connection)
+        if connection.in_transaction:
+            self._stale.add(collection)
+        else:
+            self._metadata.setdefault(collection, {})[key] = value
+
+    def backup(self, dest, pages=BACKUP_PAGES, progress=None):
+        """Copies the database, a few pages at a time
+
+        Args:
+            dest        A filename, or an open sqlite3.Connection, to copy
+                        the database to, replacing its contents
+
+            pages       The number of pages copied at each step, defaults
+                        to BACKUP_PAGES, or -1 to copy every page at once
+
+            progress    A function called after each step with the status,
+                        the number of pages remaining, and the total number
+                        of pages, as with sqlite3.Connection.backup,
+                        defaults to None
+
+        Notes:
+            The database is locked only while each step is copied, so
+            other connections may write between steps.  A write through
+            another connection restarts the copy, while writes through the
+            connection making the backup are copied as they are made.
+        """
+
+        target = dest
+        if not isinstance(dest, sqlite3.Connection):
+            target = sqlite3.connect(dest)
+        try:
+            self.connection.backup(target, pages=pages, progress=progress)
+        finally:
+            if target is not dest:
+                target.close()
+
+    def done(self):
+        """Closes the database's connection or ConnectionPool"""
+
+        if self.closed:
+            return
+        if self.pool is not None:
+            self.pool.close()
+        else:
+            self._connection.close()
+        self.closed = True
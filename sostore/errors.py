@@ -37,4 +37,21 @@ class ConnectionException(CollectionException):
     def __init__(self, collection):
         CollectionException.__init__(self, 
                                      collection, 
-                                     "The collection '{0}' no longer has a database connection".format(collection))
\ No newline at end of file
+                                     "The collection '{0}' no longer has a database connection".format(collection))
+                                     
+class CodecException(CollectionException):
+    """Thrown when a collection is opened with a codec other than the one it was created with"""
+    
+    def __init__(self, collection, recorded, requested):
+        CollectionException.__init__(self, 
+                                     collection, 
+                                     "The collection '{0}' is stored with the '{1}' codec, not '{2}'".format(collection, recorded, requested))
+                                     
+class ChangesTruncatedException(CollectionException):
+    """Thrown when changes are requested that are no longer in a collection's change log"""
+    
+    def __init__(self, collection, seq):
+        CollectionException.__init__(self, 
+                                     collection, 
+                                     "Changes to the collection '{0}' after {1} are no longer recorded".format(collection, seq))
+        self.seq = seq
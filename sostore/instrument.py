@@ -0,0 +1,280 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Opt-in timing of Collection methods
+
+Each call to an instrumented method opens a frame on the calling thread.
+Time within the frame is charged to one phase at a time: "decode" while
+stored dictionaries are decompressed and decoded, "filter" while they are
+matched in Python, and "sql" otherwise, which is mostly time spent within
+SQLite.  Methods called by other methods are charged to the outermost call.
+"""
+import collections
+import contextlib
+import functools
+import re
+import threading
+import time
+import types
+
+# Upper bounds, in seconds, of the latency histogram's buckets
+HISTOGRAM_BOUNDS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, float('inf'))
+
+# The most SQL statements kept for each call passed to a trace callback
+STATEMENT_LIMIT = 100
+
+# The most distinct SQL statements counted for Collection.stats
+DISTINCT_STATEMENT_LIMIT = 1000
+
+PHASES = ('sql', 'decode', 'filter')
+
+_local = threading.local()
+
+# Splits SQL around quoted strings, which hold JSON paths that must be kept
+_QUOTED = re.compile(r"('(?:[^']|'')*')")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b")
+
+def _frames():
+    frames = getattr(_local, 'frames', None)
+    if frames is None:
+        frames = _local.frames = []
+    return frames
+
+def normalize_statement(sql):
+    """Replaces the numbers in an SQL statement outside quoted strings with parameters
+    
+    Returns:
+        The statement and its number of parameters, or None if the statement
+        calls no JSON function and so cannot search an index on a field
+    """
+
+    if 'json_' not in sql:
+        return None
+    parts = _QUOTED.split(sql)
+    if not any('json_' in parts[i] for i in range(0, len(parts), 2)):
+        return None
+    count = 0
+    for i in range(0, len(parts), 2):
+        parts[i], replaced = _NUMBER.subn('?', parts[i])
+        count += replaced
+    return (''.join(parts), count)
+
+def _trace(statement):
+    """The sqlite3 trace callback, recording statements in the current frame"""
+
+    frames = _frames()
+    if len(frames) > 0:
+        frames[-1].statement(statement)
+
+class _Frame():
+    """The time, rows, and statements of one call to an instrumented method"""
+
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name = name
+        self.times = dict((phase, 0.0) for phase in PHASES)
+        self.phase = 'sql'
+        self.mark = None
+        self.scanned = 0
+        self.returned = 0
+        self.statements = []
+        self.statement_count = 0
+
+    def resume(self):
+        _frames().append(self)
+        self.mark = time.perf_counter()
+
+    def suspend(self):
+        self.charge()
+        _frames().pop()
+
+    def charge(self):
+        now = time.perf_counter()
+        self.times[self.phase] += now - self.mark
+        self.mark = now
+
+    def statement(self, sql):
+        self.statement_count += 1
+        if len(self.statements) < STATEMENT_LIMIT:
+            self.statements.append(sql)
+        self.instrument.count_statement(sql)
+
+def _returned(result):
+    """Returns the number of dictionaries, or ids, in a method's result"""
+
+    if isinstance(result, tuple) and len(result) > 0:
+        result = result[0]
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        return 1
+    return 0
+
+class Instrumentation():
+    """Accumulates the timings of a Collection's methods
+
+    Args:
+        trace   A function called with the method name, its duration in
+                seconds, and the list of SQL statements it executed after
+                each call lasting at least slow seconds, defaults to None
+
+        slow    The shortest call passed to trace, defaults to 0.0
+    """
+
+    def __init__(self, trace=None, slow=0.0):
+        self.trace = trace
+        self.slow = slow
+        self._lock = threading.Lock()
+        self._connections = set()
+        self.reset()
+
+    def reset(self):
+        """Discards all recorded timings and statements"""
+
+        with self._lock:
+            self._methods = {}
+            self._statements = collections.Counter()
+
+    def watch(self, connection):
+        """Installs the trace callback that records SQL statements on a connection
+
+        Notes:
+            An sqlite3.Connection has a single trace callback, so any other
+            callback set on the connection is replaced.
+        """
+
+        key = id(connection)
+        if key not in self._connections:
+            connection.set_trace_callback(_trace)
+            self._connections.add(key)
+
+    def phase(self, name):
+        """Returns a context manager charging the time within it to a phase of the current call"""
+
+        frames = _frames()
+        if len(frames) == 0 or frames[-1].instrument is not self:
+            return contextlib.nullcontext()
+        return self._phase(frames[-1], name)
+
+    @contextlib.contextmanager
+    def _phase(self, frame, name):
+        previous = frame.phase
+        frame.charge()
+        frame.phase = name
+        try:
+            yield
+        finally:
+            frame.charge()
+            frame.phase = previous
+
+    def scanned(self, count=1):
+        """Records dictionaries read from the database by the current call"""
+
+        frames = _frames()
+        if len(frames) > 0 and frames[-1].instrument is self:
+            frames[-1].scanned += count
+
+    def count_statement(self, sql):
+        statement = normalize_statement(sql)
+        if statement is None:
+            return
+        with self._lock:
+            if statement in self._statements or len(self._statements) < DISTINCT_STATEMENT_LIMIT:
+                self._statements[statement] += 1
+
+    def statements(self):
+        """Returns a Counter of the normalized statements executed that may search indexes"""
+
+        with self._lock:
+            return collections.Counter(self._statements)
+
+    def record(self, frame):
+        total = sum(frame.times.values())
+        with self._lock:
+            stats = self._methods.get(frame.name)
+            if stats is None:
+                stats = self._methods[frame.name] = {'calls': 0, 'total': 0.0, 'max': 0.0,
+                                                     'sql': 0.0, 'decode': 0.0, 'filter': 0.0,
+                                                     'scanned': 0, 'returned': 0, 'statements': 0,
+                                                     'histogram': [0] * len(HISTOGRAM_BOUNDS)}
+            stats['calls'] += 1
+            stats['total'] += total
+            stats['max'] = max(stats['max'], total)
+            for phase in PHASES:
+                stats[phase] += frame.times[phase]
+            stats['scanned'] += frame.scanned
+            stats['returned'] += frame.returned
+            stats['statements'] += frame.statement_count
+            for i, bound in enumerate(HISTOGRAM_BOUNDS):
+                if total <= bound:
+                    stats['histogram'][i] += 1
+                    break
+        if self.trace is not None and total >= self.slow:
+            self.trace(frame.name, total, frame.statements)
+
+    def report(self):
+        """Returns a copy of the timings, keyed by method name"""
+
+        with self._lock:
+            report = {}
+            for name, stats in self._methods.items():
+                stats = dict(stats)
+                stats['histogram'] = list(zip(HISTOGRAM_BOUNDS, stats['histogram']))
+                report[name] = stats
+            return report
+
+def _timed_generator(frame, generator):
+    """Runs a generator returned by an instrumented method within its frame, one item at a time"""
+
+    try:
+        while True:
+            frame.resume()
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            finally:
+                frame.suspend()
+            frame.returned += 1
+            yield item
+    finally:
+        generator.close()
+        frame.instrument.record(frame)
+
+def instrumented(method):
+    """Decorates a Collection method to be timed when the Collection's _instrument is set"""
+
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        instrument = self._instrument
+        if instrument is None or len(_frames()) > 0:
+            return method(self, *args, **kwargs)
+
+        frame = _Frame(instrument, name)
+        frame.resume()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            frame.suspend()
+        if isinstance(result, types.GeneratorType):
+            return _timed_generator(frame, result)
+        frame.returned = _returned(result)
+        instrument.record(frame)
+        return result
+    return wrapper
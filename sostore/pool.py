@@ -0,0 +1,145 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import sqlite3
+import threading
+import itertools
+import weakref
+
+from sostore.tuning import get_pragmas, read_only, connect, CACHED_STATEMENTS
+
+_memory_databases = itertools.count()
+
+class _Holder():
+    """Holds a thread's connection in the pool's thread-local storage"""
+    
+    def __init__(self, connection):
+        self.connection = connection
+        
+def _release(lock, connections, connection):
+    """Closes the connection of a thread that has exited"""
+    
+    with lock:
+        if connection in connections:
+            connections.remove(connection)
+            connection.close()
+
+class ConnectionPool():
+    """Provides each thread with its own connection to a single database
+    
+    A Collection given a ConnectionPool may be shared freely between 
+    threads, as every operation uses the calling thread's connection.
+    A thread's connection is closed when the thread exits.
+    File databases are switched to SQLite's write-ahead log so that readers
+    in some threads do not block a writer in another, unless a profile or
+    pragmas specify another journal_mode.
+    """
+    
+    def __init__(self, db=":memory:", timeout=5.0, profile=None, pragmas=None, cached_statements=CACHED_STATEMENTS):
+        """Initializes a pool of connections to a database
+        
+        Args:
+            db          Database filename.  The special name ":memory:"
+                        creates a private in-memory database shared by 
+                        all of the pool's connections.
+                        
+            timeout     Seconds a connection waits for another thread's 
+                        write lock before raising sqlite3.OperationalError,
+                        defaults to 5.0
+                        
+            profile     The name of a profile in sostore.tuning.PROFILES
+                        applied to each connection, defaults to None
+                        
+            pragmas     A dictionary of connection settings overriding
+                        the profile's, see sostore.tuning.PRAGMAS, 
+                        defaults to None
+                        
+            cached_statements
+                        The number of compiled SQL statements each
+                        connection keeps, defaults to CACHED_STATEMENTS
+                        
+        Raises:
+            ValueError  This method will throw a ValueError if the profile
+                        or a setting is unknown
+        """
+        
+        self.db = db
+        self.timeout = timeout
+        self.closed = False
+        self.pragmas = get_pragmas(profile, pragmas)
+        self.cached_statements = cached_statements
+        
+        self._uri = False
+        if db == ":memory:":
+            # The memdb VFS locks like an ordinary database file, unlike a
+            # shared cache, which older SQLite libraries must fall back to
+            if sqlite3.sqlite_version_info >= (3, 36, 0):
+                self.db = "file:/sostore_pool_{0:d}?vfs=memdb".format(next(_memory_databases))
+            else:
+                self.db = "file:sostore_pool_{0:d}?mode=memory&cache=shared".format(next(_memory_databases))
+            self._uri = True
+        
+        self._local = threading.local()
+        # Reentrant, as a finalizer may release a connection while the
+        # pool's lock is held by the same thread
+        self._lock = threading.RLock()
+        self._connections = []
+        
+        # An in-memory database only lives as long as a connection to it,
+        # so the creating thread's connection is opened immediately and
+        # kept until the pool is closed
+        self._open(keep=self._uri)
+        
+    def connection(self):
+        """Returns the calling thread's connection, opening it if necessary"""
+        
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None:
+            return holder.connection
+        return self._open()
+        
+    def _open(self, keep=False):
+        """Opens the calling thread's connection, closed on exit unless kept"""
+        
+        with self._lock:
+            if self.closed:
+                raise sqlite3.ProgrammingError("The connection pool has been closed")
+            # Connections are only closed, never used, by other threads
+            connection = connect(self.db, self.pragmas, uri=self._uri, timeout=self.timeout,
+                                 check_same_thread=False, cached_statements=self.cached_statements)
+            if not self._uri and 'journal_mode' not in self.pragmas and not read_only(self.pragmas):
+                connection.execute("PRAGMA journal_mode=WAL")
+            self._connections.append(connection)
+        holder = _Holder(connection)
+        if not keep:
+            # The holder is discarded with the thread's local storage
+            weakref.finalize(holder, _release, self._lock, self._connections, connection)
+        self._local.holder = holder
+        return connection
+        
+    def __len__(self):
+        return len(self._connections)
+        
+    def close(self):
+        """Closes every connection opened by the pool"""
+        
+        with self._lock:
+            self.closed = True
+            for connection in self._connections:
+                connection.close()
+            del self._connections[:]
+        self._local = threading.local()
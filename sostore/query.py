@@ -0,0 +1,435 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""MongoDB-style filters for Collection.find
+
+A filter is a dictionary mapping dictionary keys, or dotted paths into
+nested dictionaries, to either a value to match or a dictionary of
+operators.  Filters are evaluated in Python by matches(), which defines
+their behavior, and are compiled by compile_filter() into SQL for the
+subset of operators SQLite can evaluate.
+"""
+import json
+import operator
+import re
+
+ID_KEY = '_id'
+DATA_COLUMN = '_data'
+
+# Operators that compile_filter() can translate to SQL.  Others are
+# evaluated in Python.
+SQL_OPERATORS = ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$in', '$nin', '$exists')
+
+_COMPARISONS = {'$gt': operator.gt, '$gte': operator.ge, '$lt': operator.lt, '$lte': operator.le}
+_SQL_COMPARISONS = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+# SQLite json_type() names for each type bracket
+_SQL_TYPES = {'number': "('integer', 'real')",
+              'string': "('text')",
+              'bool': "('true', 'false')"}
+
+_MISSING = object()
+
+class Unsupported(Exception):
+    """Raised internally when part of a filter cannot be expressed in SQL"""
+
+def _bracket(value):
+    """Returns the name of the group of types a value is compared within"""
+
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, list):
+        return 'array'
+    if isinstance(value, dict):
+        return 'object'
+    return 'other'
+
+def resolve(document, field):
+    """Returns the value at a dotted path within a dictionary, or a marker if absent"""
+
+    value = document
+    for part in field.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _same(value, operand):
+    return _bracket(value) == _bracket(operand) and value == operand
+
+def _equals(value, operand):
+    """Equality as in MongoDB: a list matches if any element is equal"""
+
+    if value is _MISSING:
+        return operand is None
+    if _same(value, operand):
+        return True
+    if isinstance(value, list):
+        return any(_same(element, operand) for element in value)
+    return False
+
+# The order of type brackets when comparing nested lists and dictionaries,
+# as in MongoDB
+_BRACKET_ORDER = {'null': 0, 'number': 1, 'string': 2, 'object': 3, 'array': 4, 'bool': 5, 'other': 6}
+
+def _order_key(value):
+    """Returns a key ordering JSON values, comparing lists and dictionaries element by element"""
+
+    bracket = _bracket(value)
+    if bracket == 'null':
+        return (0,)
+    if bracket == 'array':
+        return (_BRACKET_ORDER[bracket], tuple(_order_key(element) for element in value))
+    if bracket == 'object':
+        return (_BRACKET_ORDER[bracket], tuple((key, _order_key(element)) for key, element in value.items()))
+    return (_BRACKET_ORDER[bracket], value)
+
+def _ordered(value, operand, comparison):
+    """Compares two values of the same bracket, which are never ordered if Python cannot order them"""
+
+    try:
+        return comparison(_order_key(value), _order_key(operand))
+    except TypeError:
+        return False
+
+def _compare(value, operand, comparison):
+    if value is _MISSING:
+        return False
+    candidates = [value]
+    if isinstance(value, list):
+        candidates.extend(value)
+    bracket = _bracket(operand)
+    return any(_bracket(candidate) == bracket and _ordered(candidate, operand, comparison) for candidate in candidates)
+
+def _regex(value, pattern, options):
+    flags = 0
+    for option in options:
+        flags |= {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}[option]
+    candidates = [value]
+    if isinstance(value, list):
+        candidates = value
+    return any(isinstance(candidate, str) and re.search(pattern, candidate, flags) is not None for candidate in candidates)
+
+def _is_operators(condition):
+    return isinstance(condition, dict) and len(condition) > 0 and all(key.startswith('$') for key in condition)
+
+def _match_condition(value, condition):
+    if not _is_operators(condition):
+        return _equals(value, condition)
+
+    for op, operand in condition.items():
+        if op == '$eq':
+            matched = _equals(value, operand)
+        elif op == '$ne':
+            matched = not _equals(value, operand)
+        elif op in _COMPARISONS:
+            matched = _compare(value, operand, _COMPARISONS[op])
+        elif op == '$in':
+            matched = any(_equals(value, item) for item in operand)
+        elif op == '$nin':
+            matched = not any(_equals(value, item) for item in operand)
+        elif op == '$exists':
+            matched = (value is not _MISSING) == bool(operand)
+        elif op == '$not':
+            matched = not _match_condition(value, operand)
+        elif op == '$size':
+            matched = isinstance(value, list) and len(value) == operand
+        elif op == '$all':
+            matched = value is not _MISSING and all(_equals(value, item) for item in operand)
+        elif op == '$regex':
+            matched = value is not _MISSING and _regex(value, operand, condition.get('$options', ''))
+        elif op == '$options':
+            matched = True
+        else:
+            raise ValueError("Unsupported query operator '{0}'".format(op))
+        if not matched:
+            return False
+    return True
+
+def matches(document, filter):
+    """Returns True if a dictionary satisfies a filter
+
+    Args:
+        document    A decoded dictionary, including its "_id" key
+
+        filter      A MongoDB-style filter dictionary
+
+    Raises:
+        ValueError  This method will throw a ValueError if the filter uses
+                    an unknown operator
+    """
+
+    for key, condition in filter.items():
+        if key == '$and':
+            matched = all(matches(document, part) for part in condition)
+        elif key == '$or':
+            matched = any(matches(document, part) for part in condition)
+        elif key == '$nor':
+            matched = not any(matches(document, part) for part in condition)
+        elif key.startswith('$'):
+            raise ValueError("Unsupported query operator '{0}'".format(key))
+        else:
+            matched = _match_condition(resolve(document, key), condition)
+        if not matched:
+            return False
+    return True
+
+def _sql_string(value):
+    return "'{0}'".format(value.replace("'", "''"))
+
+def json_path(field):
+    """Returns the SQLite JSON path of a dotted field, or None if it cannot be expressed"""
+
+    if not isinstance(field, str) or '"' in field or field == '':
+        return None
+    return '$' + ''.join('."{0}"'.format(part) for part in field.split('.'))
+
+def field_expressions(field):
+    """Returns the SQL value and type expressions of a dotted field
+
+    Raises:
+        Unsupported     If the field cannot be expressed in SQL
+    """
+
+    path = json_path(field)
+    if path is None:
+        raise Unsupported()
+    path = _sql_string(path)
+    return ("json_extract({0}, {1})".format(DATA_COLUMN, path),
+            "json_type({0}, {1})".format(DATA_COLUMN, path),
+            path)
+
+def _sql_operand(operand):
+    """Returns a parameter for a scalar operand, which is then compared by value and type"""
+
+    bracket = _bracket(operand)
+    if bracket == 'bool':
+        return int(operand)
+    if bracket == 'number' and isinstance(operand, int) and not -2**63 <= operand < 2**63:
+        raise Unsupported()
+    if bracket in ('number', 'string'):
+        return operand
+    raise Unsupported()
+
+class _Compiler():
+    """Translates filters into SQL WHERE clauses over a collection's table"""
+
+    def __init__(self, table, indexed, json_supported):
+        self.table = table
+        self.indexed = indexed
+        self.json_supported = json_supported
+
+    def conjuncts(self, filter):
+        """Splits a filter into the smallest filters whose conjunction is equivalent"""
+
+        parts = []
+        for key, condition in filter.items():
+            if key == '$and':
+                for part in condition:
+                    parts.extend(self.conjuncts(part))
+            elif not key.startswith('$') and _is_operators(condition) and len(condition) > 1 and '$options' not in condition:
+                for op, operand in condition.items():
+                    parts.append({key: {op: operand}})
+            else:
+                parts.append({key: condition})
+        return parts
+
+    def filter(self, filter):
+        """Returns the SQL and parameters of a filter, all of which must be expressible"""
+
+        clauses = []
+        params = []
+        for part in self.conjuncts(filter):
+            sql, part_params = self.part(part)
+            clauses.append(sql)
+            params.extend(part_params)
+        if len(clauses) == 0:
+            return ("1", [])
+        return (" AND ".join(clauses), params)
+
+    def part(self, part):
+        key, condition = list(part.items())[0]
+        if key == '$or':
+            if len(condition) == 0:
+                return ("0", [])
+            compiled = [self.filter(branch) for branch in condition]
+            return ("(" + " OR ".join("(" + sql + ")" for sql, params in compiled) + ")",
+                    [param for sql, params in compiled for param in params])
+        if key.startswith('$'):
+            raise Unsupported()
+
+        if _is_operators(condition):
+            if len(condition) != 1:
+                raise Unsupported()
+            op, operand = list(condition.items())[0]
+        else:
+            op, operand = '$eq', condition
+        if op not in SQL_OPERATORS:
+            raise Unsupported()
+
+        if key == ID_KEY:
+            return self.id_condition(op, operand)
+        if not self.json_supported:
+            raise Unsupported()
+        return self.field_condition(key, op, operand)
+
+    def id_condition(self, op, operand):
+        """The id is an integer column rather than part of the stored dictionary"""
+
+        if op == '$exists':
+            return ("1" if operand else "0", [])
+        if op in ('$in', '$nin'):
+            values = [item for item in operand if _bracket(item) == 'number']
+            for item in values:
+                _sql_operand(item)
+            sql = "{0} IN ({1})".format(ID_KEY, ",".join("?" * len(values))) if values else "0"
+            if op == '$nin':
+                sql = "NOT (" + sql + ")"
+            return (sql, values)
+        if _bracket(operand) != 'number':
+            # Ids are never anything but numbers
+            return ("1" if op == '$ne' else "0", [])
+        if op == '$eq':
+            return ("{0} = ?".format(ID_KEY), [_sql_operand(operand)])
+        if op == '$ne':
+            return ("{0} != ?".format(ID_KEY), [_sql_operand(operand)])
+        return ("{0} {1} ?".format(ID_KEY, _SQL_COMPARISONS[op]), [_sql_operand(operand)])
+
+    def field_condition(self, field, op, operand):
+        value, type, path = field_expressions(field)
+
+        if op == '$exists':
+            return ("{0} IS {1}NULL".format(type, "NOT " if operand else ""), [])
+        if op in ('$ne', '$nin'):
+            sql, params = self.field_condition(field, '$eq' if op == '$ne' else '$in', operand)
+            return ("NOT COALESCE(" + sql + ", 0)", params)
+        if op == '$in':
+            if len(operand) == 0:
+                return ("0", [])
+            compiled = [self.field_condition(field, '$eq', item) for item in operand]
+            return ("(" + " OR ".join(sql for sql, params in compiled) + ")",
+                    [param for sql, params in compiled for param in params])
+
+        if op == '$eq' and operand is None:
+            return ("({0} IS NULL OR {0} = 'null' OR ({0} = 'array' AND EXISTS (SELECT 1 FROM json_each({1}, {2}) WHERE type = 'null')))".format(type, DATA_COLUMN, path), [])
+        if op != '$eq' and _bracket(operand) not in ('number', 'string'):
+            raise Unsupported()
+        param = _sql_operand(operand)
+        comparison = '=' if op == '$eq' else _SQL_COMPARISONS[op]
+        types = _SQL_TYPES[_bracket(operand)]
+        scalar = "{0} IN {1} AND {2} {3} ?".format(type, types, value, comparison)
+        element = "type IN {0} AND value {1} ?".format(types, comparison)
+        container = "{0} IN ('array', 'object') AND {0} = 'array' AND EXISTS (SELECT 1 FROM json_each({1}, {2}) WHERE {3})".format(type, DATA_COLUMN, path, element)
+
+        if field in self.indexed:
+            # Each half can then use one of the field's indexes
+            return ("{0} IN (SELECT {0} FROM {1} WHERE {2} UNION ALL SELECT {0} FROM {1} WHERE {3})".format(ID_KEY, self.table, scalar, container),
+                    [param, param])
+        return ("((" + scalar + ") OR (" + container + "))", [param, param])
+
+def compile_filter(filter, table, indexed=(), json_supported=True):
+    """Translates as much of a filter as possible into SQL
+
+    Args:
+        filter          A MongoDB-style filter dictionary
+
+        table           The collection's table, used in subqueries
+
+        indexed         Top-level keys with field indexes, defaults to none
+
+        json_supported  If False, only conditions on "_id" are translated,
+                        defaults to True
+
+    Returns:
+        A tuple of an SQL WHERE clause, its parameters, and a filter of any
+        remaining conditions that must be checked with matches(), or None
+    """
+
+    compiler = _Compiler(table, indexed, json_supported)
+    clauses = []
+    params = []
+    remaining = []
+    for part in compiler.conjuncts(filter):
+        try:
+            sql, part_params = compiler.part(part)
+        except Unsupported:
+            remaining.append(part)
+            continue
+        clauses.append(sql)
+        params.extend(part_params)
+
+    where = " AND ".join(clauses) if clauses else "1"
+    if len(remaining) == 0:
+        return (where, params, None)
+    return (where, params, {'$and': remaining})
+
+def sql_value(value):
+    """Returns a value as SQLite's json_extract would, or None if it is missing
+
+    Booleans become integers, and lists and dictionaries JSON text.
+    """
+
+    if value is _MISSING:
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+    return value
+
+def sort_value(value):
+    """Returns a key ordering values as SQLite orders the values of json_extract"""
+
+    value = sql_value(value)
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, repr(value))
+
+def project(document, projection):
+    """Applies a projection to a decoded dictionary
+
+    Args:
+        document    A decoded dictionary
+
+        projection  Either a sequence of keys to keep, as with the fields
+                    argument elsewhere, or a MongoDB-style dictionary of
+                    keys mapped to 1 to include or 0 to exclude.  With a
+                    dictionary, "_id" is kept unless explicitly excluded.
+    """
+
+    if projection is None:
+        return document
+    if not isinstance(projection, dict):
+        return dict((key, value) for key, value in document.items() if key in projection)
+
+    included = [key for key, flag in projection.items() if flag and key != ID_KEY]
+    if len(included) > 0:
+        keep = set(included)
+        if projection.get(ID_KEY, 1):
+            keep.add(ID_KEY)
+        return dict((key, value) for key, value in document.items() if key in keep)
+    return dict((key, value) for key, value in document.items() if projection.get(key, 1))
@@ -0,0 +1,80 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import contextlib
+
+# Nesting depth of transaction() blocks, keyed by id() of the connection
+# because sqlite3.Connection objects cannot be weakly referenced.  Entries
+# are removed when the outermost block exits.
+_depths = {}
+
+@contextlib.contextmanager
+def transaction(connection, immediate=False):
+    """Groups all work on an SQLite connection into a single transaction
+
+    Args:
+        connection  The sqlite3.Connection shared by one or more Collections
+
+        immediate   If True, the database write lock is acquired when the
+                    transaction begins rather than at the first write,
+                    defaults to False
+
+    Notes:
+        The transaction is committed when the block exits normally and rolled
+        back if it raises.  Collection methods called within the block do not
+        commit on their own.  Blocks may be nested, in which case the inner
+        blocks become savepoints that are rolled back independently on error.
+    """
+
+    key = id(connection)
+    depth = _depths.get(key, 0)
+
+    if depth > 0:
+        savepoint = "sostore_{0:d}".format(depth)
+        connection.execute("SAVEPOINT {0}".format(savepoint))
+        _depths[key] = depth + 1
+        try:
+            yield connection
+        except:
+            connection.execute("ROLLBACK TO {0}".format(savepoint))
+            connection.execute("RELEASE {0}".format(savepoint))
+            raise
+        else:
+            connection.execute("RELEASE {0}".format(savepoint))
+        finally:
+            _depths[key] = depth
+        return
+
+    # A transaction implicitly opened by the sqlite3 module is simply
+    # adopted and finished here
+    if not connection.in_transaction:
+        connection.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    _depths[key] = 1
+    try:
+        yield connection
+    except:
+        del _depths[key]
+        connection.rollback()
+        raise
+    else:
+        del _depths[key]
+        connection.commit()
+
+def in_transaction(connection):
+    """Returns True if a transaction() block is active on the connection"""
+
+    return _depths.get(id(connection), 0) > 0
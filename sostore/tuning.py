@@ -0,0 +1,127 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""Connection settings applied when a database is opened
+
+A profile names a set of PRAGMA settings suited to a workload:
+
+    durable     Write-ahead logging with a full sync on every commit, so
+                committed changes survive power loss
+
+    throughput  Write-ahead logging synced only at checkpoints, with
+                memory-mapped I/O and a larger page cache.  Committed
+                changes survive a crash of the application, but the most
+                recent may be lost on power loss.
+
+    readonly    Memory-mapped I/O and a larger page cache on a connection
+                that cannot write, opened read-only if a file
+"""
+import os
+import re
+import sqlite3
+from urllib.parse import quote
+
+# The settings that may be specified, in the order they are applied, as
+# journal_mode affects the meaning of synchronous
+PRAGMAS = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store', 'query_only')
+
+# The number of compiled statements kept by each connection sostore opens,
+# twice the sqlite3 module's default, as each Collection uses its own
+CACHED_STATEMENTS = 256
+
+_MEGABYTE = 1024 * 1024
+
+PROFILES = {'durable':    {'journal_mode': 'WAL', 'synchronous': 'FULL', 'busy_timeout': 5000},
+            'throughput': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000,
+                           # A negative cache_size is in kibibytes rather than pages
+                           'cache_size': -65536, 'mmap_size': 256 * _MEGABYTE, 'temp_store': 'MEMORY'},
+            'readonly':   {'busy_timeout': 5000, 'cache_size': -65536, 'mmap_size': 256 * _MEGABYTE,
+                           'temp_store': 'MEMORY', 'query_only': True}}
+
+_KEYWORD = re.compile(r"^[A-Za-z]+$")
+
+def get_pragmas(profile=None, pragmas=None):
+    """Combines a profile's settings with explicit settings
+
+    Args:
+        profile     The name of a profile in PROFILES, defaults to None
+
+        pragmas     A dictionary of settings, keyed by the names in
+                    PRAGMAS, that override the profile's, defaults to None
+
+    Returns:
+        A dictionary of settings, empty if neither argument is specified
+
+    Raises:
+        ValueError  This method will throw a ValueError if the profile or
+                    a setting is unknown, or a value is neither an integer
+                    nor a keyword such as 'WAL'
+    """
+
+    settings = {}
+    if profile is not None:
+        if profile not in PROFILES:
+            raise ValueError("Unknown connection profile '{0}'".format(profile))
+        settings.update(PROFILES[profile])
+    if pragmas is not None:
+        settings.update(pragmas)
+
+    for name, value in settings.items():
+        if name not in PRAGMAS:
+            raise ValueError("Unknown connection setting '{0}'".format(name))
+        if not isinstance(value, int) and not (isinstance(value, str) and _KEYWORD.match(value)):
+            raise ValueError("Invalid value {0!r} for connection setting '{1}'".format(value, name))
+    return settings
+
+def read_only(settings):
+    """True if the settings prevent writing to the database"""
+
+    return bool(settings.get('query_only', False))
+
+def apply_pragmas(connection, settings):
+    """Applies settings from get_pragmas to an open connection"""
+
+    for name in PRAGMAS:
+        if name in settings:
+            value = settings[name]
+            if isinstance(value, bool):
+                value = int(value)
+            connection.execute("PRAGMA {0}={1}".format(name, value)).fetchall()
+
+def connect(db, settings, uri=False, **kwargs):
+    """Opens a connection with the settings from get_pragmas
+
+    Args:
+        db          Database filename or URI
+
+        settings    The settings returned by get_pragmas
+
+        uri         True if db is a URI, defaults to False
+
+        kwargs      Further arguments to sqlite3.connect
+
+    Notes:
+        Database files opened with read-only settings are opened in
+        SQLite's read-only mode, and so must already exist.
+    """
+
+    if read_only(settings) and not uri and db != ":memory:":
+        db = "file:{0}?mode=ro".format(quote(os.path.abspath(db)))
+        uri = True
+    connection = sqlite3.connect(db, isolation_level=None, uri=uri, **kwargs)
+    apply_pragmas(connection, settings)
+    return connection
@@ -0,0 +1,252 @@
+#    sostore - SQLite Object Store
+#    Copyright (C) 2013 Jeffrey Armstrong 
+#                            <jeffrey.armstrong@approximatrix.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""MongoDB-style update operators for Collection.update_fields
+
+An update is a dictionary mapping operators to dictionaries of keys, or
+dotted paths into nested dictionaries, and their operands.  Updates are
+applied in Python by apply_update(), which defines their behavior, and are
+compiled by compile_update() into a single SQL expression over the data
+column using SQLite's JSON functions.
+"""
+import copy
+import sqlite3
+
+from sostore.query import Unsupported, DATA_COLUMN, ID_KEY, json_path, matches, _bracket, _same, _match_condition, _is_operators, _sql_string, _sql_operand, _SQL_TYPES, _MISSING
+
+UPDATE_OPERATORS = ('$set', '$unset', '$inc', '$push', '$pull')
+
+# Appending with the "[#]" path requires SQLite 3.31
+_JSON_APPEND = sqlite3.sqlite_version_info >= (3, 31, 0)
+
+# Evaluating json('') raises an error, aborting an UPDATE that would apply
+# an operator to a value of the wrong type
+_SQL_FAILURE = "json('')"
+SQL_FAILURE_MESSAGE = 'malformed JSON'
+
+def check_update(update):
+    """Raises a ValueError if an update is malformed
+
+    As in MongoDB, the "_id" key cannot be changed and a key cannot be the
+    subject of more than one operator, nor can a key and a key nested
+    within it.
+    """
+
+    if not isinstance(update, dict) or len(update) == 0:
+        raise ValueError("An update must be a dictionary of operators")
+
+    paths = []
+    for op, fields in update.items():
+        if op not in UPDATE_OPERATORS:
+            raise ValueError("Unsupported update operator '{0}'".format(op))
+        if not isinstance(fields, dict):
+            raise ValueError("The operand of {0} must be a dictionary".format(op))
+        for field, operand in fields.items():
+            if not isinstance(field, str) or field == '' or field.split('.')[0] == ID_KEY:
+                raise ValueError("The key '{0}' cannot be updated".format(field))
+            if op == '$inc' and _bracket(operand) != 'number':
+                raise ValueError("$inc requires a number for '{0}'".format(field))
+            paths.append(field.split('.'))
+
+    for i, path in enumerate(paths):
+        for other in paths[i + 1:]:
+            if path[:len(other)] == other or other[:len(path)] == path:
+                raise ValueError("Conflicting updates to '{0}'".format('.'.join(path)))
+
+def _parent(document, field, create):
+    """Returns the dictionary holding the last part of a dotted path, or None"""
+
+    parts = field.split('.')
+    for part in parts[:-1]:
+        if part not in document and create:
+            document[part] = {}
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return None
+    return document
+
+def _pushed(operand):
+    if isinstance(operand, dict) and list(operand.keys()) == ['$each']:
+        return list(operand['$each'])
+    return [operand]
+
+def _pulled(element, operand):
+    if _is_operators(operand):
+        return _match_condition(element, operand)
+    if isinstance(operand, dict):
+        return isinstance(element, dict) and matches(element, operand)
+    return _same(element, operand)
+
+def apply_update(document, update):
+    """Applies an update to a dictionary in place
+
+    Args:
+        document    A decoded dictionary
+
+        update      A MongoDB-style update dictionary, which should
+                    already have been checked with check_update()
+
+    Raises:
+        ValueError  This method will throw a ValueError if $inc is applied
+                    to a value that isn't a number, or $push or $pull to
+                    one that isn't a list
+
+    Notes:
+        Keys within a value that isn't a dictionary are left unchanged.
+    """
+
+    for op, fields in update.items():
+        for field, operand in fields.items():
+            parent = _parent(document, field, op in ('$set', '$inc', '$push'))
+            if parent is None:
+                continue
+            key = field.split('.')[-1]
+            current = parent.get(key, _MISSING)
+
+            if op == '$set':
+                parent[key] = copy.deepcopy(operand)
+            elif op == '$unset':
+                parent.pop(key, None)
+            elif op == '$inc':
+                if current is _MISSING:
+                    parent[key] = operand
+                elif _bracket(current) == 'number':
+                    parent[key] = current + operand
+                else:
+                    raise ValueError("$inc applied to '{0}', which isn't a number".format(field))
+            elif op == '$push':
+                if current is _MISSING:
+                    parent[key] = copy.deepcopy(_pushed(operand))
+                elif isinstance(current, list):
+                    current.extend(copy.deepcopy(_pushed(operand)))
+                else:
+                    raise ValueError("$push applied to '{0}', which isn't a list".format(field))
+            elif op == '$pull':
+                if current is _MISSING:
+                    continue
+                if not isinstance(current, list):
+                    raise ValueError("$pull applied to '{0}', which isn't a list".format(field))
+                parent[key] = [element for element in current if not _pulled(element, operand)]
+    return document
+
+# The alias of the json_each() table of elements a $pull considers
+_PULLED = 'pulled'
+
+def _element_condition(operand):
+    """Returns the SQL and parameters matching a json_each() element pulled by an operand"""
+
+    if _is_operators(operand):
+        if list(operand.keys()) != ['$in']:
+            raise Unsupported()
+        compiled = [_element_equals(item) for item in operand['$in']]
+        if len(compiled) == 0:
+            return ("0", [])
+        return ("(" + " OR ".join(sql for sql, params in compiled) + ")",
+                [param for sql, params in compiled for param in params])
+    return _element_same(operand)
+
+def _element_equals(operand):
+    """Returns the SQL and parameters matching an element equal to an operand, as a query does
+
+    As in MongoDB, an element that is itself a list is equal if any of its
+    elements is.
+    """
+
+    sql, params = _element_same(operand)
+    return ("({0} OR ({1}.type = 'array' AND EXISTS (SELECT 1 FROM json_each({1}.value) WHERE {0})))".format(sql, _PULLED),
+            params + params)
+
+def _element_same(operand):
+    """Returns the SQL and parameters matching an element of the same type and value as an operand"""
+
+    if operand is None:
+        return ("type = 'null'", [])
+    bracket = _bracket(operand)
+    if bracket not in _SQL_TYPES:
+        raise Unsupported()
+    return ("(type IN {0} AND value = ?)".format(_SQL_TYPES[bracket]), [_sql_operand(operand)])
+
+def compile_update(update, encode):
+    """Translates an update into an SQL expression computing the new data column
+
+    Args:
+        update      A MongoDB-style update dictionary, which should
+                    already have been checked with check_update()
+
+        encode      A function returning the JSON text of an operand
+
+    Returns:
+        A tuple of the SQL expression and its parameters
+
+    Raises:
+        Unsupported     If the update cannot be performed by SQLite
+
+    Notes:
+        Because no two operators may change overlapping keys, each operator
+        reads the original data column, keeping the expression's size
+        proportional to the number of keys updated.  Applying an operator to
+        a value of the wrong type raises an sqlite3.OperationalError with
+        the message SQL_FAILURE_MESSAGE.
+    """
+
+    expression = DATA_COLUMN
+    params = []
+    for op, fields in update.items():
+        for field, operand in fields.items():
+            path = json_path(field)
+            if path is None:
+                raise Unsupported()
+            path = _sql_string(path)
+            type = "json_type({0}, {1})".format(DATA_COLUMN, path)
+            value = "json_extract({0}, {1})".format(DATA_COLUMN, path)
+
+            if op == '$set':
+                expression = "json_set({0}, {1}, json(?))".format(expression, path)
+                params.append(encode(operand))
+            elif op == '$unset':
+                expression = "json_remove({0}, {1})".format(expression, path)
+            elif op == '$inc':
+                expression = ("json_set({0}, {1}, CASE WHEN {2} IS NULL THEN ? "
+                              "WHEN {2} IN ('integer', 'real') THEN {3} + ? "
+                              "ELSE {4} END)").format(expression, path, type, value, _SQL_FAILURE)
+                params.extend([operand, operand])
+            elif op == '$push':
+                if not _JSON_APPEND:
+                    raise Unsupported()
+                values = _pushed(operand)
+                appended = value
+                for item in values:
+                    appended = "json_insert({0}, '$[#]', json(?))".format(appended)
+                expression = ("json_set({0}, {1}, json(CASE WHEN {2} IS NULL THEN ? "
+                              "WHEN {2} = 'array' THEN {3} "
+                              "ELSE {4} END))").format(expression, path, type, appended, _SQL_FAILURE)
+                params.append(encode(values))
+                params.extend(encode(item) for item in values)
+            elif op == '$pull':
+                condition, condition_params = _element_condition(operand)
+                # json_each() gives scalars as SQL values and containers as
+                # JSON text, which are converted back to JSON for the array
+                element = ("json(CASE WHEN type IN ('object', 'array') THEN value "
+                           "WHEN type IN ('true', 'false', 'null') THEN type "
+                           "ELSE json_quote(value) END)")
+                kept = ("(SELECT json_group_array({0}) FROM (SELECT type, value FROM json_each({1}, {2}) AS {4} "
+                        "WHERE NOT {3} ORDER BY key))").format(element, DATA_COLUMN, path, condition, _PULLED)
+                expression = ("json_replace({0}, {1}, json(CASE WHEN {2} IS NULL THEN NULL "
+                              "WHEN {2} = 'array' THEN {3} "
+                              "ELSE {4} END))").format(expression, path, type, kept, _SQL_FAILURE)
+                params.extend(condition_params)
+    return (expression, params)
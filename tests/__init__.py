@@ -1,5 +1,36 @@
 import unittest
 from tests.test_collection import CollectionTestCase
+from tests.test_codec import CodecTestCase
+from tests.test_compression import CompressionTestCase
+from tests.test_cache import CacheTestCase
+from tests.test_pool import PoolTestCase
+from tests.test_asynchronous import AsyncCollectionTestCase
+from tests.test_query import QueryTestCase
+from tests.test_update import UpdateTestCase
+from tests.test_bulk import BulkTestCase
+from tests.test_aggregate import AggregateTestCase
+from tests.test_instrument import InstrumentTestCase
+from tests.test_tuning import TuningTestCase
+from tests.test_database import DatabaseTestCase
+from tests.test_text import TextSearchTestCase
+from tests.test_transfer import TransferTestCase
+from tests.test_changes import ChangeLogTestCase
 
 def suite():
-    return unittest.TestLoader().loadTestsFromTestCase(CollectionTestCase)
+    loader = unittest.TestLoader()
+    return unittest.TestSuite((loader.loadTestsFromTestCase(CollectionTestCase),
+                               loader.loadTestsFromTestCase(CodecTestCase),
+                               loader.loadTestsFromTestCase(CompressionTestCase),
+                               loader.loadTestsFromTestCase(CacheTestCase),
+                               loader.loadTestsFromTestCase(PoolTestCase),
+                               loader.loadTestsFromTestCase(AsyncCollectionTestCase),
+                               loader.loadTestsFromTestCase(QueryTestCase),
+                               loader.loadTestsFromTestCase(UpdateTestCase),
+                               loader.loadTestsFromTestCase(BulkTestCase),
+                               loader.loadTestsFromTestCase(AggregateTestCase),
+                               loader.loadTestsFromTestCase(InstrumentTestCase),
+                               loader.loadTestsFromTestCase(TuningTestCase),
+                               loader.loadTestsFromTestCase(DatabaseTestCase),
+                               loader.loadTestsFromTestCase(TextSearchTestCase),
+                               loader.loadTestsFromTestCase(TransferTestCase),
+                               loader.loadTestsFromTestCase(ChangeLogTestCase)))
@@ -0,0 +1,58 @@
+import unittest
+from sostore import Collection, ID_KEY
+
+PEOPLE = [{'first': 'Henry', 'age': 34, 'city': 'Akron', 'pets': 2, 'address': {'zip': 44301}},
+          {'first': 'Erin', 'age': 31, 'city': 'Kent', 'pets': 1.5},
+          {'first': 'Stephen', 'age': 28, 'city': 'Akron', 'pets': 'none', 'address': {'zip': 44301}},
+          {'first': 'Margaux', 'age': None, 'city': 'Canton', 'pets': True},
+          {'first': 'Jeffrey', 'city': ['Akron', 'Kent'], 'pets': 3}]
+
+QUERIES = [(None, None, None),
+           ({'age': {'$gt': 30}}, None, {'n': 'count', 'total': ('sum', 'pets'), 'ids': ('sum', ID_KEY)}),
+           (None, 'city', {'n': 'count', 'ages': ('count', 'age'), 'oldest': ('max', 'age'), 'youngest': ('min', 'age')}),
+           (None, ['city', 'address.zip'], {'pets': ('avg', 'pets'), 'first': ('min', 'first'), 'last': ('max', 'pets')}),
+           ({'first': {'$regex': 'e'}}, 'pets', None),
+           ({'first': 'Nobody'}, None, {'n': 'count', 'total': ('sum', 'age'), 'mean': ('avg', 'age'), 'low': ('min', 'age')})]
+
+class AggregateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases")
+        self.pickled = Collection("pickled", connection=self.db.connection, codec='pickle')
+        for db in (self.db, self.pickled):
+            db.insert_many(dict(person) for person in PEOPLE)
+
+    def tearDown(self):
+        self.db.done()
+
+    def test_aggregate(self):
+        for match, group_by, metrics in QUERIES:
+            self.assertEqual(self.db.aggregate(match, group_by, metrics), self.pickled.aggregate(match, group_by, metrics),
+                             (match, group_by, metrics))
+
+        res = self.db.aggregate(group_by='city', metrics={'n': 'count', 'age': ('avg', 'age')})
+        self.assertEqual(res, [{'city': 'Akron', 'n': 2, 'age': 31.0},
+                               {'city': 'Canton', 'n': 1, 'age': None},
+                               {'city': 'Kent', 'n': 1, 'age': 31.0},
+                               {'city': '["Akron","Kent"]', 'n': 1, 'age': None}])
+        self.assertEqual(self.db.aggregate({'first': 'Nobody'}, metrics={'n': 'count', 'total': ('sum', 'pets')}),
+                         [{'n': 0, 'total': 0}])
+        self.assertEqual(self.db.aggregate(metrics={'total': ('sum', 'pets')}), [{'total': 6.5}])
+
+        self.assertRaises(ValueError, self.db.aggregate, metrics={'n': ('median', 'age')})
+        self.assertRaises(ValueError, self.db.aggregate, metrics={'n': 'sum'})
+
+    def test_distinct(self):
+        for db in (self.db, self.pickled):
+            self.assertEqual(db.distinct('city'), ['Akron', 'Canton', 'Kent', '["Akron","Kent"]'])
+            self.assertEqual(db.distinct('pets'), [1, 1.5, 2, 3, 'none'])
+            self.assertEqual(db.distinct('pets', {'city': 'Akron'}), [2, 3, 'none'])
+            self.assertEqual(db.distinct('address.zip'), [44301])
+
+        self.db.create_index('city')
+        self.assertEqual(self.db.distinct('city', {'first': {'$ne': 'Jeffrey'}}), ['Akron', 'Canton', 'Kent'])
+
+    def test_count_documents(self):
+        for db in (self.db, self.pickled):
+            self.assertEqual(db.count_documents(), 5)
+            self.assertEqual(db.count_documents({'city': 'Akron'}), 3)
+            self.assertEqual(db.count_documents({'age': {'$gte': 30}, 'first': {'$regex': '^H'}}), 1)
@@ -0,0 +1,65 @@
+import unittest
+import asyncio
+from sostore import AsyncCollection, ID_KEY, DESCENDING
+
+class AsyncCollectionTestCase(unittest.TestCase):
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+        
+    def test_operations(self):
+        async def operations():
+            db = AsyncCollection("testcases")
+            d = await db.insert({'first': 'Henry', 'occupation': 'magician'})
+            self.assertIn(ID_KEY, d)
+            self.assertEqual((await db.get(d[ID_KEY]))['first'], 'Henry')
+            
+            d['last'] = 'McCallum'
+            await db.update(d)
+            self.assertEqual((await db.find_one('occupation', 'magician'))['last'], 'McCallum')
+            self.assertEqual(await db.find_field('first', 'Henry'), [d[ID_KEY]])
+            
+            ids = await db.insert_many([{'first': 'Margaux'}, {'first': 'Erin'}])
+            self.assertEqual(await db.count(), 3)
+            self.assertEqual([x['first'] for x in await db.get_many(ids)], ['Margaux', 'Erin'])
+            self.assertEqual(len(await db.all()), 3)
+            
+            await db.remove(d)
+            self.assertIsNone(await db.get(d[ID_KEY]))
+            await db.done()
+            
+        self.run_async(operations())
+        
+    def test_coalesced_writes(self):
+        async def writes():
+            db = AsyncCollection("testcases")
+            results = await asyncio.gather(*[db.insert({'n': n}) for n in range(100)])
+            self.assertEqual(sorted(d['n'] for d in results), list(range(100)))
+            self.assertEqual(len(set(d[ID_KEY] for d in results)), 100)
+            
+            # A failing write doesn't affect the others in its transaction
+            existing = results[0]
+            results = await asyncio.gather(db.insert({'n': 100}), db.insert(existing), db.insert({'n': 101}),
+                                           return_exceptions=True)
+            self.assertIsInstance(results[1], ValueError)
+            self.assertEqual(results[2]['n'], 101)
+            self.assertEqual(await db.count(), 102)
+            await db.done()
+            
+        self.run_async(writes())
+        
+    def test_iteration(self):
+        async def iteration():
+            db = AsyncCollection("testcases")
+            await db.insert_many({'n': n} for n in range(25))
+            seen = []
+            async for d in db.iter_all(fields=('n',), batch_size=10):
+                seen.append(d['n'])
+            self.assertEqual(seen, list(range(25)))
+            
+            page, token = await db.find_page({'n': {'$gte': 10}}, sort=[('n', DESCENDING)], limit=10)
+            self.assertEqual([d['n'] for d in page], list(range(24, 14, -1)))
+            page, token = await db.find_page({'n': {'$gte': 10}}, sort=[('n', DESCENDING)], limit=10, after=token)
+            self.assertEqual(([d['n'] for d in page], token), (list(range(14, 9, -1)), None))
+            await db.done()
+            
+        self.run_async(iteration())
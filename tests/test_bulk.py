@@ -0,0 +1,66 @@
+import unittest
+from sostore import Collection, ID_KEY
+
+class BulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases", cache_size=10)
+        self.pickled = Collection("pickled", connection=self.db.connection, codec='pickle')
+
+    def tearDown(self):
+        self.db.done()
+
+    def test_remove_many(self):
+        for db in (self.db, self.pickled):
+            ids = db.insert_many({'n': n, 'even': n % 2 == 0} for n in range(2000))
+            db.get(ids[0])
+            self.assertEqual(db.remove_many([ids[0], {ID_KEY: ids[1]}, ids[0], 100000]), 2)
+            self.assertIsNone(db.get(ids[0]))
+            self.assertEqual(db.remove_many(ids[2:1500]), 1498)
+            self.assertEqual(db.remove_many({'even': True, 'n': {'$lt': 1800}}), 150)
+            self.assertEqual(db.remove_many({'n': {'$size': 2}}), 0)
+            self.assertEqual(db.count, 350)
+
+    def test_upsert(self):
+        for db in (self.db, self.pickled):
+            d = db.upsert({'email': 'henry@example.com', 'first': 'Henry'})
+            self.assertEqual(db.get(d[ID_KEY])['first'], 'Henry')
+            db.upsert({ID_KEY: d[ID_KEY], 'email': 'henry@example.com', 'first': 'Stephen'})
+            db.upsert({ID_KEY: 500, 'first': 'Erin'})
+            self.assertEqual([x['first'] for x in db.all()], ['Stephen', 'Erin'])
+
+            e = db.upsert({'email': 'henry@example.com', 'first': 'Jeffrey'}, key_field='email')
+            self.assertEqual(e[ID_KEY], d[ID_KEY])
+            self.assertEqual(db.get(d[ID_KEY]), {ID_KEY: d[ID_KEY], 'email': 'henry@example.com', 'first': 'Jeffrey'})
+            e = db.upsert({'address': {'zip': 44301}, 'first': 'Margaux'}, key_field='address.zip')
+            self.assertEqual(db.upsert({'address': {'zip': 44301.0}}, key_field='address.zip')[ID_KEY], e[ID_KEY])
+            self.assertEqual(db.count, 3)
+
+            self.assertRaises(ValueError, db.upsert, {'first': 'Henry'}, key_field='email')
+            self.assertRaises(ValueError, db.upsert, {ID_KEY: 1, 'email': 'x'}, key_field='email')
+
+        self.db.create_index('email', unique=True)
+        f = self.db.upsert({'email': 'erin@example.com'}, key_field='email')
+        self.assertEqual(self.db.upsert({'email': 'erin@example.com', 'n': 1}, key_field='email')[ID_KEY], f[ID_KEY])
+        self.assertEqual(self.db.find({'email': 'erin@example.com'}), [{ID_KEY: f[ID_KEY], 'email': 'erin@example.com', 'n': 1}])
+
+    def test_bulk_write(self):
+        for db in (self.db, self.pickled):
+            d = db.insert({'first': 'Henry', 'visits': 1})
+            results = db.bulk_write([('insert', {'first': 'Erin'}),
+                                     ('insert', {'first': 'Stephen'}),
+                                     ('update_fields', d[ID_KEY], {'$inc': {'visits': 1}}),
+                                     ('upsert', {'first': 'Erin', 'visits': 5}, 'first'),
+                                     ('upsert', {'first': 'Margaux'}, 'first'),
+                                     ('remove', d),
+                                     ('remove', d[ID_KEY]),
+                                     ('remove_many', {'first': 'Stephen'})])
+            self.assertEqual([x['first'] for x in results[:2]], ['Erin', 'Stephen'])
+            self.assertEqual(results[2], 1)
+            self.assertEqual(results[3][ID_KEY], results[0][ID_KEY])
+            self.assertEqual(results[5:], [1, 0, 1])
+            self.assertEqual(db.all(), [{ID_KEY: results[0][ID_KEY], 'first': 'Erin', 'visits': 5}, results[4]])
+
+            # A failure rolls back every operation
+            self.assertRaises(ValueError, db.bulk_write, [('insert', {'first': 'Jeffrey'}), ('insert', results[4])])
+            self.assertRaises(ValueError, db.bulk_write, [('replace', {})])
+            self.assertEqual(db.count, 2)
@@ -0,0 +1,106 @@
+import unittest
+import os
+import tempfile
+from sostore import Collection, ID_KEY
+from sostore.cache import DocumentCache
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases", cache_size=2)
+        
+    def tearDown(self):
+        self.db.done()
+        
+    def test_hits(self):
+        d = self.db.insert({'first': 'Henry', 'siblings': ['Erin']})
+        self.assertEqual(self.db.cache_info(), {'hits': 0, 'misses': 0, 'entries': 0, 'bytes': 0})
+        
+        self.db.get(d[ID_KEY])
+        res = self.db.get(d[ID_KEY])
+        self.assertEqual(res, d)
+        info = self.db.cache_info()
+        self.assertEqual((info['hits'], info['misses'], info['entries']), (1, 1, 1))
+        
+        # Returned dictionaries are copies
+        res['siblings'].append('Stephen')
+        self.assertEqual(self.db.get(d[ID_KEY])['siblings'], ['Erin'])
+        
+        self.db.insert({'first': 'Margaux'})
+        self.db.get(d[ID_KEY])
+        self.assertEqual(self.db.cache_info()['hits'], 3)
+        
+        self.assertIsNone(Collection("uncached", connection=self.db.connection).cache_info())
+        
+    def test_eviction(self):
+        ids = self.db.insert_many({'n': n} for n in range(3))
+        for id in ids:
+            self.db.get(id)
+        self.assertEqual(self.db.cache_info()['entries'], 2)
+        self.db.get(ids[2])
+        self.db.get(ids[0])
+        self.assertEqual(self.db.cache_info()['hits'], 1)
+        
+        cache = DocumentCache(max_bytes=10)
+        cache.put(1, {'n': 1}, 6)
+        cache.put(2, {'n': 2}, 6)
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.get(1))
+        cache.put(3, {'n': 3}, 11)
+        self.assertEqual(len(cache), 1)
+        
+    def test_invalidation(self):
+        d = self.db.insert({'first': 'Henry'})
+        self.db.get(d[ID_KEY])
+        
+        d['last'] = 'McCallum'
+        self.db.update(d)
+        self.assertEqual(self.db.get(d[ID_KEY])['last'], 'McCallum')
+        
+        self.db.remove(d)
+        self.assertIsNone(self.db.get(d[ID_KEY]))
+        
+        # Changes through another Collection on the same connection
+        d = self.db.insert({'first': 'Margaux'})
+        self.db.get(d[ID_KEY])
+        other = Collection("testcases", connection=self.db.connection)
+        d['first'] = 'Erin'
+        other.update(d)
+        self.assertEqual(self.db.get(d[ID_KEY])['first'], 'Erin')
+        
+        # Ids SQLite converts are invalidated along with the stored id
+        id = str(d[ID_KEY])
+        self.assertEqual(self.db.get(id)['first'], 'Erin')
+        self.db.update({ID_KEY: d[ID_KEY], 'first': 'Stephen'})
+        self.assertEqual(self.db.get(id)['first'], 'Stephen')
+        self.db.remove(d[ID_KEY])
+        self.assertIsNone(self.db.get(id))
+        
+    def test_rollback(self):
+        d = self.db.insert({'first': 'Henry'})
+        try:
+            with self.db.transaction():
+                d['first'] = 'Stephen'
+                self.db.update(d)
+                self.assertEqual(self.db.get(d[ID_KEY])['first'], 'Stephen')
+                raise KeyError()
+        except KeyError:
+            pass
+        self.assertEqual(self.db.get(d[ID_KEY])['first'], 'Henry')
+        
+    def test_other_connection(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "cache.db")
+        try:
+            db = Collection("testcases", db=filename, cache_bytes=1024)
+            other = Collection("testcases", db=filename)
+            d = db.insert({'first': 'Henry'})
+            self.assertEqual(db.get(d[ID_KEY])['first'], 'Henry')
+            
+            d['first'] = 'Stephen'
+            other.update(d)
+            self.assertEqual(db.get(d[ID_KEY])['first'], 'Stephen')
+            db.done()
+            other.done()
+        finally:
+            os.remove(filename)
+            os.rmdir(directory)
@@ -0,0 +1,102 @@
+import unittest
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+from sostore import Collection, AsyncCollection, ChangesTruncatedException, ID_KEY
+
+class ChangeLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "changes.db")
+        self.db = Collection("testcases", db=self.filename)
+        self.db.create_change_log()
+        
+    def tearDown(self):
+        self.db.done()
+        shutil.rmtree(self.directory)
+        
+    def changes(self, seq=0, limit=None):
+        return [(change['seq'], change[ID_KEY], change['operation']) for change in self.db.changes_since(seq, limit)]
+        
+    def test_changes(self):
+        self.assertEqual(self.db.last_change(), 0)
+        self.assertEqual(self.changes(), [])
+        self.db.insert({'n': 1})
+        self.db.insert_many([{'n': 2}, {'n': 3}])
+        self.db.update_fields(1, {'$set': {'n': 4}})
+        self.db.update_many({'n': {'$gt': 2}}, {'$inc': {'n': 1}})
+        self.db.upsert({ID_KEY: 2, 'n': 5})
+        self.db.remove(3)
+        self.assertEqual(self.changes(), [(1, 1, 'insert'), (2, 2, 'insert'), (3, 3, 'insert'), (4, 1, 'update'),
+                                          (5, 1, 'update'), (6, 3, 'update'), (7, 2, 'update'), (8, 3, 'remove')])
+        self.assertEqual(self.changes(5, limit=2), [(6, 3, 'update'), (7, 2, 'update')])
+        self.assertEqual(self.db.last_change(), 8)
+        
+        # Rolled back changes are never recorded
+        try:
+            with self.db.transaction():
+                self.db.insert({'n': 6})
+                raise KeyError('rolled back')
+        except KeyError:
+            pass
+        self.assertEqual(self.changes(8), [])
+        self.db.insert({'n': 7})
+        self.assertEqual(self.changes(8), [(9, 4, 'insert')])
+        
+    def test_retention(self):
+        self.db.insert_many({'n': n} for n in range(10))
+        self.assertEqual(self.db.truncate_changes(4), 4)
+        self.assertEqual(self.changes(4)[0][0], 5)
+        self.assertRaises(ChangesTruncatedException, self.db.changes_since, 3)
+        self.assertRaises(ChangesTruncatedException, self.db.changes_since, 11)
+        
+        self.db.create_change_log(retention=3)
+        self.assertEqual([change[0] for change in self.changes(7)], [8, 9, 10])
+        self.db.insert({'n': 10})
+        self.assertEqual([change[0] for change in self.changes(8)], [9, 10, 11])
+        self.assertRaises(ChangesTruncatedException, self.db.changes_since, 7)
+        
+        self.db.truncate_changes(self.db.last_change())
+        self.assertEqual(self.changes(11), [])
+        self.assertRaises(ChangesTruncatedException, self.db.changes_since, 10)
+        self.assertRaises(ValueError, self.db.create_change_log, retention=0)
+        
+        self.db.drop_change_log()
+        self.db.insert({'n': 11})
+        self.assertRaises(ValueError, self.db.changes_since, 0)
+        
+    def test_watch(self):
+        def write():
+            other = Collection("testcases", db=self.filename)
+            other.insert({'n': 1})
+            other.remove(1)
+            other.done()
+            
+        changes = self.db.watch(interval=0.01)
+        thread = threading.Thread(target=write)
+        thread.start()
+        # Changes made before iteration begins are still returned
+        thread.join()
+        self.assertEqual(next(changes)['operation'], 'insert')
+        self.assertEqual(next(changes)['operation'], 'remove')
+        
+        async def watch():
+            db = AsyncCollection("testcases", db=self.filename)
+            watched = []
+            async def consume():
+                async for change in db.watch(interval=0.01):
+                    watched.append(change['seq'])
+                    if len(watched) == 2:
+                        break
+            consumer = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.05)
+            await db.insert({'n': 2})
+            await db.insert({'n': 3})
+            await consumer
+            self.assertEqual(watched, [3, 4])
+            self.assertEqual(len(await db.changes_since(0)), 4)
+            await db.done()
+            
+        asyncio.run(watch())
@@ -0,0 +1,77 @@
+import unittest
+import os
+import tempfile
+import datetime
+from sostore import Collection, ID_KEY, CodecException, available_codecs, get_codec
+
+class CodecTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "codecs.db")
+        
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rmdir(self.directory)
+        
+    def test_default(self):
+        db = Collection("testcases")
+        self.assertEqual(db.codec.name, 'json')
+        db.done()
+        
+    def test_available(self):
+        self.assertIn('json', available_codecs())
+        self.assertIn('pickle', available_codecs())
+        self.assertRaises(ValueError, get_codec, 'nonexistant')
+        self.assertRaises(ValueError, Collection, "testcases", codec='nonexistant')
+        
+    def test_pickle(self):
+        db = Collection("testcases", codec='pickle')
+        
+        d = {'first': 'Margaux', 'born': datetime.date(1985, 7, 3), 'key': b'\x00\xff', 'pair': (1, 2)}
+        d = db.insert(d)
+        res = db.get(d[ID_KEY])
+        self.assertEqual(res['born'], datetime.date(1985, 7, 3))
+        self.assertEqual(res['key'], b'\x00\xff')
+        self.assertEqual(res['pair'], (1, 2))
+        
+        typeof = db.connection.execute("SELECT typeof(_data) FROM testcases").fetchone()[0]
+        self.assertEqual(typeof, 'blob')
+        
+        # Searches are performed in Python for binary codecs
+        self.assertEqual(db.find_field('first', 'Margaux'), [d[ID_KEY]])
+        self.assertRaises(ValueError, db.create_index, 'first')
+        db.done()
+        
+    def test_recorded(self):
+        db = Collection("testcases", db=self.filename, codec='pickle')
+        d = db.insert({'key': b'\x01'})
+        db.done()
+        
+        db = Collection("testcases", db=self.filename)
+        self.assertEqual(db.codec.name, 'pickle')
+        self.assertEqual(db.get(d[ID_KEY])['key'], b'\x01')
+        db.done()
+        
+        self.assertRaises(CodecException, Collection, "testcases", db=self.filename, codec='json')
+        
+    @unittest.skipUnless('orjson' in available_codecs(), "orjson is not installed")
+    def test_orjson(self):
+        db = Collection("testcases", db=self.filename)
+        d = db.insert({'first': 'Henry'})
+        db.done()
+        
+        db = Collection("testcases", db=self.filename, codec='orjson')
+        self.assertEqual(db.get(d[ID_KEY])['first'], 'Henry')
+        d2 = db.insert({'first': 'Erin'})
+        self.assertEqual(db.find_field('first', 'Erin'), [d2[ID_KEY]])
+        db.done()
+        
+    @unittest.skipUnless('msgpack' in available_codecs(), "msgpack is not installed")
+    def test_msgpack(self):
+        db = Collection("testcases", codec='msgpack')
+        d = db.insert({'first': 'Henry', 'key': b'\x00\xff'})
+        res = db.get(d[ID_KEY])
+        self.assertEqual(res['key'], b'\x00\xff')
+        self.assertEqual(res['first'], 'Henry')
+        db.done()
@@ -1,5 +1,11 @@
 import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import sostore
 from sostore import Collection, ID_KEY, ConnectionException
+from sostore.query import compile_filter
 
 class CollectionTestCase(unittest.TestCase):
     def setUp(self):
@@ -273,3 +279,307 @@ class CollectionTestCase(unittest.TestCase):
         res = self.db.find_field('age', '17', compare_function=lambda x,y: int(x) == int(y))
         self.assertEqual(len(res), 1)
         self.assertEqual(res[0], d4[ID_KEY])
+        
+    def test_insert_many(self):
+        people = [{'first': 'Henry'}, {'first': 'Margaux'}, {'first': 'Stephen'}]
+        
+        ids = self.db.insert_many(people, batch_size=2)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(self.db.count, 3)
+        for id, person in zip(ids, people):
+            self.assertEqual(person[ID_KEY], id)
+            self.assertEqual(self.db.get(id)['first'], person['first'])
+            
+        d = self.db.insert({'first': 'Erin'})
+        self.assertTrue(d[ID_KEY] > ids[-1])
+        
+    def test_insert_many_generator(self):
+        ids = self.randomdb.insert_many(({'n': n} for n in range(25)), batch_size=10)
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        self.assertEqual(self.randomdb.count, 25)
+        for n, id in enumerate(ids):
+            self.assertTrue(id >= 1E+6)
+            self.assertEqual(self.randomdb.get(id)['n'], n)
+            
+    def test_insert_many_existant(self):
+        d = self.db.insert({'first': 'Henry'})
+        self.assertRaises(ValueError, self.db.insert_many, [{'first': 'Margaux'}, d])
+        self.assertEqual(self.db.count, 1)
+        self.assertRaises(ValueError, self.db.insert_many, [], batch_size=0)
+        
+    def test_get_many_order(self):
+        ids = self.db.insert_many({'n': n} for n in range(2000))
+        
+        wanted = [ids[1500], -75, ids[3], ids[1500], ids[0]]
+        many = self.db.get_many(wanted, fields=('n',))
+        self.assertEqual(len(many), 5)
+        self.assertEqual(many[0], {'n': 1500})
+        self.assertIsNone(many[1])
+        self.assertEqual(many[2], {'n': 3})
+        self.assertEqual(many[3], {'n': 1500})
+        self.assertEqual(many[4], {'n': 0})
+        
+        many = self.db.get_many(ids)
+        self.assertEqual([x[ID_KEY] for x in many], ids)
+        
+        # Ids SQLite converts match as they do with get
+        wanted = [str(ids[3]), ids[3], str(ids[0]), "none"]
+        many = self.db.get_many(wanted, fields=('n',))
+        self.assertEqual(many, [{'n': 3}, {'n': 3}, {'n': 0}, None])
+        self.assertEqual(self.db.get_many([str(ids[1])])[0], self.db.get(str(ids[1])))
+        
+    def test_find_field_conversion(self):
+        d1 = self.db.insert({'first': 'Erin', 'age': 17, 'tags': [1, 2, None]})
+        d2 = self.db.insert({'first': 'Henry', 'age': '17', 'tags': {'2': True}})
+        d3 = self.db.insert({'first': 'Stephen', 'age': None, 'tags': [[2]]})
+        
+        res = self.db.find_field('age', '17')
+        self.assertEqual(sorted(res), [d1[ID_KEY], d2[ID_KEY]])
+        
+        res = self.db.find_field('age', 17)
+        self.assertEqual(res, [d1[ID_KEY]])
+        
+        res = self.db.find_field('tags', '2')
+        self.assertEqual(sorted(res), [d1[ID_KEY], d2[ID_KEY]])
+        
+        res = self.db.find_field('tags', None)
+        self.assertEqual(res, [d1[ID_KEY]])
+        
+        res = self.db.find_field('age', None)
+        self.assertEqual(res, [d3[ID_KEY]])
+        
+        res = self.db.find_field(ID_KEY, d2[ID_KEY])
+        self.assertEqual(res, [d2[ID_KEY]])
+        
+        res = self.db.find_field('tags', [2])
+        self.assertEqual(res, [d3[ID_KEY]])
+        
+        res = self.db.find_one('age', '17')
+        self.assertIn(res[ID_KEY], (d1[ID_KEY], d2[ID_KEY]))
+        
+        # Without JSON1 the same matches are made in Python
+        self.db._json1 = False
+        res = self.db.find_field('age', '17')
+        self.assertEqual(sorted(res), [d1[ID_KEY], d2[ID_KEY]])
+        res = self.db.find_field('tags', None)
+        self.assertEqual(res, [d1[ID_KEY]])
+        res = self.db.find_field('tags', '2')
+        self.assertEqual(sorted(res), [d1[ID_KEY], d2[ID_KEY]])
+        
+    def test_indexes(self):
+        d1 = self.db.insert({'email': 'henry@example.com', 'tags': ['magic']})
+        d2 = self.db.insert({'email': 'margaux@example.com', 'tags': ['magic', 'fire']})
+        
+        self.assertEqual(self.db.list_indexes(), [])
+        self.db.create_index('email', unique=True)
+        self.db.create_index('tags')
+        self.assertEqual(self.db.list_indexes(), [{'field': 'email', 'unique': True},
+                                                  {'field': 'tags', 'unique': False}])
+        
+        res = self.db.find_one('email', 'margaux@example.com')
+        self.assertEqual(res[ID_KEY], d2[ID_KEY])
+        res = self.db.find_field('tags', 'magic')
+        self.assertEqual(sorted(res), [d1[ID_KEY], d2[ID_KEY]])
+        
+        sql, params = self.db._match_clause('email', 'henry@example.com')
+        plan = " ".join(row[3] for row in self.db.connection.execute("EXPLAIN QUERY PLAN " + sql, params))
+        self.assertIn(self.db._index_name('email'), plan)
+        
+        self.assertRaises(sqlite3.IntegrityError, self.db.insert, {'email': 'henry@example.com'})
+        
+        self.db.drop_index('email')
+        self.assertEqual(self.db.list_indexes(), [{'field': 'tags', 'unique': False}])
+        self.db.insert({'email': 'henry@example.com'})
+        self.assertEqual(len(self.db.find_field('email', 'henry@example.com')), 2)
+        
+        self.assertRaises(ValueError, self.db.create_index, ID_KEY)
+        self.assertRaises(ValueError, self.db.create_index, 'address.city')
+        
+    def test_index_names(self):
+        # These index names were once the same
+        first = Collection("a", connection=self.db.connection)
+        second = Collection("a_idx_b", connection=self.db.connection)
+        first.create_index('b_idx_c')
+        second.create_index('c', unique=True)
+        self.assertEqual(first.list_indexes(), [{'field': 'b_idx_c', 'unique': False}])
+        self.assertEqual(second.list_indexes(), [{'field': 'c', 'unique': True}])
+        second.insert({'c': 1})
+        self.assertRaises(sqlite3.IntegrityError, second.insert, {'c': 1})
+        
+        # Indexes named by earlier versions are still recognized
+        self.db.insert({'email': 'henry@example.com'})
+        self.db.connection.execute("CREATE UNIQUE INDEX testcases_idx_email ON testcases(json_extract(_data, '$.\"email\"'))")
+        self.db._indexes = None
+        self.assertEqual(self.db.list_indexes(), [{'field': 'email', 'unique': True}])
+        self.db.create_index('email')
+        self.assertEqual(len(self.db.list_indexes()), 1)
+        self.db.drop_index('email')
+        self.assertEqual(self.db.list_indexes(), [])
+        
+        # An index on a dotted key cannot serve a filter on a nested path
+        self.db.insert({'a': {'b': 1}, 'a.b': 2})
+        self.db.connection.execute("CREATE INDEX \"testcases_idx_a.b\" ON testcases(json_extract(_data, '$.\"a.b\"'))")
+        self.db._indexes = None
+        self.assertEqual(self.db._compile_filter({'a.b': 1})[0], compile_filter({'a.b': 1}, self.db._table)[0])
+        self.assertEqual(len(self.db.find({'a.b': 1})), 1)
+        
+    def test_iter_all(self):
+        self.db.insert_many({'n': n} for n in range(10))
+        
+        it = self.db.iter_all(batch_size=3)
+        self.assertNotIsInstance(it, list)
+        self.assertEqual([x['n'] for x in it], list(range(10)))
+        
+        res = list(self.db.iter_all(fields=('n',), skip=2, limit=3))
+        self.assertEqual(res, [{'n': 2}, {'n': 3}, {'n': 4}])
+        
+        res = list(self.db.iter_all(skip=8))
+        self.assertEqual([x['n'] for x in res], [8, 9])
+        
+        res = list(self.db.iter_all(limit=0))
+        self.assertEqual(res, [])
+        
+    def test_transaction(self):
+        with self.db.transaction():
+            d1 = self.db.insert({'first': 'Henry'})
+            d1['last'] = 'McCallum'
+            self.db.update(d1)
+            self.assertTrue(self.db.connection.in_transaction)
+        self.assertFalse(self.db.connection.in_transaction)
+        self.assertEqual(self.db.get(d1[ID_KEY])['last'], 'McCallum')
+        
+        try:
+            with self.db.transaction():
+                self.db.insert({'first': 'Margaux'})
+                self.db.remove(d1)
+                raise KeyError()
+        except KeyError:
+            pass
+        self.assertEqual(self.db.count, 1)
+        self.assertIsNotNone(self.db.get(d1[ID_KEY]))
+        
+    def test_transaction_nested(self):
+        others = Collection("others", connection=self.db.connection)
+        with sostore.transaction(self.db.connection):
+            self.db.insert({'first': 'Henry'})
+            try:
+                with others.transaction():
+                    others.insert({'first': 'Margaux'})
+                    self.db.insert({'first': 'Stephen'})
+                    raise KeyError()
+            except KeyError:
+                pass
+            others.insert_many([{'first': 'Erin'}])
+        
+        self.assertEqual([x['first'] for x in self.db.all()], ['Henry'])
+        self.assertEqual([x['first'] for x in others.all()], ['Erin'])
+        
+    def test_insert_randomize_collision(self):
+        d = self.randomdb.insert({'first': 'Henry'})
+        
+        drawn = [d[ID_KEY], d[ID_KEY], 5000000]
+        original = sostore.collection.random.randint
+        sostore.collection.random.randint = lambda a, b: drawn.pop(0)
+        try:
+            d2 = self.randomdb.insert({'first': 'Margaux'})
+            self.assertEqual(d2[ID_KEY], 5000000)
+            
+            drawn.extend([d[ID_KEY], 6000000, 6000000, 7000000])
+            ids = self.randomdb.insert_many([{'first': 'Erin'}, {'first': 'Stephen'}])
+            self.assertEqual(sorted(ids), [6000000, 7000000])
+            
+            sostore.collection.random.randint = lambda a, b: d[ID_KEY]
+            self.assertRaises(sostore.RandomIdException, self.randomdb.insert, {'first': 'Phillip'})
+        finally:
+            sostore.collection.random.randint = original
+            
+        self.assertEqual(self.randomdb.get(d[ID_KEY])['first'], 'Henry')
+        self.assertEqual(self.randomdb.count, 4)
+        
+    def test_sample(self):
+        self.assertEqual(self.db.sample(3), [])
+        ids = self.db.insert_many({'n': n} for n in range(20))
+        
+        res = self.db.sample(5, fields=('n',))
+        self.assertEqual(len(res), 5)
+        self.assertEqual(len(set(x['n'] for x in res)), 5)
+        self.assertNotIn(ID_KEY, res[0])
+        
+        self.assertEqual(sorted(x['n'] for x in self.db.sample(50)), list(range(20)))
+        
+        res = self.db.sample(3, filter=lambda d: d['n'] % 2 == 0)
+        self.assertEqual(len(res), 3)
+        self.assertTrue(all(x['n'] % 2 == 0 for x in res))
+        self.assertEqual(len(self.db.sample(30, filter=lambda d: d['n'] < 4)), 4)
+        
+        counts = dict((n, 0) for n in range(20))
+        for i in range(400):
+            for x in self.db.sample(2):
+                counts[x['n']] += 1
+        self.assertTrue(min(counts.values()) > 10)
+        
+    def test_sample_sparse(self):
+        ids = self.randomdb.insert_many({'n': n} for n in range(30))
+        res = self.randomdb.sample(10)
+        self.assertEqual(len(set(x[ID_KEY] for x in res)), 10)
+        self.assertEqual(len(self.randomdb.sample(3)), 3)
+        self.assertEqual(sorted(x['n'] for x in self.randomdb.sample(40, fields=('n',))), list(range(30)))
+        res = self.randomdb.sample(4, filter=lambda d: d['n'] % 3 == 0)
+        self.assertEqual(len(res), 4)
+        self.assertTrue(all(x['n'] % 3 == 0 for x in res))
+        # Sampling never creates the sample index itself
+        self.assertFalse(self.randomdb._has_positions())
+        
+        counts = dict((n, 0) for n in range(30))
+        for i in range(600):
+            for x in self.randomdb.sample(2):
+                counts[x['n']] += 1
+        self.assertTrue(min(counts.values()) > 10)
+        
+        self.randomdb.create_sample_index()
+        self.assertTrue(self.randomdb._has_positions())
+        res = self.randomdb.sample(10)
+        self.assertEqual(len(set(x[ID_KEY] for x in res)), 10)
+        
+        # Positions stay contiguous as dictionaries come and go
+        for id in ids[::2]:
+            self.randomdb.remove(id)
+        self.randomdb.remove(ids[-1])
+        self.randomdb.insert({'n': 30})
+        positions = [row[0] for row in self.randomdb.connection.execute("SELECT pos FROM sostore_positions_testcases ORDER BY pos")]
+        self.assertEqual(positions, list(range(1, 16)))
+        
+        res = self.randomdb.sample(20)
+        self.assertEqual(sorted(x['n'] for x in res), list(range(1, 29, 2)) + [30])
+        
+        self.randomdb.drop_sample_index()
+        self.assertFalse(self.randomdb._has_positions())
+        self.randomdb.insert({'n': 31})
+        self.assertEqual(len(self.randomdb.sample(20)), 16)
+        
+        # Sequential collections with many gaps sample by position as well
+        ids = self.db.insert_many({'n': n} for n in range(100))
+        for id in ids[:-1]:
+            if id % 25 != 0:
+                self.db.remove(id)
+        self.assertEqual(len(self.db.sample(3)), 3)
+        self.assertEqual(len(self.db.random_entries(10)), 4)
+        self.assertFalse(self.db._has_positions())
+        
+    def test_sample_readonly(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "sample.db")
+        try:
+            db = Collection("testcases", db=filename, randomized=True)
+            db.insert_many({'n': n} for n in range(10))
+            db.done()
+            
+            db = Collection("testcases", db=filename, randomized=True, profile="readonly")
+            self.assertIsNotNone(db.random_entry())
+            self.assertEqual(len(db.random_entries(20)), 10)
+            self.assertFalse(db._has_positions())
+            db.done()
+        finally:
+            shutil.rmtree(directory)
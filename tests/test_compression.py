@@ -0,0 +1,82 @@
+import unittest
+from sostore import Collection, ID_KEY
+from sostore.compression import ZlibCompressor, available_compressors
+
+def large_document(n):
+    return {'description': 'a long and repetitive description ' * 20, 'n': n}
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases", compression='zlib')
+        
+    def tearDown(self):
+        self.db.done()
+        
+    def stored_types(self):
+        return [row[0] for row in self.db.connection.execute("SELECT typeof(_data) FROM testcases ORDER BY _id")]
+        
+    def test_threshold(self):
+        small = self.db.insert({'first': 'Henry'})
+        large = self.db.insert(large_document(1))
+        self.assertEqual(self.stored_types(), ['text', 'blob'])
+        
+        self.assertEqual(self.db.get(small[ID_KEY])['first'], 'Henry')
+        self.assertEqual(self.db.get(large[ID_KEY]), large)
+        self.assertEqual(len(self.db.all()), 2)
+        
+        large['n'] = 2
+        self.db.update(large)
+        self.assertEqual(self.db.get(large[ID_KEY])['n'], 2)
+        self.assertEqual(self.db.find_field('n', 2), [large[ID_KEY]])
+        self.assertEqual(self.db.random_entries(2)[0]['_id'] in (small[ID_KEY], large[ID_KEY]), True)
+        
+        self.assertRaises(ValueError, self.db.create_index, 'n')
+        
+    def test_recompress(self):
+        plain = Collection("testcases", connection=self.db.connection)
+        ids = plain.insert_many(large_document(n) for n in range(5))
+        self.assertEqual(self.stored_types(), ['text'] * 5)
+        
+        # Compression is recorded, so the plain Collection now searches in Python
+        self.assertEqual(len(plain.find_field('n', 3)), 1)
+        
+        self.assertEqual(self.db.recompress(batch_size=2), 5)
+        self.assertEqual(self.stored_types(), ['blob'] * 5)
+        self.assertEqual(self.db.recompress(), 0)
+        self.assertEqual([d['n'] for d in plain.get_many(ids)], list(range(5)))
+        
+        # Decompress everything again
+        self.assertEqual(plain.recompress(), 5)
+        self.assertEqual(self.stored_types(), ['text'] * 5)
+        plain.create_index('n')
+        self.assertEqual(plain.find_field('n', 3), [ids[3]])
+        
+        self.assertRaises(ValueError, plain.recompress, train_dictionary=True)
+        
+    def test_compressor_instance(self):
+        db = Collection("testcases", compression=ZlibCompressor(level=9), compression_threshold=0)
+        d = db.insert({'first': 'Henry'})
+        self.assertEqual(db.get(d[ID_KEY])['first'], 'Henry')
+        db.done()
+        
+    def test_indexed(self):
+        plain = Collection("indexed", connection=self.db.connection)
+        plain.create_index('n')
+        self.assertRaises(ValueError, Collection, "indexed", connection=self.db.connection, compression='zlib')
+        
+    @unittest.skipUnless('lzma' in available_compressors(), "lzma is not available")
+    def test_lzma(self):
+        db = Collection("testcases", connection=self.db.connection, compression='lzma')
+        d = db.insert(large_document(1))
+        self.assertEqual(self.db.get(d[ID_KEY]), d)
+        
+    @unittest.skipUnless('zstd' in available_compressors(), "zstandard is not installed")
+    def test_zstd_dictionary(self):
+        db = Collection("testcases", connection=self.db.connection, compression='zstd', compression_threshold=0)
+        ids = db.insert_many({'kind': 'customer', 'region': 'north', 'n': n} for n in range(500))
+        self.assertEqual(db.recompress(train_dictionary=True, dictionary_size=1024), 500)
+        
+        reopened = Collection("testcases", connection=self.db.connection, compression='zstd')
+        self.assertEqual(reopened.get(ids[10])['n'], 10)
+        d = reopened.insert({'kind': 'customer', 'region': 'south', 'n': 500})
+        self.assertEqual(self.db.get(d[ID_KEY])['region'], 'south')
@@ -0,0 +1,143 @@
+import unittest
+import os
+import shutil
+import tempfile
+from sostore import Collection, Database, ConnectionException, CodecException, ID_KEY
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "database.db")
+        self.db = Database(self.filename)
+
+    def tearDown(self):
+        self.db.done()
+        shutil.rmtree(self.directory)
+
+    def test_lazy(self):
+        people = self.db.collection("people")
+        self.assertEqual(people.count, 0)
+        self.assertEqual(people.all(), [])
+        self.assertEqual(people.find({'first': 'Henry'}), [])
+        self.assertEqual(people.count_documents(), 0)
+        self.assertIsNone(people.get(1))
+        self.assertEqual(people.random_entries(2), [])
+        self.assertNotIn("people", self.db)
+        self.assertEqual(self.db.collections(), [])
+
+        people.insert({'first': 'Henry'})
+        self.assertIn("people", self.db)
+        self.assertEqual(self.db.collections(), ["people"])
+        self.assertEqual(self.db["people"].get(1)['first'], 'Henry')
+
+    def test_missing(self):
+        statements = []
+        self.db.connection.set_trace_callback(statements.append)
+        # A missing table is looked up once on opening, not by every read
+        people = self.db["people"]
+        self.assertEqual(len([sql for sql in statements if "sqlite_master" in sql]), 1)
+        del statements[:]
+        self.assertEqual(people.count, 0)
+        self.assertIsNone(people.get(1))
+        self.assertEqual(people.get_many([1, 2]), [None, None])
+        self.assertNotIn("people", self.db)
+        self.assertEqual([sql for sql in statements if "sqlite_master" in sql], [])
+        self.db.connection.set_trace_callback(None)
+
+        # Tables created within a transaction are known once it commits
+        with self.db.transaction():
+            people.insert({'first': 'Henry'})
+            people.create_change_log()
+        self.assertIn("people", self.db)
+        people.insert({'first': 'Erin'})
+        self.assertEqual(people.get(2)['first'], 'Erin')
+        self.assertEqual(people.last_change(), 1)
+
+    def test_other_connection(self):
+        self.assertNotIn("people", self.db)
+        other = Database(self.filename)
+        other["people"].insert({'first': 'Henry'})
+        other.done()
+
+        # A new Collection looks the table up again, and agrees with collections()
+        self.assertEqual(self.db["people"].count, 1)
+        self.assertIn("people", self.db)
+        self.assertEqual(self.db.collections(), ["people"])
+
+        other = Database(self.filename)
+        other.collection("places", codec="pickle").insert({'name': 'Ohio'})
+        other.done()
+        self.assertEqual(self.db.collections(), ["people", "places"])
+        self.assertEqual(self.db["places"].get(1)['name'], 'Ohio')
+        self.assertRaises(CodecException, self.db.collection, "places", codec="json")
+
+    def test_codec_mismatch(self):
+        pickled = self.db.collection("people", codec="pickle")
+        plain = self.db.collection("people")
+        pickled.insert({'first': 'Henry'})
+        self.assertRaises(CodecException, plain.insert, {'first': 'Erin'})
+        self.assertEqual(pickled.all(), [{ID_KEY: 1, 'first': 'Henry'}])
+
+        # A Collection opened before another connection creates the table
+        places = self.db["places"]
+        other = Database(self.filename)
+        other.collection("places", codec="pickle").insert({'name': 'Ohio'})
+        other.done()
+        self.assertRaises(CodecException, places.insert, {'name': 'Utah'})
+        self.db.done()
+        self.db = Database(self.filename)
+        self.assertEqual(self.db["places"].codec.name, "pickle")
+        self.assertEqual(Collection("places", db=self.filename).all(), [{ID_KEY: 1, 'name': 'Ohio'}])
+
+    def test_names(self):
+        name = 'we"ird name; drop'
+        weird = self.db[name]
+        weird.insert({'first': 'Henry'})
+        weird.create_index('first')
+        self.assertEqual(weird.find({'first': 'Henry'})[0][ID_KEY], 1)
+        self.assertEqual(self.db.collections(), [name])
+
+        braced = self.db["{0} {}"]
+        braced.insert_many([{'first': 'Henry'}, {'first': 'Erin'}])
+        self.assertEqual([d['first'] for d in braced.get_many([2, 1])], ['Erin', 'Henry'])
+        self.assertEqual(braced.count_documents({'first': 'Erin'}), 1)
+        self.assertEqual(braced.update_many({'first': 'Erin'}, {'$set': {'last': 'Smith'}}), 1)
+        self.assertEqual(braced.remove_many([1]), 1)
+        self.assertEqual(braced.find({}), [{ID_KEY: 2, 'first': 'Erin', 'last': 'Smith'}])
+
+        for invalid in ("", "sqlite_master", "SOSTORE_metadata", "nul\0name", 3):
+            self.assertRaises(ValueError, self.db.collection, invalid)
+
+    def test_rollback(self):
+        people = self.db["people"]
+        try:
+            with self.db.transaction():
+                people.insert({'first': 'Henry'})
+                self.assertIn("people", self.db)
+                raise KeyError('rolled back')
+        except KeyError:
+            pass
+        self.assertNotIn("people", self.db)
+        self.assertEqual(people.count, 0)
+        people.insert({'first': 'Erin'})
+        self.assertEqual(people.get(1)['first'], 'Erin')
+
+    def test_shared(self):
+        people = self.db["people"]
+        places = self.db.collection("places", codec="pickle")
+        with self.db.transaction():
+            people.insert({'first': 'Henry'})
+            places.insert({'name': 'Ohio'})
+        self.assertIs(people.connection, places.connection)
+        self.assertEqual(self.db.collections(), ["people", "places"])
+        people.done()
+        self.assertRaises(ConnectionException, people.get, 1)
+        self.assertEqual(places.get(1)['name'], 'Ohio')
+
+        # Settings recorded through the Database are read on reopening
+        self.db.done()
+        self.db = Database(self.filename)
+        self.assertEqual(self.db["places"].codec.name, "pickle")
+        self.assertEqual(Collection("places", db=self.filename).get(1)['name'], 'Ohio')
+        self.db.done()
+        self.assertRaises(ConnectionException, places.get, 1)
@@ -0,0 +1,70 @@
+import unittest
+from sostore import Collection
+from sostore.instrument import normalize_statement
+
+class InstrumentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases", instrumented=True)
+        self.db.insert_many({'n': n, 'name': 'person{0}'.format(n), 'tags': [n % 3]} for n in range(100))
+        self.db.reset_instrumentation()
+
+    def tearDown(self):
+        self.db.done()
+
+    def test_timings(self):
+        self.assertEqual(self.db.get(1)['n'], 0)
+        self.assertEqual(len(self.db.all()), 100)
+        self.assertEqual(self.db.find_field('tags', 1, lambda value, stored: value == stored), [2 + 3 * n for n in range(33)])
+        entries = self.db.iter_find({'n': {'$lt': 10}})
+        self.assertEqual(len(list(entries)), 10)
+
+        report = self.db.instrumentation()
+        self.assertEqual(sorted(report), ['all', 'find_field', 'get', 'iter_find'])
+        self.assertEqual((report['get']['calls'], report['get']['scanned'], report['get']['returned']), (1, 1, 1))
+        # all reads through iter_all, which is counted as part of all
+        self.assertEqual((report['all']['scanned'], report['all']['returned']), (100, 100))
+        self.assertEqual((report['find_field']['scanned'], report['find_field']['returned']), (100, 33))
+        self.assertGreater(report['find_field']['filter'], 0.0)
+        self.assertEqual((report['iter_find']['calls'], report['iter_find']['returned']), (1, 10))
+        for stats in report.values():
+            self.assertAlmostEqual(stats['total'], stats['sql'] + stats['decode'] + stats['filter'])
+            self.assertEqual(sum(count for bound, count in stats['histogram']), stats['calls'])
+            self.assertGreater(stats['statements'], 0)
+
+        self.db.reset_instrumentation()
+        self.assertEqual(self.db.instrumentation(), {})
+        self.assertIsNone(Collection("plain", connection=self.db.connection).instrumentation())
+
+    def test_trace(self):
+        traced = []
+        self.db.set_trace(lambda method, seconds, statements: traced.append((method, statements)))
+        self.db.get(5)
+        self.db.update_fields(5, {'$set': {'n': -1}})
+        self.assertEqual([method for method, statements in traced], ['get', 'update_fields'])
+        self.assertIn('5', traced[0][1][0])
+
+        self.db.set_trace(lambda *args: traced.append(args), slow=60.0)
+        self.db.get(5)
+        self.assertEqual(len(traced), 2)
+
+    def test_stats(self):
+        stats = self.db.stats()
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['data_bytes'], sum(len(row[0]) for row in self.db.connection.execute("SELECT _data FROM testcases")))
+        self.assertAlmostEqual(stats['average_bytes'], stats['data_bytes'] / 100.0)
+        self.assertGreater(stats['database_pages'], 0)
+        self.assertEqual(stats['indexes'], [])
+
+        self.db.create_index('n')
+        self.db.find({'n': {'$gt': 90}})
+        self.db.find({'n': {'$gt': 95}})
+        self.db.find({'name': 'person1'})
+        index = self.db.stats()['indexes'][0]
+        self.assertEqual((index['field'], index['unique'], index['uses']), ('n', False, 2))
+
+        self.assertIsNone(Collection("testcases", connection=self.db.connection).stats()['indexes'][0]['uses'])
+
+    def test_normalize(self):
+        self.assertEqual(normalize_statement("SELECT _id FROM t WHERE json_extract(_data, '$.a1') > 12.5 LIMIT 3"),
+                         ("SELECT _id FROM t WHERE json_extract(_data, '$.a1') > ? LIMIT ?", 2))
+        self.assertIsNone(normalize_statement("INSERT INTO t(_data) VALUES('{\"json_\": 1}')"))
@@ -0,0 +1,75 @@
+import unittest
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sostore import Collection, ConnectionPool, ConnectionException, ID_KEY
+
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases", threaded=True, cache_size=100)
+        
+    def tearDown(self):
+        self.db.done()
+        
+    def work(self, n):
+        d = self.db.insert({'n': n, 'thread': threading.current_thread().name})
+        d['checked'] = True
+        self.db.update(d)
+        return self.db.get(d[ID_KEY])
+        
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(self.work, range(200)))
+            opened = len(self.db._pool)
+            
+        self.assertEqual(self.db.count, 200)
+        self.assertEqual(sorted(d['n'] for d in results), list(range(200)))
+        self.assertTrue(all(d['checked'] for d in results))
+        self.assertTrue(opened > 1)
+        
+    def test_thread_exit(self):
+        pool = self.db._pool
+        for n in range(50):
+            thread = threading.Thread(target=self.work, args=(n,))
+            thread.start()
+            thread.join()
+            
+        self.assertEqual(self.db.count, 50)
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(self.db.get(50)['n'], 49)
+        
+    def test_done(self):
+        pool = self.db._pool
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(self.work, range(10)))
+        self.db.done()
+        self.assertTrue(pool.closed)
+        self.assertEqual(len(pool), 0)
+        self.assertRaises(ConnectionException, self.db.get, 1)
+        
+    def test_file(self):
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "pool.db")
+        try:
+            pool = ConnectionPool(filename)
+            db = Collection("testcases", pool=pool, randomized=True)
+            others = Collection("others", pool=pool)
+            
+            def work(n):
+                with db.transaction(immediate=True):
+                    d = db.insert({'n': n})
+                    others.insert({'id': d[ID_KEY]})
+                
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(work, range(50)))
+                
+            self.assertEqual(db.count, 50)
+            self.assertEqual(others.count, 50)
+            mode = pool.connection().execute("PRAGMA journal_mode").fetchone()[0]
+            self.assertEqual(mode, 'wal')
+            db.done()
+        finally:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
@@ -0,0 +1,154 @@
+import unittest
+from sostore import Collection, ID_KEY, ASCENDING, DESCENDING
+from sostore.query import matches, compile_filter
+
+PEOPLE = [{'first': 'Henry', 'age': 34, 'siblings': ['Erin', 'Stephen'], 'address': {'city': 'Akron'}},
+          {'first': 'Erin', 'age': 31, 'siblings': ['Henry', 'Stephen']},
+          {'first': 'Stephen', 'age': 28.5, 'siblings': [], 'address': {'city': 'Kent'}},
+          {'first': 'Margaux', 'age': '30', 'pets': None, 'address': {'city': 'Akron', 'zip': 44301}},
+          {'first': 'Jeffrey', 'age': True, 'siblings': ['Erin', 'Henry'], 'scores': [3, 8, 12]}]
+
+FILTERS = [{},
+           {'first': 'Henry'},
+           {'age': 34},
+           {'age': {'$gt': 30}},
+           {'age': {'$gte': 28.5, '$lt': 34}},
+           {'age': {'$lte': '30'}},
+           {'age': True},
+           {'age': {'$ne': 34}},
+           {'siblings': 'Erin'},
+           {'siblings': {'$in': ['Stephen', 'Margaux']}},
+           {'siblings': {'$nin': ['Henry']}},
+           {'scores': {'$gt': 10}},
+           {'address.city': 'Akron'},
+           {'address.zip': {'$exists': True}},
+           {'address': {'$exists': False}},
+           {'pets': None},
+           {'pets': {'$ne': None}},
+           {'$or': [{'first': 'Erin'}, {'address.city': 'Kent'}]},
+           {'$and': [{'age': {'$gt': 25}}, {'first': {'$ne': 'Erin'}}]},
+           {'first': {'$regex': '^[eh]', '$options': 'i'}},
+           {'siblings': {'$size': 2}, 'age': {'$lt': 33}},
+           {'siblings': {'$all': ['Erin', 'Henry']}},
+           {'age': {'$not': {'$gt': 30}}},
+           {'$nor': [{'first': 'Henry'}, {'age': 31}]},
+           {'address': {'city': 'Kent'}},
+           {'_id': {'$gt': 2}},
+           {'_id': {'$in': [1, 3, 'x']}},
+           {'pets': {'$gte': None}},
+           {'pets': {'$gt': None}},
+           {'address': {'$gt': {'city': 'B'}}},
+           {'siblings': {'$gte': ['Erin', 'Stephen']}},
+           {'scores': {'$gt': [[1]]}},
+           {'_id': {'$lt': None}}]
+
+class QueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases")
+        self.db.insert_many(dict(person) for person in PEOPLE)
+
+    def tearDown(self):
+        self.db.done()
+
+    def expected(self, filter):
+        return [d[ID_KEY] for d in self.db.all() if matches(d, filter)]
+
+    def test_find(self):
+        for filter in FILTERS:
+            self.assertEqual([d[ID_KEY] for d in self.db.find(filter)], self.expected(filter), filter)
+
+        self.db.create_index('first')
+        self.db.create_index('siblings')
+        for filter in FILTERS:
+            self.assertEqual([d[ID_KEY] for d in self.db.find(filter)], self.expected(filter), filter)
+
+        self.assertRaises(ValueError, self.db.find, {'age': {'$near': 3}})
+
+    def test_unordered_operands(self):
+        self.assertEqual([d['first'] for d in self.db.find({'pets': {'$gte': None}})], ['Margaux'])
+        self.assertEqual(self.db.find({'pets': {'$gt': None}}), [])
+        self.assertEqual([d['first'] for d in self.db.find({'address': {'$gt': {'city': 'B'}}})], ['Stephen'])
+        self.assertEqual([d['first'] for d in self.db.find({'siblings': {'$gt': ['Erin', 'Stephen']}})], ['Erin'])
+        self.assertEqual([d['first'] for d in self.db.find({'scores': {'$lt': [[1]]}})], ['Jeffrey'])
+        self.assertTrue(matches({'a': [[1], [2]]}, {'a': {'$gt': [1]}}))
+        self.assertFalse(matches({'a': {'y': 1}}, {'a': {'$gt': {'y': 1}}}))
+
+    def test_compile(self):
+        where, params, remaining = compile_filter({'age': {'$gt': 30}, '_id': 2}, "testcases")
+        self.assertIsNone(remaining)
+        self.assertEqual(params, [30, 30, 2])
+
+        where, params, remaining = compile_filter({'age': {'$gt': 30, '$size': 2}}, "testcases")
+        self.assertEqual(remaining, {'$and': [{'age': {'$size': 2}}]})
+
+        where, params, remaining = compile_filter({'age': {'$gt': 30}, '_id': 2}, "testcases", json_supported=False)
+        self.assertEqual(params, [2])
+        self.assertEqual(remaining, {'$and': [{'age': {'$gt': 30}}]})
+
+    def test_fallback(self):
+        other = Collection("pickled", connection=self.db.connection, codec='pickle')
+        other.insert_many(dict(person) for person in PEOPLE)
+        for filter in FILTERS:
+            self.assertEqual([d[ID_KEY] for d in other.find(filter)], self.expected(filter), filter)
+        self.assertEqual([d['first'] for d in other.find(sort=[('age', DESCENDING)], skip=1, limit=2)],
+                         [d['first'] for d in self.db.find(sort=[('age', DESCENDING)], skip=1, limit=2)])
+
+    def test_sort(self):
+        res = self.db.find({'age': {'$exists': True}}, sort=[('age', ASCENDING)])
+        self.assertEqual([d['first'] for d in res], ['Jeffrey', 'Stephen', 'Erin', 'Henry', 'Margaux'])
+
+        res = self.db.find(sort=[('address.city', -1), ('first', 1)])
+        self.assertEqual([d['first'] for d in res], ['Stephen', 'Henry', 'Margaux', 'Erin', 'Jeffrey'])
+
+        res = self.db.find(sort=[(ID_KEY, DESCENDING)], skip=1, limit=2)
+        self.assertEqual([d[ID_KEY] for d in res], [4, 3])
+
+        res = self.db.find({'siblings': {'$size': 2}}, sort='first', skip=1, limit=1)
+        self.assertEqual([d['first'] for d in res], ['Henry'])
+
+        self.assertRaises(ValueError, self.db.find, sort=[('first', 'up')])
+
+    def test_projection(self):
+        res = self.db.find({'first': 'Henry'}, projection=['first'])
+        self.assertEqual(res, [{'first': 'Henry'}])
+
+        res = self.db.find({'first': 'Henry'}, projection={'first': 1})
+        self.assertEqual(res, [{'first': 'Henry', ID_KEY: 1}])
+
+        res = self.db.find({'first': 'Erin'}, projection={'siblings': 0, ID_KEY: 0})
+        self.assertEqual(res, [{'first': 'Erin', 'age': 31}])
+
+    def test_sorted_listing(self):
+        self.assertEqual([d['first'] for d in self.db.all(fields=('first',), sort=[('first', DESCENDING)])],
+                         ['Stephen', 'Margaux', 'Jeffrey', 'Henry', 'Erin'])
+        res = self.db.iter_all(sort=[('address.city', ASCENDING)], skip=3, limit=1)
+        self.assertEqual([d['first'] for d in res], ['Margaux'])
+
+    def test_pages(self):
+        self.db.insert_many({'first': 'Henry', 'n': n % 7} for n in range(50))
+        for db in (self.db, Collection("pickled", connection=self.db.connection, codec='pickle')):
+            if db is not self.db:
+                db.insert_many(dict((key, value) for key, value in d.items() if key != ID_KEY) for d in self.db.all())
+            for filter, sort in (({}, None),
+                                 ({'first': 'Henry'}, [('n', DESCENDING)]),
+                                 ({'first': {'$ne': 'Erin'}}, [('age', DESCENDING)]),
+                                 ({}, [('age', ASCENDING)]),
+                                 ({'siblings': {'$size': 2}}, [('first', ASCENDING), ('age', DESCENDING)]),
+                                 ({'n': {'$ne': 3}}, [('n', ASCENDING), (ID_KEY, DESCENDING)]),
+                                 ({}, [(ID_KEY, DESCENDING)]),
+                                 ({'n': {'$gt': 2}}, [(ID_KEY, DESCENDING), ('n', ASCENDING)])):
+                if db is not self.db and sort is not None and sort[0][0] != ID_KEY:
+                    self.assertRaises(ValueError, db.find_page, filter, sort=sort)
+                    continue
+                expected = [d[ID_KEY] for d in db.find(filter, sort=sort)]
+                seen = []
+                page, token = db.find_page(filter, sort=sort, limit=6)
+                seen.extend(d[ID_KEY] for d in page)
+                while token is not None:
+                    page, token = db.find_page(filter, sort=sort, limit=6, after=token)
+                    seen.extend(d[ID_KEY] for d in page)
+                self.assertEqual(seen, expected, (filter, sort))
+
+        page, token = self.db.find_page(sort=[('n', ASCENDING)], limit=2)
+        self.assertRaises(ValueError, self.db.find_page, sort=[('n', DESCENDING)], after=token)
+        self.assertRaises(ValueError, self.db.find_page, after='not a token')
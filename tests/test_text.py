@@ -0,0 +1,69 @@
+import unittest
+import sqlite3
+from sostore import Collection, Database, ID_KEY
+
+class TextSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases")
+        self.db.insert_many([{'title': 'Quick fox', 'notes': 'The quick brown fox jumps'},
+                             {'title': 'Lazy dog', 'notes': 'A lazy dog, not at all quick'},
+                             {'title': 'Bears', 'notes': ['brown', 'black']}])
+        self.db.create_text_index(['title', 'notes'])
+        
+    def tearDown(self):
+        self.db.done()
+        
+    def ids(self, query, **kwargs):
+        return [d[ID_KEY] for d in self.db.text_search(query, **kwargs)]
+        
+    def test_search(self):
+        self.assertEqual(self.ids('quick'), [1, 2])
+        self.assertEqual(self.ids('quick', fields='title'), [1])
+        self.assertEqual(self.ids('quick', limit=1), [1])
+        self.assertEqual(sorted(self.ids('brown')), [1, 3])
+        self.assertEqual(self.ids('"brown fox"'), [1])
+        self.assertEqual(self.ids('bla*'), [3])
+        self.assertEqual(self.db.text_search('lazy', projection=['title']), [{'title': 'Lazy dog'}])
+        self.assertEqual(self.db.text_index(), ['title', 'notes'])
+        
+    def test_writes(self):
+        self.db.update_fields(1, {'$set': {'title': 'Slow turtle', 'notes': 'plodding'}})
+        self.assertEqual(self.ids('quick'), [2])
+        self.assertEqual(self.ids('turtle'), [1])
+        self.db.remove(2)
+        self.assertEqual(self.ids('lazy'), [])
+        self.db.update_many({}, {'$set': {'title': 'renamed'}})
+        self.assertEqual(self.ids('renamed'), [1, 3])
+        self.db.upsert({ID_KEY: 3, 'title': 'Panda'})
+        self.assertEqual(self.ids('panda'), [3])
+        self.assertEqual(self.ids('black'), [])
+        d = self.db.insert({'notes': 'quick'})
+        self.assertEqual(self.ids('quick'), [d[ID_KEY]])
+        
+    def test_replace(self):
+        self.db.create_text_index('title')
+        self.assertEqual(self.ids('fox'), [1])
+        self.assertEqual(self.ids('jumps'), [])
+        self.db.drop_text_index()
+        self.assertIsNone(self.db.text_index())
+        self.assertRaises(ValueError, self.db.text_search, 'fox')
+        self.db.insert({'title': 'fox'})
+        
+    def test_invalid(self):
+        self.assertRaises(ValueError, self.db.text_search, 'fox', fields='body')
+        self.assertRaises(sqlite3.OperationalError, self.db.text_search, 'fox AND')
+        self.assertRaises(ValueError, self.db.create_text_index, ['rank'])
+        self.assertRaises(ValueError, self.db.create_text_index, [ID_KEY])
+        self.assertRaises(ValueError, self.db.create_text_index, [])
+        self.assertRaises(ValueError, Collection, "testcases", connection=self.db.connection, compression="zlib")
+        
+        pickled = Collection("pickled", connection=self.db.connection, codec="pickle")
+        self.assertRaises(ValueError, pickled.create_text_index, 'title')
+        
+    def test_database(self):
+        db = Database()
+        db["notes"].create_text_index('title')
+        db["notes"].insert({'title': 'Quick fox'})
+        self.assertEqual(db.collections(), ["notes"])
+        self.assertEqual(len(db["notes"].text_search('fox')), 1)
+        db.done()
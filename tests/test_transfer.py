@@ -0,0 +1,80 @@
+import unittest
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+from sostore import Collection, Database, ID_KEY
+
+class TransferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = Collection("testcases")
+        self.db.insert_many({'n': n, 'text': 'line\nbreak "{0}"'.format(n)} for n in range(25))
+        self.db.insert({})
+        self.db.remove(3)
+        
+    def tearDown(self):
+        self.db.done()
+        shutil.rmtree(self.directory)
+        
+    def test_roundtrip(self):
+        filename = os.path.join(self.directory, "export.jsonl")
+        counts = []
+        self.assertEqual(self.db.export_jsonl(filename, batch_size=10, progress=counts.append), 25)
+        self.assertEqual(counts, [10, 20, 25])
+        with open(filename) as f:
+            self.assertEqual(len(f.readlines()), 25)
+        
+        copy = Collection("copy", connection=self.db.connection)
+        counts = []
+        self.assertEqual(copy.import_jsonl(filename, batch_size=10, preserve_ids=True, progress=counts.append), 25)
+        self.assertEqual(counts, [10, 20, 25])
+        self.assertEqual(copy.all(), self.db.all())
+        self.assertIsNone(copy.get(3))
+        self.assertEqual(copy.insert({'n': 'next'})[ID_KEY], 27)
+        
+        renumbered = Collection("renumbered", connection=self.db.connection)
+        renumbered.import_jsonl(filename)
+        self.assertEqual([d[ID_KEY] for d in renumbered.all()], list(range(1, 26)))
+        self.assertEqual(renumbered.get(3)['n'], 3)
+        
+    def test_codecs(self):
+        f = io.StringIO()
+        pickled = Collection("pickled", connection=self.db.connection, codec="pickle", compression="zlib", compression_threshold=0)
+        pickled.insert({'n': 1, 'nested': {'list': [1, 2]}})
+        pickled.export_jsonl(f)
+        self.assertEqual(f.getvalue(), '{"_id": 1, "n": 1, "nested": {"list": [1, 2]}}\n')
+        
+        f = io.StringIO('{"_id": 7, "n": 7}\n\n{"n": 8}\n')
+        self.assertEqual(pickled.import_jsonl(f, preserve_ids=True), 2)
+        self.assertEqual(pickled.get(7)['n'], 7)
+        self.assertEqual(pickled.get(8)['n'], 8)
+        
+    def test_invalid(self):
+        f = io.StringIO()
+        self.db.export_jsonl(f)
+        f.seek(0)
+        self.assertRaises(sqlite3.IntegrityError, self.db.import_jsonl, f, preserve_ids=True)
+        self.assertEqual(self.db.count, 25)
+        self.assertRaises(ValueError, self.db.import_jsonl, io.StringIO('[1, 2]\n'))
+        self.assertRaises(ValueError, self.db.import_jsonl, io.StringIO('{}'), batch_size=0)
+        
+    def test_backup(self):
+        source = Database(os.path.join(self.directory, "source.db"))
+        source["people"].insert({'first': 'Henry'})
+        source["places"].insert({'name': 'Ohio'})
+        steps = []
+        source["people"].backup(os.path.join(self.directory, "backup.db"), pages=1, progress=lambda status, remaining, total: steps.append(remaining))
+        self.assertTrue(len(steps) > 1)
+        self.assertEqual(steps[-1], 0)
+        source.done()
+        
+        copy = Database(os.path.join(self.directory, "backup.db"))
+        self.assertEqual(copy.collections(), ["people", "places"])
+        self.assertEqual(copy["places"].get(1)['name'], 'Ohio')
+        copy.done()
+        
+        connection = sqlite3.connect(":memory:")
+        self.db.backup(connection)
+        self.assertEqual(Collection("testcases", connection=connection).count, 25)
@@ -0,0 +1,63 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from sostore import Collection, ConnectionPool
+from sostore.tuning import get_pragmas, PROFILES
+
+class TuningTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "tuning.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def pragma(self, db, name):
+        return db.connection.execute("PRAGMA {0}".format(name)).fetchone()[0]
+
+    def test_profiles(self):
+        db = Collection("testcases", db=self.filename, profile="throughput", pragmas={'cache_size': -1024})
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(db, 'synchronous'), 1)
+        self.assertEqual(self.pragma(db, 'cache_size'), -1024)
+        self.assertEqual(self.pragma(db, 'mmap_size'), PROFILES['throughput']['mmap_size'])
+        self.assertEqual(self.pragma(db, 'temp_store'), 2)
+        self.assertEqual(self.pragma(db, 'busy_timeout'), 5000)
+        db.insert({'first': 'Henry'})
+        db.done()
+
+        db = Collection("testcases", db=self.filename, profile="durable")
+        self.assertEqual(self.pragma(db, 'synchronous'), 2)
+        db.done()
+
+        db = Collection("testcases", db=self.filename)
+        self.assertEqual(self.pragma(db, 'synchronous'), 2)
+        self.assertEqual(self.pragma(db, 'mmap_size'), 0)
+        db.done()
+
+    def test_readonly(self):
+        db = Collection("testcases", db=self.filename)
+        db.insert({'first': 'Henry'})
+        db.done()
+
+        db = Collection("testcases", db=self.filename, profile="readonly")
+        self.assertEqual([d['first'] for d in db.all()], ['Henry'])
+        self.assertRaises(sqlite3.OperationalError, db.insert, {'first': 'Erin'})
+        db.done()
+
+        pool = ConnectionPool(self.filename, profile="readonly")
+        db = Collection("testcases", pool=pool)
+        self.assertEqual(db.count, 1)
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'delete')
+        db.done()
+
+        self.assertRaises(sqlite3.OperationalError, Collection, "testcases", db=os.path.join(self.directory, "missing.db"), profile="readonly")
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Collection, "testcases", profile="fastest")
+        self.assertRaises(ValueError, Collection, "testcases", pragmas={'page_size': 8192})
+        self.assertRaises(ValueError, Collection, "testcases", pragmas={'journal_mode': 'WAL; DROP TABLE testcases'})
+        self.assertEqual(get_pragmas(), {})
+        self.assertEqual(get_pragmas('durable', {'synchronous': 'EXTRA'})['synchronous'], 'EXTRA')
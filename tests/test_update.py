@@ -0,0 +1,75 @@
+import unittest
+from sostore import Collection, ID_KEY
+from sostore.update import apply_update
+
+PEOPLE = [{'first': 'Henry', 'visits': 3, 'siblings': ['Erin', 'Stephen'], 'address': {'city': 'Akron'}},
+          {'first': 'Erin', 'visits': 1.5, 'siblings': ['Henry', 'Stephen', 'Henry'], 'flags': [True, 1, None]},
+          {'first': 'Stephen', 'siblings': [], 'address': {'city': 'Kent', 'zip': 44240}},
+          {'first': 'Margaux', 'visits': 'many', 'address': 'unknown', 'scores': [3, 8.5, 12, {'n': 1}],
+           'groups': [[1], {'y': 2}, 1, ['x', 2], [None], [[1]], 'x']}]
+
+UPDATES = [{'$set': {'last': 'McCallum', 'address.city': 'Canton', 'tags': [1, {'a': None}], 'ok': False}},
+           {'$unset': {'address.zip': '', 'siblings': 1, 'missing': 1}},
+           {'$set': {'visits': 10}, '$push': {'siblings': 'Margaux'}},
+           {'$push': {'scores': {'$each': [1, 'two', [3]]}}},
+           {'$pull': {'siblings': 'Henry', 'flags': True, 'scores': {'$in': [8.5, 12]}}},
+           {'$pull': {'flags': None}},
+           {'$pull': {'groups': {'$in': [1, 'x']}}},
+           {'$pull': {'groups': {'$in': [None]}}},
+           {'$pull': {'scores': {'$in': [{'n': 1}]}}},
+           {'$set': {'address.state': 'OH'}}]
+
+class UpdateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = Collection("testcases", cache_size=10)
+        self.pickled = Collection("pickled", connection=self.db.connection, codec='pickle')
+        for db in (self.db, self.pickled):
+            db.insert_many(dict(person) for person in PEOPLE)
+
+    def tearDown(self):
+        self.db.done()
+
+    def test_update_many(self):
+        for update in UPDATES:
+            expected = [apply_update(d, update) for d in self.db.all()]
+            for db in (self.db, self.pickled):
+                db.all()
+                self.assertEqual(db.update_many({}, update), len(PEOPLE), update)
+                self.assertEqual(db.all(), expected, update)
+                self.assertEqual([db.get(d[ID_KEY]) for d in expected], expected)
+
+    def test_update_fields(self):
+        for db in (self.db, self.pickled):
+            self.assertEqual(db.update_fields(1, {'$inc': {'visits': 2, 'stats.logins': 1}}), 1)
+            self.assertEqual(db.update_fields(2, {'$inc': {'visits': -1}}), 1)
+            self.assertEqual(db.update_fields(100, {'$inc': {'visits': 1}}), 0)
+            self.assertEqual(db.get(1)['visits'], 5)
+            self.assertEqual(db.get(1)['stats'], {'logins': 1})
+            self.assertEqual(db.get(2)['visits'], 0.5)
+
+            # Errors leave every dictionary unchanged
+            self.assertRaises(ValueError, db.update_many, {}, {'$inc': {'visits': 1}})
+            self.assertRaises(ValueError, db.update_fields, 3, {'$push': {'address': 1}})
+            self.assertRaises(ValueError, db.update_fields, 4, {'$pull': {'address': 1}})
+            self.assertEqual([d.get('visits') for d in db.all()], [5, 0.5, None, 'many'])
+
+        self.assertRaises(ValueError, self.db.update_fields, 1, {'$rename': {'first': 'name'}})
+        self.assertRaises(ValueError, self.db.update_fields, 1, {'$set': {ID_KEY: 2}})
+        self.assertRaises(ValueError, self.db.update_fields, 1, {'$set': {'a': 1}, '$unset': {'a.b': 1}})
+        self.assertRaises(ValueError, self.db.update_fields, 1, {'$inc': {'visits': '1'}})
+
+    def test_filtered(self):
+        self.assertEqual(self.db.update_many({'siblings': 'Stephen'}, {'$set': {'sister': 'Erin'}}), 2)
+        self.assertEqual(self.db.update_many({'siblings': {'$size': 0}}, {'$set': {'only': True}}), 1)
+        self.assertEqual([d[ID_KEY] for d in self.db.find({'sister': 'Erin'})], [1, 2])
+        self.assertEqual([d[ID_KEY] for d in self.db.find({'only': True})], [3])
+
+    def test_transaction(self):
+        try:
+            with self.db.transaction():
+                self.db.update_fields(1, {'$set': {'first': 'Jeffrey'}})
+                self.assertEqual(self.db.get(1)['first'], 'Jeffrey')
+                raise KeyError()
+        except KeyError:
+            pass
+        self.assertEqual(self.db.get(1)['first'], 'Henry')